@@ -19,28 +19,48 @@ from sklearn import naive_bayes
 
 import numpy as np
 import pandas as pd
-from preprocess import CameliaBalAGPreprocess, DrawingTools
+from preprocess import CameliaBalAGPreprocess, DrawingTools, EntrepriseIndex, FeatureStore, ScoreLookup
+from preprocess import FTPTools
 from preprocess import Utils
 
 
-def preprocessData(toExportCsv = False):
+def preprocessData(toExportCsv = False, ftp = False, fromFeatureStore = False):
     '''
     function that imports all csv files, and computes the X and Y vectors to perform learning algorithm
+    the remote files are downloaded concurrently before the processing
     -- IN:
     toExportCsv : boolean that settles if a csv file must be computed and stored (boolean) default=False
+    ftp : boolean to choose between local and remote BalAG file (boolean) default: False
+    fromFeatureStore : boolean that settles if the capital, the effectif and the date of creation of the entreprises
+        are read from the feature store instead of the Etab file (see CameliaBalAGPreprocess.refreshFeatureStore) (boolean) default: False
     -- OUT:
     X : vector of features
     Y : vector of observations
     '''
     print "=!= Preprocessing Data =!="
     print ""
+    # downloading all the remote files at once
+    specs = [CameliaBalAGPreprocess.scoreFileSpec]
+    if not fromFeatureStore:
+        specs.append(CameliaBalAGPreprocess.etabFileSpec)
+    if ftp:
+        # only the columns used by the cleaning are read
+        (filename, compression, _, dtype, sep) = CameliaBalAGPreprocess.balAGFileSpec
+        usecols = [column for column in CameliaBalAGPreprocess.cleaningColumns if column!='paidBill']
+        specs.append((filename, compression, usecols, dtype, sep))
+    # the rows of the Scores and Etab files that don't depend on the BalAG file are filtered while they are read,
+    # their loaders then only keep the entreprises of the cleaned BalAG file
+    csvFiles = FTPTools.retrieveMultipleFtplib(specs, chunkFilters=CameliaBalAGPreprocess.getPrefetchChunkFilters())
     # importing the BalAG file
-    csvinput = CameliaBalAGPreprocess.importAndCleanCsv(toPrint=False, ftp=False, toSave=False)
+    csvinput = None
+    if ftp:
+        csvinput = csvFiles.pop(CameliaBalAGPreprocess.balAGFileSpec[0])
+        if csvinput is None:
+            print "error : impossible to import the BalAG dataframe"
+            return None
+    csvinput = CameliaBalAGPreprocess.importAndCleanCsv(toPrint=False, ftp=ftp, toSave=False, csvinput=csvinput, usecols=[])
     print "size :",len(csvinput)
     print ""
-    del csvinput['montantLitige']
-    del csvinput['devise']
-    del csvinput['dateInsert']
     del csvinput['paidBill']
     gc.collect()
     log10abs = lambda x : math.log10(abs(x))
@@ -54,19 +74,35 @@ def preprocessData(toExportCsv = False):
     gc.collect()
     print "... done"
     print ""
+    # the index of the entreprises used to filter and join the other files
+    index = EntrepriseIndex.fromDataFrame(csvinput)
     # importing the Etab file
-    csvEtab = CameliaBalAGPreprocess.getAndPreprocessCsvEtab(csvinput)
+    if fromFeatureStore:
+        csvEtab = _loadEtabFeatures(index)
+        if csvEtab is None:
+            return None
+    else:
+        csvEtab = CameliaBalAGPreprocess.getAndPreprocessCsvEtab(csvinput,
+                                                                 csvFiles.pop(CameliaBalAGPreprocess.etabFileSpec[0]),
+                                                                 index=index)
     csvEtab['age'] = (datetime.datetime.today() - csvEtab.DCREN).astype('timedelta64[Y]')
     del csvEtab['DCREN']
-    csvinput = pd.DataFrame.merge(csvinput, csvEtab, on='entrep_id', how='left')
+    index.addFrame('etab', csvEtab)
+    csvinput = index.join(csvinput, csvEtab, 'etab')
     del csvEtab
     gc.collect()
-    csvScore = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput)
+    csvScore = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput,
+                                                               csvFiles.pop(CameliaBalAGPreprocess.scoreFileSpec[0]),
+                                                               index=index, filtered=True)
     startTime = time.time()
-    csvinput = pd.DataFrame.merge(csvinput, csvScore, on=['entrep_id','year'], how='left')
-    csvinput.dropna(axis=0,how='any',inplace=True)
+    # the scores partitioned by year, looked up by binary searches instead of a hash join
+    lookup = ScoreLookup.fromDataFrame(csvScore)
     del csvScore
     gc.collect()
+    csvinput = lookup.join(csvinput)
+    csvinput.dropna(axis=0,how='any',inplace=True)
+    del lookup
+    gc.collect()
     Utils.printTime(startTime)
     
     if toExportCsv:
@@ -81,6 +117,27 @@ def preprocessData(toExportCsv = False):
     
     return csvinput
        
+def _loadEtabFeatures(index):
+    '''
+    function that reads the capital, the effectif and the date of creation of the entreprises of an index
+    from the feature store, as getAndPreprocessCsvEtab: the maximal capital and effectif and the minimal date
+    of their etablissements, for the entreprises having at least one etablissement
+    -- IN:
+    index : the index of the entreprises (EntrepriseIndex.EntrepriseIndex)
+    -- OUT:
+    csvEtab : one row per entreprise (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    features = FeatureStore.loadFeatures(columns=['nbEtab','capitalMax','dcrenMin','effectifMax'], entrepIds=index.ids)
+    if features is None:
+        return None
+    features = features[features['nbEtab'].values>0]
+    return pd.DataFrame({'entrep_id':features['entrep_id'].values,
+                         'capital':features['capitalMax'].values,
+                         'DCREN':features['dcrenMin'].values,
+                         'EFF_ENT':features['effectifMax'].values},
+                        columns=['entrep_id','capital','DCREN','EFF_ENT'])
+
 def importPreprocessData(filename = "preprocessedDataBalAGSampleclean.csv"):
     '''
     function that imports the file preprocessedDataBalAG or its clean version
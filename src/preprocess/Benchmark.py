@@ -0,0 +1,344 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Script measuring the performances of the transfers of FTPTools
+against a local stand-in server (see FTPStandIn) serving synthetic files (see SyntheticData),
+so that the measures don't depend on the remote server and the network.
+
+For each compression mode (None, "gz", "bz2") it reports:
+- retrieveFtplib : downloading then parsing the whole file
+- streamFtplib : parsing the file while downloading it
+- storeFtplib : uploading the dataframe
+with the duration, the throughput in MB of transferred file per second and in rows per second,
+the time to the first row available and the peak of memory used during the transfer.
+
+It also reports the memory used by the synthetic BalAG, Etab and Scores dataframes
+before and after their conversion into the types of the module Schema,
+and the speedup of the cleaning of the BalAG rows by several processes, splitting
+either the loaded dataframe or the csv file, against the number of cores,
+the merge of the establishments of the synthetic Etab file into one row per entreprise
+and the join of the BalAG rows with the scores of their entreprise and their year.
+
+usage : python Benchmark.py [nbRows] [certfile]
+    nbRows : number of rows of the synthetic BalAG file (default: 200000)
+    certfile : a pem file with a certificate and its key, to measure the TLS transfers (default: None)
+
+=== functions :
+measure(function, args) : calls a function and measures its duration and its peak of memory
+benchmarkRetrieve(filename, compression, stream, nbRows, fileSize) : measures the retrieval of a file
+benchmarkStore(dataframe, compression) : measures the upload of a dataframe
+runTransferBenchmark(nbRows, certfile) : runs and prints all the measures
+runMemoryReport(nbRows) : prints the memory used by the dataframes with and without their schemas
+runCleaningBenchmark(nbRows, processCounts) : prints the speedup of the cleaning by several processes
+runEtabBenchmark(nbEntreprises) : prints the duration of the merge of the establishments by entreprise
+runScoreJoinBenchmark(nbRows) : prints the duration of the join of the BalAG rows with the scores
+'''
+
+import multiprocessing
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import CameliaBalAGPreprocess
+import CleaningRules
+import FTPStandIn
+import FTPTools
+import Schema
+import ScoreLookup
+import SyntheticData
+import Utils
+
+# chunk size of the streaming measures, small enough to measure the time to the first row
+benchmarkChunkSize = 20000
+# interval in seconds between two measures of the memory
+benchmarkMemoryInterval = 0.01
+
+
+def measure(function, *args, **kwargs):
+    '''
+    function that calls a function and measures its duration and the peak of memory
+    used by the process during the call, compared to the memory used before the call
+    -- IN
+    function : the function to call (function)
+    args, kwargs : the arguments of the function
+    -- OUT
+    result : the result of the function
+    duration : the duration of the call in seconds (float)
+    peakMemory : the maximal increase of the memory used in MB (float)
+    '''
+    sampler = _MemorySampler()
+    sampler.start()
+    startTime = time.time()
+    try:
+        result = function(*args, **kwargs)
+    finally:
+        duration = time.time() - startTime
+        peakMemory = sampler.stop()
+    return (result, duration, peakMemory)
+
+def benchmarkRetrieve(filename, compression, stream, nbRows, fileSize):
+    '''
+    function that measures the retrieval of a remote file
+    -- IN
+    filename : the remote filename (string)
+    compression : string that specifies the encoding of the file (string in [None,"gz","bz2"])
+    stream : boolean that settles if the file is parsed while being downloaded (boolean)
+    nbRows : number of rows of the file (int)
+    fileSize : size of the remote file in bytes (int)
+    -- OUT
+    results : a dictionary of the measures ({string:float})
+    '''
+    firstRow = [None]
+    startTime = [None]
+    def retrieve():
+        startTime[0] = time.time()
+        if not stream:
+            db = FTPTools.retrieveFtplib(filename, compression=compression, useCache=False)
+            firstRow[0] = time.time()
+            return db
+        chunks = []
+        for chunk in FTPTools.streamFtplib(filename, compression=compression, chunksize=benchmarkChunkSize):
+            if firstRow[0] is None:
+                firstRow[0] = time.time()
+            chunks.append(chunk)
+        return pd.concat(chunks, ignore_index=True)
+    (db, duration, peakMemory) = measure(retrieve)
+    if db is None or len(db)!=nbRows:
+        print "error : the file",filename,"was not properly retrieved"
+    return {"duration":duration,
+            "MB/s":fileSize/2.0**20/duration,
+            "rows/s":nbRows/duration,
+            "first row":firstRow[0]-startTime[0] if firstRow[0] is not None else float("nan"),
+            "peak MB":peakMemory}
+
+def benchmarkStore(dataframe, compression):
+    '''
+    function that measures the upload of a dataframe
+    -- IN
+    dataframe : the dataframe to upload (pandas.Dataframe)
+    compression : string that specifies the encoding of the file (string in [None,"gz","bz2"])
+    -- OUT
+    results : a dictionary of the measures ({string:float})
+    '''
+    filename = "benchmarkUpload.csv"+("" if compression is None else "."+compression)
+    (flag, duration, peakMemory) = measure(FTPTools.storeFtplib, dataframe, filename, compression)
+    if not flag:
+        print "error : the dataframe was not properly uploaded"
+    return {"duration":duration,
+            "rows/s":len(dataframe)/duration,
+            "peak MB":peakMemory}
+
+def runTransferBenchmark(nbRows = 200000, certfile = None):
+    '''
+    function that runs the measures of the transfers for every compression mode and prints them
+    -- IN
+    nbRows : number of rows of the synthetic BalAG file (int) default: 200000
+    certfile : a pem file with a certificate and its key, if None the transfers are not secured (string) default: None
+    -- OUT
+    results : a list of (operation, compression, measures) ([(string, string, {string:float})])
+    '''
+    rootDirectory = tempfile.mkdtemp()
+    server = None
+    results = []
+    try:
+        print "generating",nbRows,"rows of synthetic BalAG",
+        dataframe = SyntheticData.generateBalAG(nbRows)
+        files = {}
+        for compression in [None, "gz", "bz2"]:
+            filename = "cameliaBalAG.csv"+("" if compression is None else "."+compression)
+            SyntheticData.writeCsv(dataframe, os.path.join(rootDirectory, filename), compression)
+            files[compression] = (filename, os.path.getsize(os.path.join(rootDirectory, filename)))
+        print "... done"
+        server = FTPStandIn.startStandIn(rootDirectory, certfile=certfile)
+        if server is None:
+            return None
+        FTPStandIn.useStandIn(server)
+        # opening a first connection, so that the login is not measured
+        FTPTools.releaseFtpConnection(FTPTools.getFtpConnection())
+        for compression in [None, "gz", "bz2"]:
+            (filename, fileSize) = files[compression]
+            results.append(("retrieveFtplib", compression, benchmarkRetrieve(filename, compression, False, nbRows, fileSize)))
+            results.append(("streamFtplib", compression, benchmarkRetrieve(filename, compression, True, nbRows, fileSize)))
+            results.append(("storeFtplib", compression, benchmarkStore(dataframe, compression)))
+    finally:
+        if server is not None:
+            FTPStandIn.stopStandIn(server)
+        FTPTools.setAccount()
+        shutil.rmtree(rootDirectory, ignore_errors=True)
+    print ""
+    print "transfers of",nbRows,"rows",("with TLS" if certfile is not None else "without TLS")
+    columns = ["duration","MB/s","rows/s","first row","peak MB"]
+    print "%-16s%-8s" % ("operation","comp."),"".join(["%12s" % column for column in columns])
+    for (operation, compression, measures) in results:
+        print "%-16s%-8s" % (operation, str(compression)),
+        print "".join(["%12.2f" % measures[column] if column in measures else "%12s" % "-" for column in columns])
+    return results
+
+def runMemoryReport(nbRows = 200000):
+    '''
+    function that prints the memory used by the synthetic BalAG, Etab and Scores dataframes
+    as read without types, then converted into the types of their schemas
+    -- IN
+    nbRows : number of rows of the synthetic BalAG file (int) default: 200000
+    -- OUT
+    reports : the reports of Schema.memoryReport by file ({string:pandas.Dataframe})
+    '''
+    csvinput = SyntheticData.generateBalAG(nbRows)
+    entrepIds = csvinput["entrep_id"].unique()
+    dataframes = [("BalAG", csvinput, Schema.balAGSchema),
+                  ("Etab", SyntheticData.generateEtab(entrepIds), Schema.etabSchema),
+                  ("Scores", SyntheticData.generateScores(entrepIds), Schema.scoreSchema)]
+    reports = {}
+    for (name, dataframe, schema) in dataframes:
+        reports[name] = Schema.memoryReport(dataframe, schema, name)
+    return reports
+
+def runCleaningBenchmark(nbRows = 200000, processCounts = (1, 2, 4, 8)):
+    '''
+    function that measures the cleaning of the synthetic BalAG rows by several processes
+    and prints the duration and the speedup against the first number of processes, for the loaded dataframe
+    split into partitions (see CameliaBalAGPreprocess.cleaningBalAG) and for the csv file
+    split into parts parsed in parallel (see CameliaBalAGPreprocess.importAndCleanCsvFile)
+    -- IN
+    nbRows : number of rows of the synthetic BalAG file (int) default: 200000
+    processCounts : the numbers of processes to measure (int[]) default: (1, 2, 4, 8)
+    -- OUT
+    results : a list of (mode, number of processes, duration) ([(string, int, float)])
+    '''
+    rootDirectory = tempfile.mkdtemp()
+    results = []
+    try:
+        dataframe = SyntheticData.generateBalAG(nbRows, errorRate=0.1)
+        filename = os.path.join(rootDirectory, "cameliaBalAG.csv")
+        SyntheticData.writeCsv(dataframe, filename, None)
+        dataframe = Schema.applySchema(CameliaBalAGPreprocess.addPaidBillColumn(dataframe), Schema.balAGSchema)
+        rules = CleaningRules.fromConstants()
+        rules.enable('bclnIdMinimalBillsNumber', True)
+        for nbProcesses in processCounts:
+            (_, duration, _) = measure(CameliaBalAGPreprocess.cleaningBalAG, dataframe, rules=rules, nbProcesses=nbProcesses)
+            results.append(("dataframe", nbProcesses, duration))
+            (_, duration, _) = measure(CameliaBalAGPreprocess.importAndCleanCsvFile, filename, rules=rules, nbProcesses=nbProcesses)
+            results.append(("file", nbProcesses, duration))
+    finally:
+        shutil.rmtree(rootDirectory, ignore_errors=True)
+    print ""
+    print "cleaning of",nbRows,"rows with",multiprocessing.cpu_count(),"cores"
+    print "%-12s%12s%12s%12s" % ("mode","processes","duration","speedup")
+    for mode in ["dataframe","file"]:
+        durations = [(nbProcesses, duration) for (name, nbProcesses, duration) in results if name==mode]
+        reference = durations[0][1]
+        for (nbProcesses, duration) in durations:
+            print "%-12s%12d%12.2f%12.2f" % (mode, nbProcesses, duration, reference/duration)
+    return results
+
+def runEtabBenchmark(nbEntreprises = 20000):
+    '''
+    function that measures the merge of the establishments of a synthetic Etab file into one row
+    per entreprise (see CameliaBalAGPreprocess.aggregateByEntreprise) by groupby and by sort,
+    against the transformation of each group by python functions, and checks that they give the same rows
+    -- IN
+    nbEntreprises : number of entreprises of the synthetic Etab file (int) default: 20000
+    -- OUT
+    results : a list of (method, duration) ([(string, float)])
+    '''
+    csvEtab = Schema.applySchema(SyntheticData.generateEtab(np.arange(1, nbEntreprises+1)), Schema.etabSchema)
+    csvEtab.dropna(axis=0, inplace=True)
+    # the establishments of an entreprise are not consecutive in the real file
+    csvEtab = csvEtab.take(np.random.RandomState(0).permutation(len(csvEtab)))
+    aggregations = {'DCREN':'min', 'capital':'max', 'EFF_ENT':'max'}
+    (expected, duration, _) = measure(_transformByGroup, csvEtab.copy())
+    results = [("transform", duration)]
+    for (method, sortBased) in [("groupby", False), ("sort", True)]:
+        (merged, duration, _) = measure(CameliaBalAGPreprocess.aggregateByEntreprise, csvEtab, aggregations, sortBased)
+        results.append((method, duration))
+        if not merged.equals(expected):
+            print "error : the merge by",method,"doesn't give the same rows"
+    print ""
+    print "merge of",len(csvEtab),"establishments of",nbEntreprises,"entreprises"
+    print "%-12s%12s%12s" % ("method","duration","speedup")
+    for (method, duration) in results:
+        print "%-12s%12.3f%12.1f" % (method, duration, results[0][1]/duration)
+    return results
+
+def _transformByGroup(csvEtab):
+    ''' merges the establishments by entreprise with python functions called on each group, as it was done before '''
+    grouped = csvEtab.groupby('entrep_id')
+    fmin = lambda x: pd.Series([x.min()]*len(x))
+    fmax = lambda x: pd.Series([x.max()]*len(x))
+    csvEtab['DCREN'] = grouped['DCREN'].transform(fmin)
+    csvEtab['capital'] = grouped['capital'].transform(fmax)
+    csvEtab['EFF_ENT'] = grouped['EFF_ENT'].transform(fmax)
+    return grouped.head(1)
+
+def runScoreJoinBenchmark(nbRows = 200000):
+    '''
+    function that measures the join of the rows of a synthetic BalAG file with the scores of their entreprise
+    and their year, by pandas.merge and by the lookup of the scores partitioned by year (see ScoreLookup),
+    and checks that they give the same rows
+    -- IN
+    nbRows : number of rows of the synthetic BalAG file (int) default: 200000
+    -- OUT
+    results : a list of (method, duration) ([(string, float)])
+    '''
+    csvinput = Schema.applySchema(SyntheticData.generateBalAG(nbRows), Schema.balAGSchema)
+    csvinput = pd.DataFrame({'entrep_id':csvinput['entrep_id'].values,
+                             'year':pd.DatetimeIndex(csvinput['datePiece']).year.values}, columns=['entrep_id','year'])
+    csvScore = Schema.applySchema(SyntheticData.generateScores(np.unique(csvinput['entrep_id'].values)), Schema.scoreSchema)
+    csvScore['year'] = pd.DatetimeIndex(csvScore['dateBilan']).year
+    csvScore = csvScore.dropna()[['entrep_id']+ScoreLookup.scoreColumns+['year']]
+    (expected, duration, _) = measure(pd.merge, csvinput, csvScore, on=['entrep_id','year'], how='left')
+    results = [("merge", duration)]
+    for (method, function) in [("lookup", _joinByLookup)]:
+        (joined, duration, _) = measure(function, csvinput, csvScore)
+        results.append((method, duration))
+        if not joined.equals(expected):
+            print "error : the join by",method,"doesn't give the same rows"
+    print ""
+    print "join of",len(csvinput),"rows with",len(csvScore),"scores"
+    print "%-12s%12s%12s" % ("method","duration","speedup")
+    for (method, duration) in results:
+        print "%-12s%12.3f%12.1f" % (method, duration, results[0][1]/duration)
+    return results
+
+def _joinByLookup(csvinput, csvScore):
+    ''' joins the rows with the scores by the lookup of the scores partitioned by year '''
+    return ScoreLookup.fromDataFrame(csvScore).join(csvinput)
+
+class _MemorySampler(threading.Thread):
+    ''' thread measuring the memory used by the process until it is stopped '''
+    def __init__(self):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.baseline = Utils.memory_usage_psutil()
+        self.peak = self.baseline
+        self.stopped = threading.Event()
+
+    def run(self):
+        while not self.stopped.is_set():
+            self.peak = max(self.peak, Utils.memory_usage_psutil())
+            self.stopped.wait(benchmarkMemoryInterval)
+
+    def stop(self):
+        ''' stops the measures and returns the peak increase of memory in MB '''
+        self.stopped.set()
+        self.join()
+        self.peak = max(self.peak, Utils.memory_usage_psutil())
+        return self.peak-self.baseline
+
+
+if __name__ == "__main__":
+    runTransferBenchmark(nbRows = int(sys.argv[1]) if len(sys.argv)>1 else 200000,
+                         certfile = sys.argv[2] if len(sys.argv)>2 else None)
+    runMemoryReport(nbRows = int(sys.argv[1]) if len(sys.argv)>1 else 200000)
+    runCleaningBenchmark(nbRows = int(sys.argv[1]) if len(sys.argv)>1 else 200000)
+    runEtabBenchmark()
+    runScoreJoinBenchmark(nbRows = int(sys.argv[1]) if len(sys.argv)>1 else 200000)
@@ -14,7 +14,9 @@ of this module. These tests include the functions from the modules:
 - Utils : for other minor functions
 
 === Part I : Import of the data
-        Imports and functions that get files and extract dataframe out of csv files
+        Imports and functions that get files and extract dataframe out of csv files,
+        that save and load the snapshot of the cleaned dataframe
+        and that refresh the features by entreprise of the feature store
 
 === Part II : Cleaning Functions
         Functions that clean the BalAG file according to different columns
@@ -38,30 +40,56 @@ from preprocess import Constants
 
 ''' I - Import of the data  '''
 
-import datetime
+import io
 import math
+import multiprocessing
 import os
+import shutil
 import time
 
+import CleaningAudit
+import CleaningRules
+import ColumnStore
 import Constants
 import DrawingTools
+import EntrepriseIndex
 import FTPTools
+import FeatureStore
+import LazyFrame
+import Schema
 import Utils
 import matplotlib.patches as mpatches
 import matplotlib.pyplot as plt
 import numpy as np
 import pandas as pd
-from Constants import bclnIdIntFormat, bclnIdMinimalBillsNumber, \
-    clnIdMinimalBillsNumber, bclnIdMinimalIdValue, clnIdMinimalIdValue, \
-    bclnIdMaximalIdValue, clnIdMaximalIdValue, bclnDatePieceFormat, \
-    bclnDateEcheanceFormat, bclnDateDernierPaiementFormat, bclnDateInconsistent, \
-    bclnDateMonthDiff, clnDateMonthDiff, bclnDateMinimalDate, clnDateMinimalDate, \
-    bclnDateMaximalDate, clnDateMaximalDate, bclnMontantIntFormat, \
-    bclnMontantNonNegativeValue, bclnMontantNonZeroValue, bclnMontMinimalValue, \
-    clnMontMinimalValue, bclnMontMaximalValue, clnMontMaximalValue, \
-    bclnMontantLitigeNonZero
-
-def importCsv(filename = 'cameliaBalAGrandom.csv',sep='\t',usecols = None,dtype=None,addPaidBill = False):
+
+# specifications (filename, compression, usecols, dtype, sep) of the remote files
+# used by the import functions, see FTPTools.retrieveMultipleFtplib
+# the types of the columns are given by the schemas of the module Schema
+balAGFileSpec = ('cameliaBalAG.csv.gz', "gz", None, Schema.getDtype(Schema.balAGSchema), "\t")
+etabFileSpec = ("ProcessedData/cameliaEtabKevin.csv.gz", "gz",
+                ['entrep_id','capital','DCREN','EFF_ENT'],
+                Schema.getDtype(Schema.etabSchema, Schema.etabMissingColumns),
+                ";")
+scoreFileSpec = ("cameliaScores.csv.bz2", "bz2",
+                 ['entrep_id','dateBilan','sourceModif','scoreSolv','scoreZ','scoreCH','scoreAltman'],
+                 Schema.getDtype(Schema.scoreSchema),
+                 "\t")
+liensEntitesFileSpec = ("cameliaLiensEntites.csv.bz2", "bz2", None, Schema.getDtype(Schema.liensEntitesSchema), "\t")
+# filters of the rows of the Scores file kept for the entreprises of the BalAG file,
+# applied on each chunk of the file while it is read (see getScoreChunkFilter):
+# on the raw values, before the conversion of the columns of the kept rows
+scoreRawFilters = [lambda chunk: (chunk['sourceModif']=="bilans1").values]
+# then on the converted values
+scoreFilters = [lambda chunk: (chunk['year']>=2010).values]
+# columns of the BalAG file read by the cleaning functions
+cleaningColumns = ['entrep_id','datePiece','dateEcheance','dateDernierPaiement','montantPieceEur','paidBill']
+# groups of rules of the cleaning functions and the columns they need, in the order they are applied
+cleaningGroups = [('dates', ['datePiece','dateEcheance','dateDernierPaiement']),
+                  ('montant', ['montantPieceEur']),
+                  ('entrep_id', ['entrep_id'])]
+
+def importCsv(filename = 'cameliaBalAGrandom.csv',sep='\t',usecols = None,dtype=None,addPaidBill = False,lazy = False):
     '''
     function that imports the content of the csv file. 
     The csv file must be stored stored locally.
@@ -71,10 +99,17 @@ def importCsv(filename = 'cameliaBalAGrandom.csv',sep='\t',usecols = None,dtype=
     usecols : array containing the names of the column we want to import, 
         if None import all (string[] or None) default : None
     addPaidBill : boolean that settles if we add a column PaidBill (boolean) default : False
+    lazy : boolean that settles if the columns are only parsed when they are accessed,
+        usecols is then ignored (boolean) default : False
     -- OUT
-    csvinput: the dataframe out of the csv file (pandas.Dataframe)
+    csvinput: the dataframe out of the csv file (pandas.Dataframe or LazyFrame.LazyFrame if lazy)
     returns None if an error occurs
     '''
+    if lazy:
+        csvinput = LazyFrame.fromCsv(os.path.join("..","..",filename), sep=sep, dtype=dtype)
+        if csvinput is not None and addPaidBill:
+            addPaidBillColumn(csvinput)
+        return csvinput
     os.chdir(os.path.join("..",".."))
     # reading the local file
     try: 
@@ -84,17 +119,11 @@ def importCsv(filename = 'cameliaBalAGrandom.csv',sep='\t',usecols = None,dtype=
         return None
     # adding a column to the dataframe with a boolean telling if the bill was paid
     if(addPaidBill):
-        if(not 'dateDernierPaiement' in csvinput.columns.values):
-            print "problem : impossible extraction of paidBill column"
-        else:
-            paidBill = []
-            for row in csvinput['dateDernierPaiement'] :
-                paidBill.append(not row == "0000-00-00")            
-            csvinput['paidBill'] = pd.Series(paidBill, index=csvinput.index)
+        addPaidBillColumn(csvinput)
     os.chdir(os.path.join("src","preprocess"))
     return csvinput
 
-def importFTPCsv(filename = 'cameliaBalAG.csv.gz',sep='\t',usecols = None,dtype = None,addPaidBill = False):
+def importFTPCsv(filename = 'cameliaBalAG.csv.gz',sep='\t',usecols = None,dtype = None,addPaidBill = False,lazy = False):
     '''
     function that imports the content of the csv file into the global
     variable csvinput. the file is downloaded from the remote ftp via
@@ -105,26 +134,106 @@ def importFTPCsv(filename = 'cameliaBalAG.csv.gz',sep='\t',usecols = None,dtype
     usecols : array containing the names of the column we want to import, 
         if None import all (string[] or None) default : None
     addPaidBill : boolean that settles if we add a column PaidBill (boolean) default : False
+    lazy : boolean that settles if the columns are only read from the cache when they are accessed,
+        usecols is then ignored (boolean) default : False
     -- OUT
-    returns the dataframe out of the csv file
+    returns the dataframe out of the csv file (pandas.Dataframe or LazyFrame.LazyFrame if lazy)
     '''
     # importing the remote file
-    csvinput = FTPTools.retrieveFtplib(filename, usecols=usecols, dtype=dtype, compression="gz")
+    if lazy:
+        csvinput = FTPTools.retrieveLazyFtplib(filename, dtype=dtype, compression="gz", sep=sep)
+    else:
+        csvinput = FTPTools.retrieveFtplib(filename, usecols=usecols, dtype=dtype, compression="gz")
     if csvinput is None:
         print "error : impossible to import the dataframe"
         return None
     # adding a column to the dataframe with a boolean telling if the bill was paid
     if(addPaidBill):
-        if(not 'dateDernierPaiement' in csvinput.columns):
-            print "problem : impossible extraction of paidBill column"
-        else:
-            paidBill = []
-            for row in csvinput['dateDernierPaiement'] :
-                paidBill.append(not row == "0000-00-00")            
-            csvinput['paidBill'] = pd.Series(paidBill, index=csvinput.index)
+        addPaidBillColumn(csvinput)
+    return csvinput
+
+def addPaidBillColumn(csvinput):
+    '''
+    function that adds to the BalAG dataframe a column 'paidBill'
+    with a boolean telling if the bill was paid, stored as a numpy bool column
+    -- IN
+    csvinput : the BalAG dataframe with at least the column 'dateDernierPaiement' (pandas.Dataframe or LazyFrame.LazyFrame)
+    -- OUT
+    csvinput : the same dataframe with the column 'paidBill' (pandas.Dataframe or LazyFrame.LazyFrame)
+    '''
+    if(not 'dateDernierPaiement' in csvinput.columns):
+        print "problem : impossible extraction of paidBill column"
+    elif isinstance(csvinput, LazyFrame.LazyFrame):
+        # the column will be computed if it is accessed
+        csvinput.defineColumn('paidBill', lambda frame: addPaidBillColumn(frame[['dateDernierPaiement']])['paidBill'])
+    elif np.issubdtype(csvinput['dateDernierPaiement'].dtype, np.datetime64):
+        # the dates are already parsed, "0000-00-00" was turned into NaT
+        csvinput['paidBill'] = csvinput['dateDernierPaiement'].notnull().values
+    else:
+        csvinput['paidBill'] = (csvinput['dateDernierPaiement']!="0000-00-00").values
     return csvinput
 
-def getAndPreprocessCsvEtab(csvinput=None):
+def saveSnapshot(csvinput, directory = None):
+    '''
+    function that writes the cleaned BalAG dataframe in a typed binary columnar snapshot (see ColumnStore):
+    the dates are stored as datetime64, the types of the other columns are given by Constants.snapshotDtype
+    and the remaining text columns are stored as categories.
+    Reading the snapshot (see loadSnapshot) needs neither csv parsing nor date conversion.
+    -- IN
+    csvinput : the cleaned BalAG dataframe, without missing values (pandas.Dataframe)
+    directory : the directory of the snapshot (string) default: Constants.snapshotDirectory
+    -- OUT
+    flag : boolean that settles if everything was successful (True: no problem, False: an error occured)
+    '''
+    if csvinput is None:
+        print "error : impossible to save an empty dataframe"
+        return False
+    if directory is None:
+        directory = Constants.snapshotDirectory
+    snapshot = _toSnapshotTypes(csvinput)
+    if snapshot is None:
+        return False
+    return ColumnStore.saveColumns(snapshot, directory)
+
+def loadSnapshot(directory = None, usecols = None, mmap = True):
+    '''
+    function that reads the cleaned BalAG dataframe from a snapshot written by saveSnapshot
+    -- IN
+    directory : the directory of the snapshot (string) default: Constants.snapshotDirectory
+    usecols : array containing the names of the column we want to import,
+        if None import all (string[] or None) default : None
+    mmap : boolean that settles if the columns are memory-mapped instead of read (boolean) default: True
+    -- OUT
+    csvinput : the cleaned dataframe (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    if directory is None:
+        directory = Constants.snapshotDirectory
+    if not ColumnStore.isStore(directory):
+        print "error : non-existing snapshot :",directory
+        return None
+    return ColumnStore.loadColumns(directory, usecols=usecols, mmap=mmap)
+
+def _toSnapshotTypes(csvinput):
+    ''' converts the columns of the BalAG dataframe into the types of the snapshot, returns None if an error occurs '''
+    snapshot = pd.DataFrame(index=csvinput.index)
+    try:
+        for column in csvinput.columns:
+            serie = csvinput[column]
+            if column in Constants.snapshotDateColumns:
+                if serie.dtype!="datetime64[ns]":
+                    serie = pd.Series(Utils.parseIsoDatesCached(serie), index=serie.index)
+            elif column in Constants.snapshotDtype:
+                serie = serie.astype(Constants.snapshotDtype[column])
+            elif serie.dtype==object:
+                serie = serie.astype("category")
+            snapshot[column] = serie
+    except (ValueError, TypeError) as e:
+        print "error : impossible to convert the dataframe for the snapshot :",e
+        return None
+    return snapshot
+
+def getAndPreprocessCsvEtab(csvinput=None, csvEtab=None, sortBased=False, index=None, predicates=None):
     '''
     function that imports the Etab file from the remote ftp server
     
@@ -143,7 +252,12 @@ def getAndPreprocessCsvEtab(csvinput=None):
     a precise and denoised capital and effectif to a precise timestamp was not that easy according to the data.
     
     -- IN:
-    csvEtab: the pandas dataframe containing etab file and at least column entrep_id (pandas.Dataframe)
+    csvinput: the pandas dataframe containing BalAG file and at least column entrep_id (pandas.Dataframe) default: None
+    csvEtab: the raw etab file if it was already downloaded, see etabFileSpec (pandas.Dataframe) default: None
+    sortBased: boolean that settles if the rows are merged by sorting them by entrep_id
+        instead of hashing them by groupby, see aggregateByEntreprise (boolean) default: False
+    index: the index of the entreprises of csvinput, built from csvinput if None (EntrepriseIndex.EntrepriseIndex) default: None
+    predicates: other filters of the rows, see getEtabChunkFilter (function[]) default: None
     -- OUT:
     csvEtab: the cleaned pandas dataFrame containing only one row per concerned entreprises (pandas.Dataframe)
     returns None if an error occurs.
@@ -152,55 +266,35 @@ def getAndPreprocessCsvEtab(csvinput=None):
     print "Extracting the csvEtab dataframe"
     startTime = time.time()
     
-    # setting parameters for the import of the dataframe
-    usecols = ['entrep_id','capital','DCREN','EFF_ENT']
-    dtype = {}
-    dtype['entrep_id'] = "uint32"
-    dtype['capital']   = "uint32"
-    dtype['EFF_ENT']   = "uint32"
-    dtype['DCREN']     = "string"
+    # if csvinput was given, we clean the file according to the entrep_id in the csvinput Dataframe
+    if index is None and csvinput is not None:
+        index = EntrepriseIndex.fromDataFrame(csvinput)
+    # the wrong dates and the entreprises that are not in csvinput are removed from each chunk while it is read
+    counts = [0]
+    chunkFilter = getEtabChunkFilter(index, predicates, counts=counts)
     # importing the file
-    csvEtab = FTPTools.retrieveFtplib("ProcessedData/cameliaEtabKevin.csv.gz", compression="gz",
-                                      usecols=usecols,dtype=dtype,toPrint=False,sep=";")
+    if csvEtab is None:
+        (filename, compression, usecols, dtype, sep) = etabFileSpec
+        csvEtab = FTPTools.retrieveFtplib(filename, compression=compression,
+                                          usecols=usecols,dtype=dtype,toPrint=False,sep=sep,chunkFilter=chunkFilter)
+    else:
+        csvEtab = _filterByChunks(csvEtab, chunkFilter)
+    if csvEtab is None:
+        return None
     print "   processing file",
-    totalIni = len(csvEtab)
-    # we remove wrong date input and convert the others
-
-    csvEtab.loc[~csvEtab['DCREN'].str.contains(r"^[12][90][0-9][0-9]-[01][0-9]-[0-3][0-9]$",na=True)] = None
-    csvEtab['DCREN'] = pd.to_datetime(csvEtab['DCREN'], format='%Y-%m-%d', errors='coerce')   
-    csvEtab.dropna(axis=0, inplace=True)
-    
+    totalIni = max(counts[0], 1)
     
     # if no parameter csvinput was given, we just return the whole Dataframe
-    if csvinput is None:
+    if index is None:
         # counting errors and displaying results
         totalFin = len(csvEtab)
         print "... done"
         print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/totalIni),"%\n" 
         Utils.printTime(startTime) 
         return csvEtab
-    
-    # otherwise, we clean the file according to the entrep_id in the csvinput Dataframe
-    column = csvinput['entrep_id']
-    # we remove lines of cvsEtab that are not concerning entreprises from csvinput
-    csvEtab.loc[~csvEtab['entrep_id'].isin(column),['entrep_id']] = None    
-
-#     # checking the validity of the result dataframe
-#     if csvEtab is None or not (['entrep_id','capital','DCREN','EFF_ENT'] in csvEtab.columns):
-#         print "error : invalid csvEtab file"
-#         return None
-    
-    # grouping the csvEtab file according to 'entrep_id'
-    grouped = csvEtab.groupby('entrep_id')
-    # defining min() and max() lambda functions
-    fmin = lambda x: pd.Series([x.min()]*len(x))
-    fmax = lambda x: pd.Series([x.max()]*len(x))
-    # merging the rows
-    csvEtab['DCREN'] = grouped['DCREN'].transform(fmin)
-    csvEtab['capital'] = grouped['capital'].transform(fmax)
-    csvEtab['EFF_ENT'] = grouped['EFF_ENT'].transform(fmax)
-    # keeping only one row per entreprise
-    csvEtab = grouped.head(1)
+
+    # merging the rows and keeping only one row per entreprise
+    csvEtab = aggregateByEntreprise(csvEtab, {'DCREN':'min', 'capital':'max', 'EFF_ENT':'max'}, sortBased)
     
     # counting errors and displaying results
     totalFin = len(csvEtab)
@@ -210,7 +304,68 @@ def getAndPreprocessCsvEtab(csvinput=None):
     
     return csvEtab
       
-def getAndPreprocessCsvScore(csvinput = None):  
+def getEtabChunkFilter(index = None, predicates = None, rawPredicates = None, counts = None):
+    '''
+    function that creates the filter of the chunks of the Etab file applied while it is read:
+    the rows of the entreprises out of the index and the rows rejected by a raw predicate are removed,
+    then the columns of the kept rows are converted (see Schema.etabSchema),
+    the rows with a wrong or a missing value are removed and the rows rejected by a predicate.
+    A chunk already filtered is left as it is
+    -- IN:
+    index: the index of the entreprises kept, if None all of them (EntrepriseIndex.EntrepriseIndex) default: None
+    predicates: filters of the converted chunk, functions returning the mask of the kept rows
+        (function(pandas.Dataframe) -> numpy.ndarray of bool []) default: None
+    rawPredicates: filters of the chunk as it is read, before the conversion of its columns (function[]) default: None
+    counts: list whose first element is increased by the number of rows of each chunk (int[]) default: None
+    -- OUT:
+    chunkFilter: the filter of the chunks, see FTPTools.retrieveFtplib (function(pandas.Dataframe) -> pandas.Dataframe)
+    '''
+    rawFilters = _getEntrepriseFilters(index)+list(rawPredicates or [])
+    return _createChunkFilter(rawFilters, Schema.etabSchema, None, list(predicates or []), counts)
+
+def aggregateByEntreprise(dataframe, aggregations, sortBased = False):
+    '''
+    function that keeps one row per entreprise, its first one, in which some columns are replaced
+    by their minimum or their maximum over all the rows of the entreprise.
+    The reduction is native: either a groupby aggregation hashing the ids,
+    or a stable sort of the rows by entrep_id followed by a reduction of each run of equal ids,
+    faster when the rows are already grouped by entreprise.
+    Both give the rows in the order of their first row, with the index of their first row.
+    -- IN
+    dataframe : dataframe with a column entrep_id without missing values (pandas.Dataframe)
+    aggregations : the function applied to each column ({string:string in ["min","max"]})
+    sortBased : boolean that settles if the rows are sorted instead of grouped (boolean) default: False
+    -- OUT
+    dataframe : the dataframe with one row per entreprise, the types of the columns are kept (pandas.Dataframe)
+    '''
+    if len(dataframe)==0:
+        return dataframe.copy()
+    ids = dataframe['entrep_id'].values
+    reduced = {}
+    if sortBased:
+        order = np.argsort(ids, kind='mergesort')
+        sortedIds = ids[order]
+        starts = np.flatnonzero(np.concatenate(([True], sortedIds[1:]!=sortedIds[:-1])))
+        # the sort is stable, the first row of each run is the first row of the entreprise
+        firstRows = order[starts]
+        rank = np.argsort(firstRows)
+        firstRows = firstRows[rank]
+        for (column, function) in aggregations.items():
+            ufunc = np.minimum if function=="min" else np.maximum
+            reduced[column] = ufunc.reduceat(dataframe[column].values[order], starts)[rank]
+    else:
+        firstRows = np.flatnonzero(~dataframe['entrep_id'].duplicated().values)
+        # without sorting the groups are in the order of their first row
+        aggregated = dataframe.groupby('entrep_id', sort=False).agg(aggregations)
+        for column in aggregations:
+            reduced[column] = aggregated[column].values
+    # the taken rows are a new dataframe, the aggregated columns are written in it
+    result = dataframe.take(firstRows).copy()
+    for (column, values) in reduced.items():
+        result[column] = values.astype(dataframe[column].dtype)
+    return result
+
+def getAndPreprocessCsvScore(csvinput = None, csvScore = None, index = None, predicates = None, filtered = False):
     '''
     function that imports the Score file from the remote ftp server
     it then deletes useless or wrong formatted rows 
@@ -218,53 +373,49 @@ def getAndPreprocessCsvScore(csvinput = None):
     it then only keeps the 'bilans1' rows
     -- IN:
     csvinput: the pandas dataframe containing BalAG file and at least column entrep_id in pos 0 (pandas.Dataframe)
+    csvScore: the raw score file if it was already downloaded, see scoreFileSpec (pandas.Dataframe) default: None
+    index: the index of the entreprises of csvinput, built from csvinput if None (EntrepriseIndex.EntrepriseIndex) default: None
+    predicates: other filters of the rows, see getScoreChunkFilter (function[]) default: None
+    filtered: boolean that settles if csvScore was already filtered by scoreRawFilters and scoreFilters
+        while it was read (see getPrefetchChunkFilters), they are then not applied again (boolean) default: False
     -- OUT:
     csvScore : pandas.Dataframe containing the file Score.
     '''
     print "Extracting the csvScore dataframe"
     startTime = time.time()
     
-    # setting parameters for the import of the dataframe
-    usecols = ['entrep_id','dateBilan','sourceModif','scoreSolv','scoreZ','scoreCH','scoreAltman']
-    dtype= {}
-    dtype['entrep_id'] = "uint32"
-    dtype['dateBilan'] = "string"
-    dtype['sourceModif'] = "string"
-    dtype['scoreSolv'] = "float16"
-    dtype['scoreZ'] = "float16"
-    dtype['scoreCH'] = "float16"
-    dtype['scoreAltman'] = "float16"
-    csvScore = FTPTools.retrieveFtplib("cameliaScores.csv.bz2", compression = "bz2", 
-                                       usecols=usecols, dtype = dtype, toPrint=False)
+    # if the csvinput parameter was given in input, 
+    # the file is cleaned further to match the input: only the bilans1 rows from 2010
+    # of the entreprises from csvinput are kept, the other rows are removed from each chunk while it is read
+    if index is None and csvinput is not None:
+        index = EntrepriseIndex.fromDataFrame(csvinput)
+    counts = [0]
+    chunkFilter = getScoreChunkFilter(index, predicates, counts=counts, filtered=filtered)
+    # importing the file
+    if csvScore is None:
+        (filename, compression, usecols, dtype, sep) = scoreFileSpec
+        csvScore = FTPTools.retrieveFtplib(filename, compression = compression, 
+                                           usecols=usecols, dtype = dtype, toPrint=False, sep=sep, chunkFilter=chunkFilter)
+    else:
+        csvScore = _filterByChunks(csvScore, chunkFilter)
+    if csvScore is None:
+        return None
     print "   processing file",
-    # cleaning according to the date column and converting remaning rows
-    csvScore.loc[~csvScore.dateBilan.str.contains(r"^[12][90][0-9][0-9]-[01][0-9]-[0-3][0-9]$",na=True),['dateBilan']] = None
-    csvScore['year'] = pd.to_datetime(csvScore['dateBilan'], format='%Y-%m-%d', errors='coerce').dt.year
-    del csvScore['dateBilan']   
-    totalIni = len(csvScore)
-    csvScore.dropna(axis=0,inplace=True)
+    # the categories of the chunks are merged
+    csvScore = Schema.applySchema(csvScore, Schema.scoreSchema)
+    totalIni = max(counts[0], 1)
     
-    # if the csvinput parameter was given in input, 
-    # the file is cleaned further to match the input
-    # if not, the file is returned this way
-    if csvinput is None:
+    # if no parameter csvinput was given, the file is returned this way
+    if index is None:
         # printing progress
         totalFin = len(csvScore)
         print "... done"
         print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/totalIni),"%\n"  
         Utils.printTime(startTime)
         return csvScore
-    # keeping only the bilans1 rows
-    csvScore = csvScore[csvScore.sourceModif=="bilans1"]
-    # removing all years before 2010
-    csvScore = csvScore[csvScore.year>=2010]
-    column = csvinput['entrep_id']
-    # we remove lines of cvsScore that are not concerning entreprises from csvinput
-    csvScore.loc[~csvScore['entrep_id'].isin(column),['entrep_id']] = None
     
-    # droping NaN rows and useless columns
+    # droping useless columns
     del csvScore['sourceModif']
-    csvScore.dropna(axis=0, inplace=True)
     
     # printing final progress
     totalFin = len(csvScore)
@@ -275,164 +426,352 @@ def getAndPreprocessCsvScore(csvinput = None):
     
     return csvScore
     
+def getScoreChunkFilter(index = None, predicates = None, rawPredicates = None, counts = None, filtered = False):
+    '''
+    function that creates the filter of the chunks of the Scores file applied while it is read:
+    if an index is given, the rows rejected by scoreRawFilters and the rows of the entreprises out of the index
+    are removed, and the rows rejected by a raw predicate, then the columns of the kept rows are converted
+    (see Schema.scoreSchema, the categories are left to the whole dataframe), the column dateBilan is replaced
+    by the column year, the rows with a missing value are removed, and if an index is given the rows rejected
+    by scoreFilters, and the rows rejected by a predicate.
+    A chunk already filtered is left as it is
+    -- IN:
+    index: the index of the entreprises kept, if None all of them and scoreRawFilters and scoreFilters
+        are not applied (EntrepriseIndex.EntrepriseIndex) default: None
+    predicates: filters of the converted chunk, functions returning the mask of the kept rows
+        (function(pandas.Dataframe) -> numpy.ndarray of bool []) default: None
+    rawPredicates: filters of the chunk as it is read, before the conversion of its columns (function[]) default: None
+    counts: list whose first element is increased by the number of rows of each chunk (int[]) default: None
+    filtered: boolean that settles if the chunks were already filtered by scoreRawFilters and scoreFilters,
+        which are then not applied again (boolean) default: False
+    -- OUT:
+    chunkFilter: the filter of the chunks, see FTPTools.retrieveFtplib (function(pandas.Dataframe) -> pandas.Dataframe)
+    '''
+    rawFilters = ([] if index is None or filtered else scoreRawFilters)+_getEntrepriseFilters(index)+list(rawPredicates or [])
+    filters = ([] if index is None or filtered else scoreFilters)+list(predicates or [])
+    schema = dict([(column, columnType) for (column, columnType) in Schema.scoreSchema.items() if columnType!="category"])
+    return _createChunkFilter(rawFilters, schema, _addYearColumn, filters, counts)
+
+def getPrefetchChunkFilters():
+    '''
+    function that returns the filters of the chunks of the Scores and Etab files that don't depend
+    on the BalAG file, so that they are applied while the files are downloaded with it
+    (see FTPTools.retrieveMultipleFtplib): the Scores rows rejected by scoreRawFilters and scoreFilters
+    and the Etab rows with a wrong or a missing value are removed.
+    The Scores file must then be given to getAndPreprocessCsvScore with filtered set to True
+    -- IN:
+    nothing
+    -- OUT:
+    chunkFilters: the filters of the chunks by filename ({string:function(pandas.Dataframe) -> pandas.Dataframe})
+    '''
+    return {scoreFileSpec[0]:getScoreChunkFilter(predicates=scoreFilters, rawPredicates=scoreRawFilters),
+            etabFileSpec[0]:getEtabChunkFilter()}
+
+def _addYearColumn(chunk):
+    ''' replaces the column dateBilan of the Scores by the column year '''
+    if 'dateBilan' in chunk.columns:
+        chunk['year'] = pd.DatetimeIndex(chunk['dateBilan']).year
+        del chunk['dateBilan']
+    return chunk
+
+def _getEntrepriseFilters(index):
+    ''' returns the filter of the rows of the entreprises of an index, no filter without index '''
+    if index is None:
+        return []
+    return [lambda chunk: index.contains(chunk['entrep_id'].values)]
+
+def _createChunkFilter(rawFilters, schema, transform, filters, counts):
+    '''
+    returns the function filtering the raw values of a chunk, converting its kept rows then filtering them again,
+    the rows with a missing value are removed before the conversion and the ones with a wrong value after it
+    '''
+    def chunkFilter(chunk):
+        if counts is not None:
+            counts[0] += len(chunk)
+        chunk = Schema.applySchema(_applyFilters(chunk, rawFilters).dropna(axis=0).copy(), schema)
+        if chunk is None:
+            return None
+        if transform is not None:
+            chunk = transform(chunk)
+        return _applyFilters(chunk.dropna(axis=0), filters)
+    return chunkFilter
+
+def _applyFilters(chunk, filters):
+    ''' returns the rows of a chunk kept by all the filters, the filters are applied on the rows kept by the previous ones '''
+    for function in filters:
+        if len(chunk)==0:
+            break
+        chunk = chunk[np.asarray(function(chunk), dtype=np.bool_)]
+    return chunk
+
+def _filterByChunks(dataframe, chunkFilter):
+    ''' applies the filter of the chunks of a file to a dataframe already read, by slices of Constants.ftpStreamChunkSize rows '''
+    kept = []
+    for start in range(0, max(len(dataframe), 1), Constants.ftpStreamChunkSize):
+        chunk = chunkFilter(dataframe.iloc[start:start+Constants.ftpStreamChunkSize].copy())
+        if chunk is None:
+            return None
+        kept.append(chunk)
+    return pd.concat(kept)
+
+def computeBalAGFeatures(csvinput):
+    '''
+    function that computes the features of the entreprises of the BalAG file (see FeatureStore)
+    -- IN
+    csvinput : the cleaned BalAG dataframe with the columns 'entrep_id', 'datePiece',
+        'dateDernierPaiement' and 'montantPieceEur' and optionally 'paidBill' (pandas.Dataframe)
+    -- OUT
+    features : one row per entreprise sorted by entrep_id (pandas.Dataframe)
+    '''
+    return FeatureStore.computeFeatures(_toFeatureBills(csvinput), "balAG")
+
+def _toFeatureBills(csvinput):
+    ''' returns the columns of the BalAG used by the features, with the dates converted if they are strings '''
+    datesDernierPaiement = Utils.parseIsoDatesCached(csvinput['dateDernierPaiement']).astype('datetime64[ns]')
+    if 'paidBill' in csvinput.columns:
+        # only the payments of the paid bills are counted
+        datesDernierPaiement[~csvinput['paidBill'].values.astype(np.bool_)] = np.datetime64('NaT')
+    return pd.DataFrame({'entrep_id':csvinput['entrep_id'].values,
+                         'datePiece':Utils.parseIsoDatesCached(csvinput['datePiece']).astype('datetime64[ns]'),
+                         'dateDernierPaiement':datesDernierPaiement,
+                         'montantPieceEur':csvinput['montantPieceEur'].values})
+
+def refreshFeatureStore(csvinput = None, csvEtab = None, csvScore = None, directory = None, incremental = False, versions = None):
+    '''
+    function that updates the features by entreprise of the feature store (see FeatureStore)
+    with the given dataframes, the features of the other files are kept
+    -- IN
+    csvinput : the cleaned BalAG dataframe, or only its new rows if incremental (pandas.Dataframe) default: None
+    csvEtab : the Etab file with one row per etablissement, as returned by getAndPreprocessCsvEtab() (pandas.Dataframe) default: None
+    csvScore : the scores of the entreprises, as returned by getAndPreprocessCsvScore(csvinput) (pandas.Dataframe) default: None
+    directory : the directory of the store (string) default: Constants.featureStoreDirectory
+    incremental : boolean that settles if the rows of csvinput are added to the stored features of the BalAG
+        instead of replacing them, as the new rows cleaned by updateAndCleanCsv (boolean) default: False
+    versions : the version of each file, a file whose version didn't change since the last refresh
+        is skipped ({string in ["balAG","etab","score"]:string}) default: None
+    -- OUT
+    flag : boolean that settles if everything was successful (True: no problem, False: an error occured)
+    '''
+    print "Refreshing the feature store"
+    startTime = time.time()
+    if versions is None:
+        versions = {}
+    flag = True
+    if csvinput is not None:
+        flag = FeatureStore.refreshFeatures(_toFeatureBills(csvinput), "balAG", directory, versions.get("balAG"), incremental)
+    if flag and csvEtab is not None:
+        flag = FeatureStore.refreshFeatures(csvEtab, "etab", directory, versions.get("etab"))
+    if flag and csvScore is not None:
+        flag = FeatureStore.refreshFeatures(csvScore, "score", directory, versions.get("score"))
+    Utils.printTime(startTime)
+    return flag
+
 ''' II - Cleaning Functions '''
-def cleaningEntrepId(csvinput):
+def cleaningBalAG(csvinput, groups = None, rules = None, dependent = True, nbProcesses = None, audit = None):
     '''
-    function that cleans the content of the first column 'entrep_id'
-    according to the behaviors described in Constants and returns the cleaned dataframe
+    function that cleans the BalAG dataframe in a single pass: the enabled rules of the registry
+    are combined in one mask and the rejected rows are removed at once, the types of the columns are kept.
+    The rules rejecting the most rows are evaluated first, each on the rows kept by the previous ones.
+    The number of rows rejected by each rule is printed.
     -- IN
-    csvinput : pandas dataframe containing the Payment csv file (dataframe)
-    toPrint : boolean that settles the display of computed informations (boolean) (default: False)
+    csvinput : pandas dataframe containing the Payment csv file, with parsed dates (dataframe)
+    groups : the groups of rules to apply among the ones of cleaningGroups,
+        if None all of them (string[]) default: None
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
+    dependent : boolean that settles if the rules depending on the other rows,
+        as the minimal number of bills, are applied (boolean) default: True
+    nbProcesses : number of processes cleaning partitions of the rows at the same time (see _cleanPartitions),
+        if None the rows are cleaned by this process (int) default: None
+    audit : dictionary filled with the index of the rows rejected by each rule (see CleaningAudit),
+        if None the rejected rows are not recorded ({string:CleaningAudit.RowBitmap}) default: None
     -- OUT
     csvinput : the cleaned dataframe (dataframe)
     '''
-    print "=== Starting Cleaning of entrep_id column ==="
-
+    print "=== Starting Cleaning of the BalAG dataframe ==="
     # checking if everything is all right with the input
     if csvinput is None or len(csvinput)==0:
         print "No Data Remaining"
         print ""
         return csvinput
-    if not 'entrep_id' in csvinput.columns:
-        print "error : No column to analyse - entrep_id"
-        return csvinput
+    if rules is None:
+        rules = CleaningRules.fromConstants()
+    availableGroups = _getAvailableGroups(csvinput, groups)
+    # removing the rejected rows at once
+    totalIni = len(csvinput)
+    rejected = None if audit is None else {}
+    if nbProcesses is not None and nbProcesses>1:
+        (cleaned, counts) = _cleanPartitions(csvinput, availableGroups, rules, dependent, nbProcesses, rejected)
+    else:
+        (cleaned, counts) = rules.apply(csvinput, availableGroups, dependent, rejected)
+    if audit is not None:
+        _addToAudit(audit, dict([(name, _getRowIds(csvinput.index, positions)) for (name, positions) in rejected.items()]))
+    _printCounts(counts, totalIni, len(cleaned))
+    return cleaned
 
-    # cleaning according to the 'entrep_id' int format
-    # cleaning according to the minimal id
-    # cleaning according to the maximal id
-    test = ( Constants.bclnIdIntFormat & (csvinput.entrep_id<=0)
-             | Constants.bclnIdMinimalIdValue & (csvinput.entrep_id<Constants.clnIdMinimalIdValue)
-             | Constants.bclnIdMaximalIdValue & (csvinput.entrep_id>Constants.clnIdMaximalIdValue)
-            )
-    
-    csvinput.loc[test] = None
+def _printCounts(counts, totalIni, totalFin):
+    ''' prints the number of rows rejected by each rule and by all of them '''
+    for (rule, count) in counts:
+        print "   ",rule.description,":",str(count),"rows -",str(100.0*count/max(totalIni, 1)),"%"
+    print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/max(totalIni, 1)),"%\n"
 
-    # cleaning according to the number of bills
-    nbBills = csvinput.groupby('entrep_id').size()           
-    if Constants.bclnIdMinimalBillsNumber:
-        csvinput.loc[~nbBills[csvinput['entrep_id']]>Constants.clnIdMinimalBillsNumber] = None
-    
+def _getRowIds(index, positions):
+    ''' returns the ids of the rows at some positions: their index if it is made of integers, else their positions '''
+    if index.is_integer():
+        return index.values[positions]
+    return positions
+
+def _addToAudit(audit, rejected):
+    ''' adds to the bitmaps of an audit the ids of the rows rejected by each rule {rule name:ids} '''
+    for (name, ids) in rejected.items():
+        bitmap = CleaningAudit.fromIds(ids)
+        if bitmap is None:
+            continue
+        audit[name] = audit[name].union(bitmap) if name in audit else bitmap
+
+def _cleanPartitions(csvinput, groups, rules, dependent, nbProcesses, rejected = None):
+    '''
+    function that cleans a dataframe split into nbProcesses partitions of consecutive rows,
+    each partition is sent with the rules to a process of a pool, which cleans it by the rules
+    on the rows alone and only sends back the positions of the kept rows.
+    The dependent rules are then applied by this process to the kept rows of all the partitions
+    -- IN
+    csvinput : the dataframe to clean (pandas.Dataframe)
+    groups : the groups of rules to apply (string[])
+    rules : the registry of the cleaning rules (CleaningRules.CleaningRules)
+    dependent : boolean that settles if the dependent rules are applied (boolean)
+    nbProcesses : number of processes of the pool (int)
+    rejected : dictionary filled with the positions of the rows rejected by each rule ({string:numpy.ndarray of int}) default: None
+    -- OUT
+    csvinput : the cleaned dataframe, with the rows in their order (pandas.Dataframe)
+    counts : the number of rows rejected by each rule ([(CleaningRules.Rule, int)])
+    '''
+    bounds = np.linspace(0, len(csvinput), nbProcesses+1).astype(np.int64)
+    partitions = [(start, csvinput.iloc[start:stop], groups, rules, rejected is not None)
+                  for (start, stop) in zip(bounds[:-1], bounds[1:])]
+    results = _mapPool(_cleanPartition, partitions, nbProcesses)
+    kept = np.concatenate([positions for (positions, _, _) in results])
+    counts = _mergeCounts(rules, [partitionCounts for (_, partitionCounts, _) in results])
+    if rejected is not None:
+        rejected.update(_mergeRejected([partitionRejected for (_, _, partitionRejected) in results]))
+    if dependent:
+        (kept, dependentCounts) = rules.select(csvinput, groups, True, kept, rejected)
+        counts += dependentCounts
+    return (csvinput.take(kept), counts)
+
+def _cleanPartition(partition):
+    ''' cleans the rows of a partition (position of its first row, rows, groups, rules, audit) of _cleanPartitions '''
+    (start, dataframe, groups, rules, audit) = partition
+    rejected = {} if audit else None
+    (kept, counts) = rules.select(dataframe, groups, False, rejected=rejected)
+    if rejected is not None:
+        rejected = dict([(name, positions+start) for (name, positions) in rejected.items()])
+    return (kept+start, [(rule.name, count) for (rule, count) in counts], rejected)
+
+def _mapPool(function, arguments, nbProcesses):
+    '''
+    calls function on each argument in a pool of nbProcesses processes,
+    returns the results in the order of the arguments.
+    The arguments are pickled, the processes don't rely on the memory of this one
+    '''
+    pool = multiprocessing.Pool(nbProcesses)
+    try:
+        return pool.map(function, arguments)
+    finally:
+        pool.close()
+        pool.join()
+
+def _mergeRejected(partitionsRejected):
+    ''' concatenates the positions of the rows rejected by each rule sent by the processes '''
+    merged = {}
+    for partitionRejected in partitionsRejected:
+        for (name, positions) in partitionRejected.items():
+            merged.setdefault(name, []).append(positions)
+    return dict([(name, np.concatenate(positions)) for (name, positions) in merged.items()])
+
+def _mergeCounts(rules, partitionsCounts):
+    ''' sums the counts of the rules sent by the processes, the rules rejecting the most rows first '''
+    total = {}
+    for partitionCounts in partitionsCounts:
+        for (name, count) in partitionCounts:
+            total[name] = total.get(name, 0)+count
+    byName = dict([(rule.name, rule) for rule in rules.getRules()])
+    return [(byName[name], count) for (name, count) in sorted(total.items(), key=lambda item: -item[1])]
+
+def _getAvailableGroups(csvinput, groups = None):
+    ''' returns the groups of rules among groups (all of them if None) whose columns are in the dataframe '''
+    if groups is None:
+        groups = [group for (group, _) in cleaningGroups]
+    availableGroups = []
+    for (group, columns) in cleaningGroups:
+        if not group in groups:
+            continue
+        missingColumns = [column for column in columns if not column in csvinput.columns]
+        if len(missingColumns)>0:
+            print "error : No column to analyse -",missingColumns[0]
+            continue
+        availableGroups.append(group)
+    return availableGroups
+
+def _cleaningInPlace(csvinput, groups, rules):
+    '''
+    cleans a dataframe with some groups of rules as cleaningBalAG,
+    but removes the rejected rows from the dataframe itself, whose index must be unique
+    '''
+    print "=== Starting Cleaning of the BalAG dataframe ==="
+    if csvinput is None or len(csvinput)==0:
+        print "No Data Remaining"
+        print ""
+        return csvinput
+    if rules is None:
+        rules = CleaningRules.fromConstants()
+    (kept, counts) = rules.select(csvinput, _getAvailableGroups(csvinput, groups))
     totalIni = len(csvinput)
-    csvinput.dropna(axis=0,how='all',inplace=True)
-    totalFin = len(csvinput)
-    print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/totalIni),"%\n"  
-        
+    rejected = np.ones(totalIni, dtype=np.bool_)
+    rejected[kept] = False
+    csvinput.drop(csvinput.index[rejected], inplace=True)
+    _printCounts(counts, totalIni, len(csvinput))
     return csvinput
 
-def cleaningDates(csvinput):
+def cleaningEntrepId(csvinput, rules = None):
+    '''
+    function that cleans the content of the first column 'entrep_id'
+    according to the behaviors described in Constants and returns the cleaned dataframe
+    (see cleaningBalAG), the rejected rows are removed from csvinput itself
+    -- IN
+    csvinput : pandas dataframe containing the Payment csv file (dataframe)
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
+    -- OUT
+    csvinput : the cleaned dataframe (dataframe)
+    '''
+    return _cleaningInPlace(csvinput, ['entrep_id'], rules)
+
+def cleaningDates(csvinput, rules = None):
     '''
     function that cleans the content of the date columns
     'datePiece','dateEcheance','dateDernierPaiement'
-    according to the behaviors described in Constants.
+    according to the behaviors described in Constants (see cleaningBalAG),
+    the rejected rows are removed from csvinput itself
     -- IN
     csvinput : pandas dataframe containing the Payment csv file (dataframe)
-    toPrint : boolean that settles the display of computed informations (boolean) (default: False)
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
     -- OUT
     returns csvinput (dataframe)
     '''
-        
-    print "=== Starting Cleaning of date columns ==="
-  
-    # checking if everything is all right with the input
-    if csvinput is None or len(csvinput)==0:
-        print "error : No Data Remaining"
-        print ""
-        return csvinput
-    if not 'datePiece' in csvinput.columns:
-        print "error : No column to analyse - datePiece"
-        return csvinput 
-    if not 'dateEcheance' in csvinput.columns:
-        print "error : No column to analyse - dateEcheance"
-        return csvinput 
-    if not 'dateDernierPaiement' in csvinput.columns:
-        print "error : No column to analyse - dateDernierPaiement"
-        return csvinput   
+    return _cleaningInPlace(csvinput, ['dates'], rules)
 
-    
-    # cleaning the data in one single test
-    # criterias for dropping
-    # - NaN date for datePiece (and bclnDatePieceFormat)
-    # - NaN date for dateEcheance (and bclnDateEcheanceFormat)
-    # - NaN date for dateDernierPaiement (and bclnDateDernierPaiementFormat)
-    # - Echeance or DernierPaiement date anterior to Piece (and bclnDateInconsistent)
-    # - Time gap between Echeance or DernierPaiement and Piece larger than threshold (and bclnDateMonthDiff)
-    # - datePiece before minimal date (and bclnDateMinimalDate)
-    # - datePiece after maximal date (and bclnDateMaximalDate)
-    test = ((Constants.bclnDatePieceFormat & (csvinput.datePiece.isnull())) \
-            |(Constants.bclnDateEcheanceFormat & (csvinput.dateEcheance.isnull())) \
-            |(Constants.bclnDateDernierPaiementFormat & (csvinput.dateDernierPaiement.isnull())) \
-            |(Constants.bclnDateInconsistent \
-               & (csvinput.datePiece.notnull()) \
-               & ((csvinput.dateDernierPaiement.notnull() \
-                    & ((csvinput.dateDernierPaiement-csvinput.datePiece).astype('timedelta64[D]')<0)) \
-                  |(csvinput.dateEcheance.notnull()  \
-                    & ((csvinput.dateEcheance-csvinput.datePiece).astype('timedelta64[D]')<0))  \
-                   )  \
-              )  \
-            | (Constants.bclnDateMonthDiff \
-               & (csvinput.datePiece.notnull())  \
-               & ((csvinput.dateDernierPaiement.notnull()  \
-                   & ((csvinput.dateDernierPaiement-csvinput.datePiece).astype('timedelta64[M]')>Constants.clnDateMonthDiff))  \
-                  |(csvinput.dateEcheance.notnull()  \
-                    & ((csvinput.dateEcheance-csvinput.datePiece).astype('timedelta64[M]')>Constants.clnDateMonthDiff)))  \
-               )  \
-            | (Constants.bclnDateMinimalDate & (csvinput.datePiece.notnull()) & (csvinput.datePiece<Constants.clnDateMinimalDate)) \
-            | (Constants.bclnDateMaximalDate & (csvinput.datePiece.notnull()) & (csvinput.datePiece>Constants.clnDateMaximalDate)) \
-           ) 
-
-    csvinput.loc[test] = None
-    
-    totalIni = len(csvinput)
-    csvinput.dropna(axis=0,how='all',inplace=True)
-    totalFin = len(csvinput)
-    
-    print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/totalIni),"%\n"  
-    
-    return csvinput
-
-def cleaningMontant(csvinput):
+def cleaningMontant(csvinput, rules = None):
     '''
     function that cleans the content of the column 'montantPieceEur'
-    according to the behaviors described in Constants.
+    according to the behaviors described in Constants (see cleaningBalAG),
+    the rejected rows are removed from csvinput itself
     -- IN
     csvinput : pandas dataframe containing the Payment csv file (dataframe)
-    toPrint : boolean that settles the display of computed informations (boolean) (default: False)
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
     -- OUT
     returns csvinput (dataframe)
-    '''        
-    print "=== Starting Cleaning of montantPieceEur columns ==="
-    # validating the input
-    if csvinput is None or len(csvinput)==0:
-        print "No Data Remaining"
-        print ""
-        return csvinput
-    if not 'montantPieceEur' in csvinput.columns:
-        print "error : No column to analyse - montantPieceEur"
-        return csvinput 
-    
-    # cleaning the data in one single test
-    # criterias for dropping
-    # - NaN int for montantPieceEur (and bclnMontantIntFormat)
-    # - negative value for montantPieceEur (and bclnMontantNonNegativeValue)
-    # - zero value for montantPieceEur (and bclnMontantNonZeroValue)
-    # - montantPieceEur smaller than minimal montant (and bclnMontMinimalValue)
-    # - montantPieceEur bigger than maximal montant (and bclnMontMaximalValue)
-    
-    test = ((Constants.bclnMontantIntFormat & csvinput.montantPieceEur.isnull())
-            | (Constants.bclnMontantNonNegativeValue & (csvinput.montantPieceEur<0))
-            | (Constants.bclnMontantNonZeroValue & (csvinput.montantPieceEur==0))
-            | (Constants.bclnMontMinimalValue & (csvinput.montantPieceEur<Constants.clnMontMinimalValue))
-            | (Constants.bclnMontMaximalValue & (csvinput.montantPieceEur>Constants.clnMontMaximalValue))
-            )
-    
-    csvinput.loc[test] = None
-    totalIni = len(csvinput)
-    csvinput.dropna(axis=0,how='all',inplace=True)
-    totalFin = len(csvinput)
-    print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/totalIni),"%\n"  
-    
-    
-    return csvinput        
+    '''
+    return _cleaningInPlace(csvinput, ['montant'], rules)
+
       
 ''' III - Analyzing Functions '''
 def analyzingEntrepId(csvinput, toSaveGraph = False):
@@ -767,10 +1106,10 @@ def analyzingOthers(csvinput):
     print "ratio of non-EUR devise :",100.0*len([1 for a in columnDevise if not a=="EUR"])/len(columnDevise),"%"
     print "   other possible values for devise :", otherDateInsert
     print ""
-    print "ratio of non-standard dateInsert :",100.0*len([1 for a in columnDateInsert if not datetime.datetime.strptime(a[:10],"%Y-%m-%d").date()==Constants.anaOtherStandardDate])/len(columnDevise),"%"
+    print "ratio of non-standard dateInsert :",100.0*np.count_nonzero(Utils.parseIsoDates(columnDateInsert, withTime=True)!=np.datetime64(Constants.anaOtherStandardDate))/len(columnDevise),"%"
     print "   other possible values for dateInsert :", otherDateInsert
         
-def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
+def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False, fromFeatureStore = False):
     '''
     function that analyses the content of the columns
     'entrep_id', 'datePiece', 'dateEcheance', 'dateDernierPaiement' and 'montantPieceEur'
@@ -778,6 +1117,8 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
     -- IN
     csvinput : pandas dataframe containing the Payment csv file (dataframe)
     toDrawGraph : boolean that settles the display of a graph displaying informations (boolean) (default: False)
+    fromFeatureStore : boolean that settles if the informations by entreprise are read from the feature store
+        (see FeatureStore) instead of computed from csvinput (boolean) (default: False)
     -- OUT
     returns nothing
     '''  
@@ -810,19 +1151,10 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
         print ""
         return
     
-    # dictionary linking entrep_id to informations about it
-    #     informations: [minBillDate, maxBillDate, nbBill, nbPaid, Delay, Montant]
-    #     informations that will be added : [..., numberOfYearOfActivity, meanBillNumberPerYear]
-    entrepriseDict = {}
     # dictionary linking years to montant values
     yearsToMontantDict = {}
     # dictionary linking number of bills to delay
     vectorDelay = [0]*((int)(Constants.anaCompletMaximalDelay/Constants.anaCompletStepSizeDelay+1))
-    # vectors of starting and ending dates for entreprises
-    vectorStartDateAll = []
-    vectorEndDateAll = []
-    vectorStartDate = []
-    vectorEndDate = []
     # array keeping analysis about the montant values
     #     informations [delay (days), nbPaid, nbEntries]
     maxMontant = np.max(csvinput['montantPieceEur'])
@@ -834,30 +1166,28 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
     numberMontantLitige = 0
     numberMontantLitigeAndDelay = 0
     numberMontantLitigeAndNotPaid = 0
+    # converting the dates of the whole columns at once
+    datesPiece = Utils.parseIsoDatesCached(column['datePiece']).astype(object)
+    datesEcheance = Utils.parseIsoDatesCached(column['dateEcheance']).astype(object)
+    datesDernierPaiement = Utils.parseIsoDatesCached(column['dateDernierPaiement']).astype(object)
+    # informations by entreprise: first and last bill, number of bills and of paid bills, delays, montants
+    if fromFeatureStore:
+        features = FeatureStore.loadFeatures(entrepIds=column['entrep_id'].values)
+        if features is None:
+            return
+    else:
+        features = computeBalAGFeatures(column)
     # filling the dictionaries
-    for entry in column.values:
-        d = datetime.datetime.strptime(entry[1],"%Y-%m-%d").date()
+    for (entry, d, d1, d2) in zip(column.values, datesPiece, datesEcheance, datesDernierPaiement):
         if minDate==0 or d<minDate:
             minDate = d
         if maxDate==0 or d>maxDate:
             maxDate = d
         if entry[4]:
-            d2 = datetime.datetime.strptime(entry[3],"%Y-%m-%d").date()
             delay = (d2-d).days
             if delay>maxDelay:
                 maxDelay = delay
             vectorDelay[min(len(vectorDelay)-1,(int)(delay/Constants.anaCompletStepSizeDelay))] += 1
-        if not entrepriseDict.has_key(entry[0]):
-            # creating the enterprise field
-            # informations: [minBillDate (date), maxBillDate (date), nbBill (int), nbPaid (int), Delay (int-days), Montants (array)]
-            entrepriseDict[entry[0]] = [d, d, 1, 1 if entry[4] else 0, delay if entry[4] else 0, [entry[5]]]
-        else:
-            entrepriseDict[entry[0]][0] = min(d,entrepriseDict[entry[0]][0])
-            entrepriseDict[entry[0]][1] = max(d,entrepriseDict[entry[0]][1])
-            entrepriseDict[entry[0]][2] = entrepriseDict[entry[0]][2] + 1
-            entrepriseDict[entry[0]][3] = entrepriseDict[entry[0]][3] + (1 if entry[4] else 0)
-            entrepriseDict[entry[0]][4] = entrepriseDict[entry[0]][4] + (delay if entry[4] else 0)
-            entrepriseDict[entry[0]][5].append(entry[5])
         if not d.year in yearsToMontantDict:
             yearsToMontantDict[d.year] = [entry[5]]
         else:
@@ -870,7 +1200,6 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
             if int(entry[6])>0:
                 numberMontantLitige += 1
                 if entry[4]:
-                    d1 = datetime.datetime.strptime(entry[2],"%Y-%m-%d").date()
                     if d2>d1:
                         numberMontantLitigeAndDelay += 1
                 else:
@@ -878,22 +1207,18 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
         except:
             continue
     # computing additional informations
-    for entreprise in entrepriseDict.values():
-        if entreprise[0]!=entreprise[1]:
-            vectorStartDate.append(entreprise[0])
-            vectorEndDate.append(entreprise[1])
-        vectorStartDateAll.append(entreprise[0])
-        vectorEndDateAll.append(entreprise[1])
-        if not (entreprise[4]==0 or entreprise[3]==0):
-            entreprise[4] = entreprise[4] / entreprise[3]
-            entreprise[5] = [np.mean(entreprise[5]),np.std(entreprise[5])]
-        else:
-            entreprise[5] = [0,0]
-        entreprise.append(1.0*(entreprise[1] - entreprise[0]).days/365.25)
-        if not entreprise[6]==0:
-            entreprise.append(1.0*entreprise[2]/entreprise[6])
-        else:
-            entreprise.append(1)
+    firstBills = features['firstBill'].values.astype('datetime64[D]')
+    lastBills = features['lastBill'].values.astype('datetime64[D]')
+    moreThanOne = firstBills!=lastBills
+    vectorStartDate = firstBills[moreThanOne].astype(object)
+    vectorEndDate = lastBills[moreThanOne].astype(object)
+    vectorStartDateAll = firstBills.astype(object)
+    vectorEndDateAll = lastBills.astype(object)
+    (meanMontant, stdMontant) = FeatureStore.getMeanMontant(features)
+    withDelay = (features['sumDelay'].values!=0)&(features['nbPaid'].values!=0)
+    vectorYearNumber = (lastBills-firstBills).astype(np.int64)/365.25
+    vectorMeanMontant = np.where(withDelay, meanMontant, 0)
+    vectorVarMontant = np.where(withDelay, stdMontant, 0)
     yearMeanMontantArray = [0] * (maxDate.year+1-minDate.year)
     yearErrorMontantArray = [0] * (maxDate.year+1-minDate.year)
     yearNumberMontantArray = [0] * (maxDate.year+1-minDate.year)
@@ -910,10 +1235,7 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
         if informationMontantArray[i][1] > 0:
             informationMontantArray[i][0] = informationMontantArray[i][0] / informationMontantArray[i][1]        
         
-    vectorYearNumber = [entreprise[6] for entreprise in entrepriseDict.values()]
-    vectorMeanMontant = [entreprise[5][0] for entreprise in entrepriseDict.values()]
-    vectorVarMontant = [entreprise[5][1] for entreprise in entrepriseDict.values()]
-    print "number of enterprises :", len(entrepriseDict)
+    print "number of enterprises :", len(features)
     print ""
     print "mean number of years of activity :", np.mean(vectorYearNumber)
     print "min number of years of activity :", np.min(vectorYearNumber)
@@ -935,11 +1257,7 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
         vectorNbEntreprisesByMonth = [0]*nbStepGraphNbEntreprisesByMonth
         nbStepGraphDelayOverMontant = len(informationMontantArray)
         # filling vectors
-        print len(entrepriseDict)
-        for entreprise in entrepriseDict.values():
-            for i in range(12*entreprise[0].year+entreprise[0].month - 12*minDate.year - minDate.month, 
-                           12*entreprise[1].year+entreprise[1].month - 12*minDate.year - minDate.month+1):
-                vectorNbEntreprisesByMonth[i] += 1
+        vectorNbEntreprisesByMonth = _countActiveByMonth(firstBills, lastBills, minDate, nbStepGraphNbEntreprisesByMonth)
         # creating labels
         xlabelNbEntreprisesByMonth = [str((minDate+i*(maxDate-minDate)/(nbStepGraphNbEntreprisesByMonth-1)).year) if i%12==0 else "" for i in range(nbStepGraphNbEntreprisesByMonth)]
         xlabelMontantOverYear = range(minDate.year,maxDate.year+1)
@@ -985,11 +1303,7 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
         ####################################################
         # pre-processing
         nbStepGraph = 12*maxDate.year+maxDate.month - 12*minDate.year - minDate.month + 1
-        vectorNbEntreprisesByMonth = [0 for _ in range(nbStepGraph)]
-        for entreprise in entrepriseDict.values():
-            for i in range(12*entreprise[0].year+entreprise[0].month - 12*minDate.year - minDate.month, 
-                           12*entreprise[1].year+entreprise[1].month - 12*minDate.year - minDate.month+1):
-                vectorNbEntreprisesByMonth[i] += 1
+        vectorNbEntreprisesByMonth = _countActiveByMonth(firstBills, lastBills, minDate, nbStepGraph)
         xlabelYear = [str((minDate+i*(maxDate-minDate)/(nbStepGraph-1)).year) if i%12==0 else "" for i in range(nbStepGraph)]
         # displaying
         ax1 = plt.subplot(Constants.subplotShapeDates+Constants.graphId)
@@ -1076,6 +1390,14 @@ def analyzingComplete(csvinput, toSaveGraph = False, toDrawGraphOld = False):
                               mpatches.Patch(color=Constants.colorOrange, label='Mean delay')], 
                    fontsize = 10)
 
+def _countActiveByMonth(firstBills, lastBills, minDate, nbMonths):
+    ''' counts the entreprises active each month from minDate, between the months of their first and last bills '''
+    firstMonth = np.datetime64(minDate, 'M')
+    starts = (firstBills.astype('datetime64[M]')-firstMonth).astype(np.int64)
+    ends = (lastBills.astype('datetime64[M]')-firstMonth).astype(np.int64)+1
+    changes = np.bincount(starts, minlength=nbMonths+1)[:nbMonths+1]-np.bincount(ends, minlength=nbMonths+1)[:nbMonths+1]
+    return list(np.cumsum(changes)[:nbMonths])
+
 def analyzingIdCorresponding(csvinput, fileToCompare):
     '''
     function that checks if all the entreprises references in csvinput are in 
@@ -1099,44 +1421,41 @@ def analyzingIdCorresponding(csvinput, fileToCompare):
      
 ''' IV - Analysing functions using other files '''
 
-def analyzingEntrepScore():
+def analyzingEntrepScore(fromFeatureStore = False):
+    '''
+    function that analyzes the Score file.
+    1. it computes the first and last years of the bills of the entreprises of the BalAG file
+    2. it imports the score file and computes the percentage of the years of activity having a score
+    3. it prints statistics and creates histograms of the scores
+    -- IN:
+    fromFeatureStore : boolean that settles if the informations by entreprise are read from the feature store
+        (see refreshFeatureStore) instead of computed from the BalAG file (boolean) default: False
+    -- OUT:
+    the function returns nothing
+    '''
     print "=== Starting Analysis of Entreprises Scores ==="
     print ""
     
     startTime = time.time()
-    csvinput = importAndCleanCsv(True, ftp = True)
-    column = csvinput[['entrep_id','datePiece']].values
-    #initializing variables
-    #    setting size variables
-    nbEntreprises = len(np.unique(column))
-    print "enterprises number :" , nbEntreprises
-    # initializing variables
-    #    dictionary linking entrep_id to concerned rows
-    entrepriseToRowsDict = {}
-    dicNbEntreprise = {}
-    ind = 0
-    for entreprise in column:
-        # if the entreprise is not present in the dictionay we add it
-        if not entrepriseToRowsDict.has_key(entreprise[0]):
-            entrepriseToRowsDict[entreprise[0]] = []
-        # we add the year of the bill to the dictionary
-        entrepriseToRowsDict[entreprise[0]].append(entreprise[1][:4])
-        ind += 1
-    # we create another dictionary : dicNbEntreprise
-    # keys : entreprises
-    # values : [entreprise, nbBill, minYear, maxYear]
-    for entreprise in entrepriseToRowsDict:
-        dicNbEntreprise[entreprise] = [entreprise,len(entrepriseToRowsDict[entreprise]),min(entrepriseToRowsDict[entreprise]),max(entrepriseToRowsDict[entreprise])]
-    # clearing the column
-    column = []
-    del entrepriseToRowsDict
-    # creating a dataframe out of the previous dictionary
-    entrepriseData = pd.DataFrame.from_dict(dicNbEntreprise, orient='index')
-    entrepriseData.columns = ['entrep_id','nbBills','dateMin','dateMaxi']
+    if fromFeatureStore:
+        features = FeatureStore.loadFeatures(columns=['nbBills','firstBill','lastBill'])
+        if features is None:
+            return
+        features = features[features['nbBills'].values>0]
+    else:
+        csvinput = importAndCleanCsv(True, ftp = True)
+        if csvinput is None:
+            return
+        features = computeBalAGFeatures(csvinput)
+        del csvinput
+    print "enterprises number :" , len(features)
+    index = EntrepriseIndex.fromDataFrame(features)
 
     ## IMPORTING SCORE DATA
     print "importing the Score csv",
     csvScore = getAndPreprocessCsvScore()
+    if csvScore is None:
+        return
     print "... done:",
     interval = time.time() - startTime
     print interval, 'sec'
@@ -1147,122 +1466,63 @@ def analyzingEntrepScore():
     # keeping only bilans1 in the score file
     csvScore = csvScore[csvScore.sourceModif=="bilans1"]
     # removing all years before 2010
-    csvScore = csvScore[csvScore.dateBilan.str[2:4]>=10]
-    # droping lines with empty dates
-    csvScore = csvScore[csvScore.dateBilan!="0000-00-00"]
+    csvScore = csvScore[csvScore.year>=2010]
     # droping the useless columns
     del csvScore['sourceModif']
-    # merging both the dataframes according to the entrep_id field
-    entrepriseData = entrepriseData.merge(csvScore, on="entrep_id")
+    # keeping the scores of the entreprises of the BalAG file
+    entrepriseData = csvScore[index.contains(csvScore['entrep_id'].values)]
     print "... done"
     print ""
-    
-    # final entrepriseData fields:
-    # ['entrep_id', 'nbBills', 'dateMin', 'dateMax', 'dateBilan', 'scoreSolv','scoreZ','scoreCH','scoreAltman']
-    # [    0      ,     1    ,     2    ,     3    ,     4      ,      5     ,   6    ,    7    ,     8
 
     ## ANALYZING DATES CONSISTENCE
     print "analyzing dates consistence"
-    # adding a new field to the dictionary
-    # values: list of dates, 0
-    for entreprise in dicNbEntreprise.keys():
-        dicNbEntreprise[entreprise].append(0)
-    for line in entrepriseData.values:
-        # for each entry, if the dateBilan is between dateMin-1 and dateMax we increase the counter
-        # we allow the bilan of year N counting for year N+1 and N
-        if line[4][:4]<=line[3] and line[4][:4]>=int(line[2])-1:
-            dicNbEntreprise[int(line[0])][-1]+=1
+    # the first and last years of the bills of each entreprise, by position in the index
+    firstYears = np.zeros(len(index), dtype=np.int64)
+    lastYears = np.zeros(len(index), dtype=np.int64)
+    positions = index.getPositions(features['entrep_id'].values)
+    firstYears[positions] = pd.DatetimeIndex(features['firstBill'].values).year.values
+    lastYears[positions] = pd.DatetimeIndex(features['lastBill'].values).year.values
+    # for each score, if its year is between the first year-1 and the last year we increase the counter
+    # we allow the bilan of year N counting for year N+1 and N
+    positions = index.getPositions(entrepriseData['entrep_id'].values)
+    years = entrepriseData['year'].values
+    valid = (years>=firstYears[positions]-1)&(years<=lastYears[positions])
+    nbScores = np.bincount(positions[valid], minlength=len(index))
     # computing the percentage of years present in the file
     # for instance if a company has dateMin=2011, dateMax=2015 and three entries : 2010, 2012, 2014
     # all three of them are valid, we have 3 years over 5, so the score for this company is 60%
     #
     # we assume here that each year is present at most one time
-    for entreprise in dicNbEntreprise.keys():
-        dicNbEntreprise[entreprise][-1] = 100.0*dicNbEntreprise[entreprise][-1]/(int(dicNbEntreprise[entreprise][3])+1-int(dicNbEntreprise[entreprise][2]))
-    print "   percentage of scores:", 1.0*sum([a[-1] for a in dicNbEntreprise.values()])/len(dicNbEntreprise)
+    print "   percentage of scores:", np.mean(100.0*nbScores/(lastYears+1-firstYears))
     print ""
     print ""
-    del dicNbEntreprise
     
     ## CREATING HISTOGRAMS AND PRINTING STATS
     print "computing histogram"
     print "number of lines to analyze :", len(csvScore)
     dicScore = {0:'scoreSolv', 1:'scoreZ',2:'scoreCH',3:'scoreAltman'}
-    maxisMerged = np.max(entrepriseData,axis=0)
-    minisMerged = np.min(entrepriseData,axis=0)
-    maxisGlobal = np.max(csvScore,axis=0)
-    print "max computed -",
-    minisGlobal = np.min(csvScore,axis=0)
-    print "min computed"
     dicX = {}
     dicY = {}
     dicError = {}
     nbStepHistogram = 50
-    # getting ready to plot histograms
     for dic in dicScore.values():
-        print dic
         # getting min and max values
-        print "   max merged:",maxisMerged[dic],
-        print "  max global:",maxisGlobal[dic]
-        print "   min merged:",minisMerged[dic],
-        print "  min global:",minisGlobal[dic]
+        (minMerged, maxMerged) = (entrepriseData[dic].min(), entrepriseData[dic].max())
+        (minGlobal, maxGlobal) = (csvScore[dic].min(), csvScore[dic].max())
+        print dic
+        print "   max merged:",maxMerged,
+        print "  max global:",maxGlobal
+        print "   min merged:",minMerged,
+        print "  min global:",minGlobal
         print ""
         if dic=="scoreZ":
-            minisGlobal[dic] = -20
-            maxisGlobal[dic] = 20
+            (minGlobal, maxGlobal) = (-20, 20)
         if dic=="scoreAltman":
-            minisGlobal[dic] = 0
-            maxisGlobal[dic] = 20
-        # creating dic to store histograms values
-        dicX[dic] = range(int(minisGlobal[dic]),int(maxisGlobal[dic])+1,max(1,int((maxisGlobal[dic]+1-minisGlobal[dic])/nbStepHistogram)))
-        dicY[dic] = [0] * nbStepHistogram
-        dicY[dic+"global"] = [0] * nbStepHistogram
-        dicError[dic] = 0
-        dicError[dic+"global"] = 0
-    # ANALYZING MERGED FILE
-    p = 0
-    percent = 10
-    total = len(entrepriseData)
-    print "analyzing merged file"
-    for line in entrepriseData.values:
-        # printing progress
-        p+=1
-        if 100.0*p/total>percent:
-            print percent,'%',
-            percent+=10
-        # getting through the scores
-        for dic in dicScore.keys():
-            i=0
-            try:
-#                 print len(dicX[dicScore[dic]])-1, dicX[dicScore[dic]][i+1], line[5+dic]
-                while i<len(dicX[dicScore[dic]])-1 and dicX[dicScore[dic]][i+1]<line[5+dic]:
-                    i+=1
-                dicY[dicScore[dic]][i]+=1   
-            except:
-                dicError[dicScore[dic]]+=1 
-    del entrepriseData
-    print ""
-    print ""
-    # ANALYZING GLOBAL FILE
-    print "analyzing global file"
-    p = 0
-    percent = 10
-    total = len(csvScore)
-    for line in csvScore.values:
-        # printing progress
-        p+=1
-        if 100.0*p/total>percent:
-            print percent,'%',
-            percent+=10
-        # getting through the scores
-        for dic in dicScore.keys():
-            i=0
-            try:
-                while i<len(dicX[dicScore[dic]])-1 and dicX[dicScore[dic]][i+1]<line[2+dic]:
-                    i+=1
-                dicY[dicScore[dic]+"global"][i]+=1   
-            except:
-                dicError[dicScore[dic]+"global"]+=1
+            (minGlobal, maxGlobal) = (0, 20)
+        dicX[dic] = range(int(minGlobal),int(maxGlobal)+1,max(1,int((maxGlobal+1-minGlobal)/nbStepHistogram)))
+        # a score is in the first bin whose upper bound is not below it
+        (dicY[dic], dicError[dic]) = _countInBins(dicX[dic][1:], entrepriseData[dic].values, nbStepHistogram)
+        (dicY[dic+"global"], dicError[dic+"global"]) = _countInBins(dicX[dic][1:], csvScore[dic].values, nbStepHistogram)
         
     print ""
     print "errors:", dicError
@@ -1275,14 +1535,22 @@ def analyzingEntrepScore():
     interval = time.time() - startTime
     print "done: ", interval, 'sec'
 
-def analyzingEntrepEtab():
+def _countInBins(bounds, values, nbBins):
+    ''' counts the values in each bin, the values above the bound i-1 and not above the bound i are in the bin i,
+    returns the counts of the bins and the number of values beyond the last bin '''
+    positions = np.searchsorted(np.asarray(bounds, dtype=np.float64), np.asarray(values, dtype=np.float64))
+    counts = np.bincount(positions[positions<nbBins], minlength=nbBins)
+    return (list(counts), int((positions>=nbBins).sum()))
+
+def analyzingEntrepEtab(fromFeatureStore = False):
     '''
     function that analyzes the etab file.
     1. it imports the paiementfile and extract the entreprises id.
     2. it imports the etab file and computes statistics about entreprises
     3. it prints statistics and creates histograms
     -- IN:
-    the function takes no argument
+    fromFeatureStore : boolean that settles if the informations by entreprise are read from the feature store
+        (see refreshFeatureStore) instead of computed from the files (boolean) default: False
     -- OUT:
     the function returns nothing
     '''
@@ -1290,181 +1558,111 @@ def analyzingEntrepEtab():
     print ""
     startTime = time.time()
     
-    # importing Etab file
-    print "retrieving csvEtab file",
-    csvEtab = getAndPreprocessCsvEtab()
-    print "... done:",
-    interval = time.time() - startTime
-    print interval, 'sec'
-    print ""
-    
-    column = csvEtab['entrep_id'].values
-    # initializing dicEntreprise, dic which will contain info usefull for stats
-    dicEntreprise = {}
-    for entreprise in column:
-        if not dicEntreprise.has_key(entreprise):
-            # array containing ['entrep_id',nbEtab,array(capital),array(dateCreation),array(effectif), isInFile(boolean)]
-            dicEntreprise[entreprise] = [entreprise,0,[],[],[],False]
-    nbEntreprisesGlobal = len(dicEntreprise)      
-      
-    # importing the BalAG file
-    print "retrieving csvBalAG file",
-    csvinput = importAndCleanCsv(toPrint=False, ftp = True)
-    print "... done:",
-    interval = time.time() - startTime
-    print interval, 'sec'
-    print ""
-    
-    # joining files
-    column = csvinput['entrep_id'].values
-    nbEntreprises = len(np.unique(column))
-    nbMissingEntreprises = 0
-    for entreprise in column:
-        if not dicEntreprise.has_key(entreprise):
-            # adding the entreprise to te file, and counting the missing entreprises
-            dicEntreprise[entreprise] = [entreprise,0,[],[],[]]
-            nbMissingEntreprises+=1
-        else:
-            # putting the boolean to True, the entreprise is in the BalAG file
-            dicEntreprise[entreprise][-1] = True
+    if fromFeatureStore:
+        features = FeatureStore.loadFeatures(columns=['nbBills']+[name for (name, _, _, _, _) in FeatureStore.sourceFeatures["etab"]])
+        if features is None:
+            return
+    else:
+        # importing Etab file
+        print "retrieving csvEtab file",
+        csvEtab = getAndPreprocessCsvEtab()
+        if csvEtab is None:
+            return
+        print "... done:",
+        interval = time.time() - startTime
+        print interval, 'sec'
+        print ""
+        features = FeatureStore.computeFeatures(csvEtab, "etab")
+        del csvEtab
+        # importing the BalAG file
+        print "retrieving csvBalAG file",
+        csvinput = importAndCleanCsv(toPrint=False, ftp = True)
+        if csvinput is None:
+            return
+        print "... done:",
+        interval = time.time() - startTime
+        print interval, 'sec'
+        print ""
+        # joining files
+        (entrepIds, nbBills) = np.unique(csvinput['entrep_id'].values, return_counts=True)
+        del csvinput
+        features = features.merge(pd.DataFrame({'entrep_id':entrepIds.astype(np.uint32), 'nbBills':nbBills}), on='entrep_id', how='outer')
+        for (name, aggregation, _, dtype, _) in FeatureStore.sourceFeatures["etab"]+[("nbBills", "count", None, np.int64, None)]:
+            if np.dtype(dtype).kind!="M":
+                features[name] = features[name].fillna(0).values.astype(dtype)
+    # the entreprises of the BalAG file or of the Etab file
+    features = features[(features['nbBills'].values>0)|(features['nbEtab'].values>0)]
+    inBalAG = features['nbBills'].values>0
+    inEtab = features['nbEtab'].values>0
+    nbEntreprises = inBalAG.sum()
+    nbMissingEntreprises = (inBalAG&~inEtab).sum()
         
     # printing about missing entreprises
     print ""
-    print "global entreprises number :", nbEntreprisesGlobal
+    print "global entreprises number :", inEtab.sum()
     print "enterprises number :" , nbEntreprises
     print ""
     print "missing entreprises :",nbMissingEntreprises,"-",100.0*nbMissingEntreprises/nbEntreprises,"%"
     print ""
     
-    del csvinput
-    
-    ## ANALYSIS AND JOINING
+    ## ANALYSIS
     print "Analysing the file"
-    nbNanCapital = 0
-    nbNanCapitalGlobal = 0
-    nbNanDate = 0
-    nbNanDateGlobal = 0
-    nbNanEffectif = 0
-    nbNanEffectifGlobal = 0
-    nbLineBalAG = 0
-    total = len(csvEtab)
-    print total
-    percent = 1
-    i = 0
-    for line in csvEtab.values:
-        # printing progress
-        i+=1
-        if 100.0*i/total>percent:
-            print percent,"%",
-            percent+=1
-            if int(percent)%10==0:
-                print ""
-        # line = ['entrep_id','capital','DCREN','EFF_ENT'] 
-        nbLineBalAG += (1 if dicEntreprise[line[0]][5] else 0)
-        # increasing number of Etablissment
-        dicEntreprise[line[0]][1]+=1
-        # adding info about capital
-        if str(line[1]).lower()!="nan":
-            dicEntreprise[line[0]][2].append(int(line[1]))
-        else:
-            nbNanCapitalGlobal+=1
-            nbNanCapital+= (1 if dicEntreprise[line[0]][5] else 0)
-        # adding info about dateCreation
-        if str(line[2]).lower()!="nan":
-            dicEntreprise[line[0]][3].append(line[2])
-        else:
-            nbNanDateGlobal+=1
-            nbNanDate+= (1 if dicEntreprise[line[0]][5] else 0)
-        # adding info about effectif
-        if str(line[3]).lower()!="nan":
-            dicEntreprise[line[0]][4].append(int(line[3]))
-        else:
-            nbNanEffectifGlobal+=1
-            nbNanEffectif+= (1 if dicEntreprise[line[0]][5] else 0)
+    nbEtab = features['nbEtab'].values.astype(np.int64)
+    nbLineBalAG = nbEtab[inBalAG].sum()
+    nbLineGlobal = nbEtab.sum()
+    print nbLineGlobal
+    # the number of rows of each entreprise without the value
+    nanCapital = nbEtab-features['nbCapital'].values
+    nanDate = nbEtab-features['nbDcren'].values
+    nanEffectif = nbEtab-features['nbEffectif'].values
     print "...done"
     print ""
     print "PAIEMENT FILE STATS"
-    print "number of Nan capital:",nbNanCapital, "-",100.0*nbNanCapital/nbLineBalAG,"%"
-    print "number of Nan date:",nbNanDate, "-",100.0*nbNanDate/nbLineBalAG,"%"
-    print "number of Nan effectif:",nbNanEffectif, "-",100.0*nbNanEffectif/nbLineBalAG,"%"
+    print "number of Nan capital:",nanCapital[inBalAG].sum(), "-",100.0*nanCapital[inBalAG].sum()/nbLineBalAG,"%"
+    print "number of Nan date:",nanDate[inBalAG].sum(), "-",100.0*nanDate[inBalAG].sum()/nbLineBalAG,"%"
+    print "number of Nan effectif:",nanEffectif[inBalAG].sum(), "-",100.0*nanEffectif[inBalAG].sum()/nbLineBalAG,"%"
     print ""
     print "GLOBAL FILE STATS"
-    print "number of Nan capital:",nbNanCapitalGlobal, "-",100.0*nbNanCapitalGlobal/len(csvEtab),"%"
-    print "number of Nan date:",nbNanDateGlobal, "-",100.0*nbNanDateGlobal/len(csvEtab),"%"
-    print "number of Nan effectif:",nbNanEffectifGlobal, "-",100.0*nbNanEffectifGlobal/len(csvEtab),"%"
+    print "number of Nan capital:",nanCapital.sum(), "-",100.0*nanCapital.sum()/nbLineGlobal,"%"
+    print "number of Nan date:",nanDate.sum(), "-",100.0*nanDate.sum()/nbLineGlobal,"%"
+    print "number of Nan effectif:",nanEffectif.sum(), "-",100.0*nanEffectif.sum()/nbLineGlobal,"%"
     print ""
     
     ## ANALYSING CONSISTENCY
-    nbNoInfo = 0
-    nbInconsistentCapital = 0
-    nbInconsistentDate = 0
-    nbInconsistentEffectif = 0
-    nbConsistencyError = 0
+    # an entreprise is inconsistent if its etablissements have different values
+    hasCapital = features['nbCapital'].values>0
+    hasDate = features['nbDcren'].values>0
+    hasEffectif = features['nbEffectif'].values>0
+    nbNoInfo = (~inEtab).sum()
+    nbInconsistentCapital = (hasCapital&(features['capitalMin'].values!=features['capitalMax'].values)).sum()
+    nbInconsistentDate = (hasDate&(features['dcrenMin'].values!=features['dcrenMax'].values)).sum()
+    nbInconsistentEffectif = (hasEffectif&(features['effectifMin'].values!=features['effectifMax'].values)).sum()
     print "Consistency analysis",
-    for entreprise in dicEntreprise.keys():
-        try:
-            if dicEntreprise[entreprise][1] == 0:
-                nbNoInfo+=1
-                continue
-            if len(np.unique(dicEntreprise[entreprise][2]))>1:
-                nbInconsistentCapital+=1
-            dicEntreprise[entreprise][2] = np.max(dicEntreprise[entreprise][2])
-            if len(np.unique(dicEntreprise[entreprise][3]))>1:
-                nbInconsistentDate+=1
-            dicEntreprise[entreprise][3] = np.unique(dicEntreprise[entreprise][3])[0]
-            if len(np.unique(dicEntreprise[entreprise][4]))>1:
-                nbInconsistentEffectif+=1
-            dicEntreprise[entreprise][4] = np.max(dicEntreprise[entreprise][4])
-        except:
-            nbConsistencyError+=1
-            pass
     print "...done"
-    print "   nb of problems:",nbConsistencyError
-    print "   nb of missing informations:",100.0*nbNoInfo/len(dicEntreprise),"%"
-    print "   nb of inconsistent capital:",100.0*nbInconsistentCapital/len(dicEntreprise),"%"
-    print "   nb of inconsistent date:",100.0*nbInconsistentDate/len(dicEntreprise),"%"
-    print "   nb of inconsistent effectif:",100.0*nbInconsistentEffectif/len(dicEntreprise),"%"
+    print "   nb of missing informations:",100.0*nbNoInfo/len(features),"%"
+    print "   nb of inconsistent capital:",100.0*nbInconsistentCapital/len(features),"%"
+    print "   nb of inconsistent date:",100.0*nbInconsistentDate/len(features),"%"
+    print "   nb of inconsistent effectif:",100.0*nbInconsistentEffectif/len(features),"%"
     print ""
     
     print "computing analysis",
-    # initializing arrays
+    # the maximal capital and effectif and the first date of creation of each entreprise
+    # are in the first bin whose bound is not below them
     dateX = range(1950,2016)
-    dateY = [0]*len(dateX)
-    dateYGlobal = [0]*len(dateX)
     capitalX = range(0,12)
-    capitalY = [0]*len(capitalX)
-    capitalYGlobal = [0]*len(capitalX)
     effectifX = range(0,6)
-    effectifY = [0]*len(effectifX)
-    effectifYGlobal = [0]*len(effectifX)
-    nbDateError = 0
-    for entreprise in dicEntreprise.keys():
-        # handling capitals
-        i=0
-        capital = dicEntreprise[entreprise][2]
-        while i<len(capitalX)-1 and capital>10**(capitalX[i]):
-            i+=1
-        capitalYGlobal[i]+=1
-        capitalY[i]+=(1 if dicEntreprise[entreprise][5] else 0)
-        # handling dates
-        i=0
-        try:
-            date = dicEntreprise[entreprise][3][:4]
-#             print date
-            date = int(date)
-            while i<len(dateX)-1 and date>dateX[i]:
-                i+=1
-            dateYGlobal[i]+=1
-            dateY[i]+=(1 if dicEntreprise[entreprise][5] else 0)
-        except:
-            nbDateError+=1
-        # handling effectifs
-        i=0
-        effectif = dicEntreprise[entreprise][4]
-        while i<len(effectifX)-1 and effectif>10**(effectifX[i]):
-            i+=1
-        effectifYGlobal[i]+=1
-        effectifY[i]+=(1 if dicEntreprise[entreprise][5] else 0)
+    capitals = features['capitalMax'].values
+    years = pd.DatetimeIndex(features['dcrenMin'].values).year.values
+    effectifs = features['effectifMax'].values
+    capitalBounds = [10**i for i in capitalX[:-1]]
+    effectifBounds = [10**i for i in effectifX[:-1]]
+    (capitalY, _) = _countInBins(capitalBounds, capitals[hasCapital&inBalAG], len(capitalX))
+    (capitalYGlobal, _) = _countInBins(capitalBounds, capitals[hasCapital], len(capitalX))
+    (dateY, _) = _countInBins(dateX[:-1], years[hasDate&inBalAG], len(dateX))
+    (dateYGlobal, _) = _countInBins(dateX[:-1], years[hasDate], len(dateX))
+    (effectifY, _) = _countInBins(effectifBounds, effectifs[hasEffectif&inBalAG], len(effectifX))
+    (effectifYGlobal, _) = _countInBins(effectifBounds, effectifs[hasEffectif], len(effectifX))
+    nbDateError = (~hasDate).sum()
     # handling output 
     prepareInput("etabFile")
     DrawingTools.createHistogram(x=capitalX,y1=capitalY,y2=capitalYGlobal,
@@ -1502,34 +1700,19 @@ def AnalyzingEcheanceOverMontant(csvinput):
     the function returns nothing
     '''    
     print "analyzing montant over echeance"
-    # setting the array for drawing the histogram
-    y0 = []
-    y1 = []
-    ya = []
-    yb = []
-    nbError = 0
     nbLine = len(csvinput)
     print nbLine
-    percent = 10
-    i = 0
-    for line in csvinput[['montantPieceEur','datePiece','dateEcheance']].values:
-        i+=1
-        if 100.0*i/nbLine>percent:
-            print percent,"%",
-            percent+=10 
-        try :
-            d0 = datetime.datetime.strptime(line[1], '%Y-%m-%d').date()
-            d1 = datetime.datetime.strptime(line[2], '%Y-%m-%d').date()
-            a = line[0]
-            b = (d1-d0).days
-            y0.append(a)
-            y1.append(b)
-            if a < 100000 and b < 100:
-                ya.append(a)
-                yb.append(b)
-        except:
-            nbError += 1
-    print ""
+    # computing the delays of the whole columns at once
+    d0 = Utils.parseIsoDatesCached(csvinput['datePiece'])
+    d1 = Utils.parseIsoDatesCached(csvinput['dateEcheance'])
+    valid = ~(np.isnat(d0) | np.isnat(d1))
+    nbError = len(valid)-np.count_nonzero(valid)
+    # setting the array for drawing the histogram
+    y0 = np.asarray(csvinput['montantPieceEur'].values)[valid]
+    y1 = (d1[valid]-d0[valid]).astype(np.int64)
+    zoom = (y0 < 100000) & (y1 < 100)
+    ya = y0[zoom]
+    yb = y1[zoom]
     print "... done"
     print ""
     print "nb errors :",100.0*nbError/nbLine
@@ -1577,44 +1760,460 @@ def AnalyzingEffectifOverCapital(csvetab):
     DrawingTools.saveHistogram2D(y0=ya, y1=yb, xlabel="capital", ylabel="effectif", name="Effectif selon capital (nettoyé)", filename="02_effectif_over_capital_clean")
           
 ''' VI - Scripts and Global Functions '''
-def importAndCleanCsv(toPrint = False, ftp = False, toSave = False):
+def importAndCleanCsv(toPrint = False, ftp = False, toSave = False, csvinput = None, fromSnapshot = False, usecols = None, rules = None, chunksize = None, nbProcesses = None):
     '''
     Function that process the data:
     importing, cleaning and analysing and eventually save the dataframe
     -- IN
     toPrint : boolean to show the log of the cleaning process (boolean) default: True
     ftp : boolean to choose between local and remote data (boolean) default: False
-    toSave : boolean that settles if the final dataframe must be saved (boolean) default: False
+    toSave : boolean that settles if the final dataframe must be saved in Constants.cleanedCsvFilename
+        and as a snapshot, see saveSnapshot (boolean) default: False
+    csvinput : the raw BalAG file if it was already downloaded, see balAGFileSpec (pandas.Dataframe) default: None
+    fromSnapshot : boolean that settles if the cleaned dataframe is read from the snapshot
+        when it exists, instead of being imported and cleaned again (boolean) default: False
+    usecols : array containing the names of the columns needed besides the ones used by the cleaning,
+        the other columns are never read, if None import all (string[] or None) default: None
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
+    chunksize : number of rows read and cleaned at a time, the whole file is then never in memory
+        and the cleaned dataframe is memory-mapped from its store (see _cleanCsvByChunks),
+        if None the file is read and cleaned at once (int) default: None
+    nbProcesses : number of processes cleaning the rows at the same time, the local file is also
+        parsed by parts in parallel (see importAndCleanCsvFile), if None a single process (int) default: None
+    With toSave, the rows rejected by each rule are also saved in an audit next to the snapshot (see CleaningAudit).
     -- OUT 
     csvinput : the cleaned dataframe (pandas.Dataframe)
     '''
     print "Extracting the BalAG dataframe"
     startTime = time.time()
-    # importing the csv file and creating the datframe
-    if(ftp):
-        csvinput = importFTPCsv(addPaidBill=True,dtype=Constants.dtype)
+    if usecols is not None:
+        usecols = cleaningColumns+[column for column in usecols if not column in cleaningColumns]
+    if fromSnapshot and csvinput is None and ColumnStore.isStore(Constants.snapshotDirectory):
+        csvinput = loadSnapshot(usecols=usecols)
+        if csvinput is not None:
+            print "snapshot loaded =>",
+            Utils.printTime(startTime)
+            print ""
+            return csvinput
+    audit = {} if toSave else None
+    if chunksize is not None and csvinput is None:
+        csvinput = _cleanCsvByChunks(ftp, usecols, rules, chunksize, toSave, audit)
+        if csvinput is not None and toSave:
+            _saveAudit(audit)
+            _saveCsv(csvinput, startTime)
+        Utils.printTime(startTime)
+        print ""
+        return csvinput
+    if nbProcesses is not None and nbProcesses>1 and csvinput is None and not ftp:
+        # the local file is parsed and cleaned by parts in parallel
+        csvinput = importAndCleanCsvFile(os.path.join("..","..",'cameliaBalAGrandom.csv'), usecols, rules, nbProcesses, audit)
+        if csvinput is None:
+            return None
     else:
-        csvinput = importCsv(addPaidBill=True,dtype=Constants.dtype)
-    # prepricessing of the dates
-    csvinput['datePiece'] = pd.to_datetime(csvinput['datePiece'], format='%Y-%m-%d', errors='coerce') 
-    csvinput['dateEcheance'] = pd.to_datetime(csvinput['dateEcheance'], format='%Y-%m-%d', errors='coerce') 
-    csvinput['dateDernierPaiement'] = pd.to_datetime(csvinput['dateDernierPaiement'], format='%Y-%m-%d', errors='coerce')   
-    # preprocess the dataframe
-    csvinput = cleaningDates(csvinput)
-    csvinput = cleaningMontant(csvinput)
-    csvinput = cleaningEntrepId(csvinput)
+        # importing the csv file and creating the datframe
+        if csvinput is not None:
+            addPaidBillColumn(csvinput)
+        elif(ftp):
+            csvinput = importFTPCsv(addPaidBill=True,dtype=balAGFileSpec[3],lazy=usecols is not None)
+        else:
+            csvinput = importCsv(addPaidBill=True,dtype=balAGFileSpec[3],lazy=usecols is not None)
+        if isinstance(csvinput, LazyFrame.LazyFrame):
+            # reading only the needed columns
+            csvinput = csvinput.toDataFrame(usecols)
+        # converting the columns, the dates are parsed
+        csvinput = Schema.applySchema(csvinput, Schema.balAGSchema)
+        if csvinput is None:
+            return None
+        # preprocess the dataframe
+        csvinput = cleaningBalAG(csvinput, rules=rules, nbProcesses=nbProcesses, audit=audit)
     Utils.printTime(startTime)
     print ""
     if toSave:
         # saving the resulting Dataframe
-        os.chdir(os.path.join("..",".."))
-        with open("cameliaBalAGKevin.csv","w") as fichier:
-            fichier.write(csvinput.to_csv(path_or_buff = None ,sep="\t"))
-        print "file saved =>",
-        Utils.printTime(startTime)
+        _saveCsv(csvinput, startTime)
+        if saveSnapshot(csvinput) and _saveAudit(audit):
+            print "snapshot saved =>",
+            Utils.printTime(startTime)
+            print ""
+    return csvinput
+
+def _saveCsv(csvinput, startTime):
+    ''' writes the cleaned dataframe in Constants.cleanedCsvFilename, returns True if it was saved '''
+    try:
+        csvinput.to_csv(Constants.cleanedCsvFilename, sep="\t")
+    except IOError as e:
+        print "error : impossible to save the dataframe in",Constants.cleanedCsvFilename,":",e
+        return False
+    print "file saved =>",
+    Utils.printTime(startTime)
+    print ""
+    return True
+
+def _saveAudit(audit):
+    ''' saves the audit of the cleaning next to the snapshot and prints its size, returns True if it was saved '''
+    path = CleaningAudit.saveAudit(audit)
+    if path is None:
+        return False
+    size = sum([bitmap.getSize() for bitmap in audit.values()])
+    print "audit of the cleaning saved :",sum([len(bitmap) for bitmap in audit.values()]),"rejected rows in",str(size/1024),"kB"
+    return True
+
+def importAndCleanCsvFile(filename, usecols = None, rules = None, nbProcesses = None, audit = None):
+    '''
+    function that imports and cleans a local BalAG csv file split into parts of consecutive lines.
+    Each part is parsed, converted (see Schema) and cleaned by the rules on the rows alone
+    in a process of a pool, then the rule on the minimal number of bills is applied
+    to the kept rows of all the parts. The rows keep their order and their line numbers as index.
+    -- IN
+    filename : the path of the uncompressed csv file, separated by tabs (string)
+    usecols : the columns to read, if None all of them (string[]) default: None
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
+    nbProcesses : number of parts and of processes, if None the number of cores (int) default: None
+    audit : dictionary filled with the line numbers of the rows rejected by each rule (see CleaningAudit),
+        if None the rejected rows are not recorded ({string:CleaningAudit.RowBitmap}) default: None
+    -- OUT
+    csvinput : the cleaned dataframe (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    if rules is None:
+        rules = CleaningRules.fromConstants()
+    if nbProcesses is None:
+        nbProcesses = multiprocessing.cpu_count()
+    print "=== Starting Cleaning of the BalAG dataframe by parts ==="
+    parts = _splitCsvFile(filename, max(nbProcesses, 1))
+    if parts is None:
+        return None
+    (columns, ranges) = parts
+    usecols = None if usecols is None else [column for column in usecols if column!='paidBill']
+    # each process only receives the path of the file and the bytes of its part
+    parts = [(filename, start, stop, columns, usecols, rules, audit is not None) for (start, stop) in ranges]
+    if nbProcesses>1:
+        results = _mapPool(_readAndCleanPart, parts, nbProcesses)
+    else:
+        results = [_readAndCleanPart(part) for part in parts]
+    if len(results)==0 or len([1 for (_, chunk, _, _) in results if chunk is None])>0:
+        print "error : impossible to read the file :",filename
+        return None
+    # numbering the rows as the lines of the file
+    offset = 0
+    rejected = []
+    for (nbRows, chunk, _, partRejected) in results:
+        chunk.index += offset
+        if audit is not None:
+            rejected.append(dict([(name, positions+offset) for (name, positions) in partRejected.items()]))
+        offset += nbRows
+    # the categories of the parts are merged
+    csvinput = Schema.applySchema(pd.concat([chunk for (_, chunk, _, _) in results]), Schema.balAGSchema)
+    counts = _mergeCounts(rules, [partCounts for (_, _, partCounts, _) in results])
+    dependentRejected = None if audit is None else {}
+    (kept, dependentCounts) = rules.select(csvinput, _getAvailableGroups(csvinput), True, np.arange(len(csvinput)), dependentRejected)
+    if audit is not None:
+        rejected.append(dict([(name, csvinput.index.values[positions]) for (name, positions) in dependentRejected.items()]))
+        _addToAudit(audit, _mergeRejected(rejected))
+    csvinput = csvinput.take(kept)
+    _printCounts(counts+dependentCounts, offset, len(csvinput))
+    return csvinput
+
+def _splitCsvFile(filename, nbParts):
+    '''
+    splits a csv file into nbParts byte ranges of about the same size, starting at the beginning of a line,
+    returns the names of the columns of the header and the (start, stop) ranges, or None if an error occurs
+    '''
+    try:
+        size = os.path.getsize(filename)
+        with open(filename, "rb") as fichier:
+            header = fichier.readline()
+            bounds = [fichier.tell()]
+            for i in range(1, nbParts):
+                fichier.seek(max(size*i/nbParts, bounds[-1]))
+                # moving to the beginning of the next line
+                fichier.readline()
+                bounds.append(min(fichier.tell(), size))
+    except (IOError, OSError):
+        print "error : impossible to read the file :",filename
+        return None
+    bounds.append(size)
+    columns = header.rstrip("\r\n").split("\t")
+    return (columns, [(start, stop) for (start, stop) in zip(bounds[:-1], bounds[1:]) if stop>start])
+
+def _readAndCleanPart(part):
+    '''
+    parses and cleans the lines of a part (filename, start, stop, columns, usecols, rules, audit)
+    of importAndCleanCsvFile: the lines of the file between the bytes start and stop,
+    returns the number of parsed rows, the kept rows, the counts of the rules
+    and the positions of the rejected rows if they are recorded
+    '''
+    (filename, start, stop, columns, usecols, rules, audit) = part
+    with open(filename, "rb") as fichier:
+        fichier.seek(start)
+        data = fichier.read(stop-start)
+    try:
+        chunk = pd.read_csv(io.BytesIO(data), sep="\t", header=None, names=columns,
+                            usecols=usecols, dtype=balAGFileSpec[3])
+    except Exception:
+        return (0, None, [], None)
+    nbRows = len(chunk)
+    addPaidBillColumn(chunk)
+    chunk = Schema.applySchema(chunk, Schema.balAGSchema)
+    if chunk is None:
+        return (nbRows, None, [], None)
+    rejected = {} if audit else None
+    (kept, counts) = rules.select(chunk, _getAvailableGroups(chunk), False, rejected=rejected)
+    return (nbRows, chunk.take(kept), [(rule.name, count) for (rule, count) in counts], rejected)
+
+def _cleanCsvByChunks(ftp, usecols, rules, chunksize, toSave, audit = None):
+    '''
+    function that cleans the BalAG file chunk by chunk, see importAndCleanCsv:
+    - first pass : each chunk is read, cleaned by the rules on the rows alone and written at the end
+        of a store, the numbers of bills of the entreprises are counted on the kept rows
+    - second pass : the stored rows are read back chunk by chunk and the rule on the minimal
+        number of bills is applied with the counts of the whole file
+    The cleaned rows are stored in Constants.chunkDirectory, or in the snapshot if toSave
+    -- IN
+    ftp : boolean to choose between local and remote data (boolean)
+    usecols : the columns to read, if None all of them (string[])
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules)
+    chunksize : number of rows read and cleaned at a time (int)
+    toSave : boolean that settles if the cleaned rows are stored as the snapshot (boolean)
+    audit : dictionary filled with the index of the rows rejected by each rule (see CleaningAudit),
+        if None the rejected rows are not recorded ({string:CleaningAudit.RowBitmap}) default: None
+    -- OUT
+    csvinput : the cleaned dataframe, memory-mapped from its store (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    if rules is None:
+        rules = CleaningRules.fromConstants()
+    (filename, compression, _, dtype, sep) = balAGFileSpec
+    readcols = None if usecols is None else [column for column in usecols if column!='paidBill']
+    if ftp:
+        chunks = FTPTools.streamFtplib(filename, compression=compression, usecols=readcols,
+                                       dtype=dtype, chunksize=chunksize, sep=sep)
+    else:
+        try:
+            chunks = pd.read_csv(os.path.join("..","..",'cameliaBalAGrandom.csv'), sep="\t",
+                                 usecols=readcols, dtype=dtype, chunksize=chunksize)
+        except Exception:
+            print "error : impossible to read the file"
+            return None
+    if chunks is None:
+        return None
+    rowsDirectory = os.path.join(Constants.chunkDirectory, "rows")
+    cleanedDirectory = os.path.join(Constants.chunkDirectory, "cleaned")
+    print "=== Starting Cleaning of the BalAG dataframe by chunks ==="
+    totalIni = 0
+    nbChunks = 0
+    # number of rows rejected by each rule {description:count}
+    removed = {}
+    descriptions = []
+    # ids of the rows rejected by the rules in each chunk [{rule name:ids}]
+    rejected = []
+    # number of kept bills of each entreprise
+    bills = pd.Series([], dtype=np.float64)
+    try:
+        for chunk in chunks:
+            addPaidBillColumn(chunk)
+            chunk = Schema.applySchema(chunk, Schema.balAGSchema)
+            if chunk is None:
+                return None
+            totalIni += len(chunk)
+            chunkRejected = None if audit is None else {}
+            (cleaned, counts) = rules.apply(chunk, _getAvailableGroups(chunk), False, chunkRejected)
+            if audit is not None:
+                rejected.append(dict([(name, _getRowIds(chunk.index, positions)) for (name, positions) in chunkRejected.items()]))
+            chunk = cleaned
+            for (rule, count) in counts:
+                if not rule.description in removed:
+                    descriptions.append(rule.description)
+                removed[rule.description] = removed.get(rule.description, 0)+count
+            bills = bills.add(chunk['entrep_id'].value_counts(), fill_value=0)
+            chunk = _toSnapshotTypes(chunk)
+            if chunk is None:
+                return None
+            if nbChunks==0:
+                flag = ColumnStore.saveColumns(chunk, rowsDirectory)
+            else:
+                flag = ColumnStore.appendColumns(chunk, rowsDirectory)
+            if not flag:
+                return None
+            nbChunks += 1
+            print "    chunk",nbChunks,":",totalIni,"rows read"
+    except IOError as e:
+        print "error : impossible to read the BalAG file :",e
+        return None
+    if nbChunks==0:
+        print "No Data Remaining"
         print ""
+        return None
+    # the entreprises with too few bills in the whole file
+    excluded = pd.Index([])
+    minimalBillsRule = [rule for rule in rules.getRules() if rule.name=='bclnIdMinimalBillsNumber']
+    if len(minimalBillsRule)>0:
+        excluded = bills.index[bills.values<=rules.parameters['clnIdMinimalBillsNumber']]
+        descriptions.append(minimalBillsRule[0].description)
+        removed[minimalBillsRule[0].description] = 0
+    stored = ColumnStore.loadColumns(rowsDirectory, mmap=True)
+    if stored is None:
+        return None
+    for position in range(0, max(len(stored), 1), chunksize):
+        chunk = stored.iloc[position:position+chunksize]
+        if len(excluded)>0:
+            test = chunk['entrep_id'].isin(excluded).values
+            removed[minimalBillsRule[0].description] += np.count_nonzero(test)
+            if audit is not None:
+                rejected.append({'bclnIdMinimalBillsNumber':chunk.index.values[test]})
+            chunk = chunk[~test]
+        if position==0:
+            flag = ColumnStore.saveColumns(chunk, cleanedDirectory)
+        else:
+            flag = ColumnStore.appendColumns(chunk, cleanedDirectory)
+        if not flag:
+            return None
+    del stored
+    shutil.rmtree(rowsDirectory, ignore_errors=True)
+    if audit is not None:
+        _addToAudit(audit, _mergeRejected(rejected))
+    if toSave:
+        # the cleaned rows become the snapshot
+        if os.path.isdir(Constants.snapshotDirectory):
+            shutil.rmtree(Constants.snapshotDirectory)
+        os.rename(cleanedDirectory, Constants.snapshotDirectory)
+        cleanedDirectory = Constants.snapshotDirectory
+    csvinput = ColumnStore.loadColumns(cleanedDirectory, mmap=True)
+    if csvinput is None:
+        return None
+    totalFin = len(csvinput)
+    for description in descriptions:
+        print "   ",description,":",str(removed[description]),"rows -",str(100.0*removed[description]/max(totalIni, 1)),"%"
+    print "   ",str(totalIni-totalFin),"removed rows -",str(100.0*(totalIni-totalFin)/max(totalIni, 1)),"%\n"
+    return csvinput
+
+def updateAndCleanCsv(ftp = False, csvinput = None, directory = None, rules = None):
+    '''
+    Function that cleans the BalAG dataframe incrementally: only the rows inserted since the last update,
+    whose dateInsert is after the stored watermark, are cleaned and appended to the stored cleaned rows.
+    The numbers of bills are only updated for the entreprises of the new rows.
+    Everything is cleaned again if nothing is stored yet or if the rules changed.
+    -- IN
+    ftp : boolean to choose between local and remote data (boolean) default: False
+    csvinput : the raw BalAG file if it was already downloaded, see balAGFileSpec (pandas.Dataframe) default: None
+    directory : the directory of the cleaned rows and of the watermark (string) default: Constants.incrementalDirectory
+    rules : the registry of the cleaning rules, if None the rules of Constants (CleaningRules.CleaningRules) default: None
+    -- OUT
+    csvinput : the cleaned dataframe (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    print "Updating the BalAG dataframe"
+    startTime = time.time()
+    if directory is None:
+        directory = Constants.incrementalDirectory
+    if rules is None:
+        rules = CleaningRules.fromConstants()
+    rowsDirectory = os.path.join(directory, "rows")
+    billsDirectory = os.path.join(directory, "bills")
+    # reading the state of the last update
+    state = _readIncrementalState(directory)
+    if state is not None and (state.get("rules")!=rules.getSignature()
+                              or not ColumnStore.isStore(rowsDirectory) or not ColumnStore.isStore(billsDirectory)):
+        print "the cleaning rules changed, everything is cleaned again"
+        state = None
+    # importing the raw file, the other columns are only read if there are new rows
+    if csvinput is not None:
+        raw = LazyFrame.fromDataFrame(csvinput)
+    elif ftp:
+        raw = importFTPCsv(dtype=balAGFileSpec[3], lazy=True)
+    else:
+        raw = importCsv(dtype=balAGFileSpec[3], lazy=True)
+    if raw is None:
+        return None
+    if not 'dateInsert' in raw:
+        print "error : No column to analyse - dateInsert"
+        return None
+    if state is None:
+        newRows = np.arange(len(raw))
+    else:
+        newRows = np.flatnonzero((raw['dateInsert']>state["watermark"]).values)
+    print "   ",len(newRows),"new rows"
+    if len(newRows)>0:
+        # the new rows are the latest ones
+        watermark = raw['dateInsert'].take(newRows).dropna().max()
+        csvnew = raw.toDataFrame(rows=newRows)
+        del raw
+        addPaidBillColumn(csvnew)
+        csvnew = Schema.applySchema(csvnew, Schema.balAGSchema)
+        if csvnew is None:
+            return None
+        # the rules on the number of bills are applied on all the stored rows
+        csvnew = cleaningBalAG(csvnew, rules=rules, dependent=False)
+        newBills = csvnew.groupby('entrep_id').size()
+        csvnew = _toSnapshotTypes(csvnew)
+        if csvnew is None:
+            return None
+        # without state, an interrupted update is followed by a complete one
+        _writeIncrementalState(directory, None)
+        if state is None:
+            flag = ColumnStore.saveColumns(csvnew, rowsDirectory)
+            bills = newBills
+        else:
+            flag = ColumnStore.appendColumns(csvnew, rowsDirectory)
+            bills = _loadBills(billsDirectory)
+            flag = flag and bills is not None
+            if flag:
+                # updating the entreprises of the new rows only
+                positions = bills.index.get_indexer(newBills.index)
+                known = positions>=0
+                values = bills.values.copy()
+                values[positions[known]] += newBills.values[known]
+                bills = pd.concat([pd.Series(values, index=bills.index), newBills[~known]])
+        flag = flag and ColumnStore.saveColumns(pd.DataFrame({'entrep_id':bills.index.values, 'nbBills':bills.values},
+                                                             columns=['entrep_id','nbBills']), billsDirectory)
+        if not flag or not _writeIncrementalState(directory, {"watermark":str(watermark), "rules":rules.getSignature()}):
+            print "error : impossible to store the cleaned rows"
+            return None
+        del csvnew
+    # reading all the cleaned rows
+    csvinput = loadSnapshot(rowsDirectory)
+    if csvinput is not None and rules.isEnabled('bclnIdMinimalBillsNumber'):
+        bills = _loadBills(billsDirectory)
+        excluded = bills.index[bills.values<=rules.parameters['clnIdMinimalBillsNumber']]
+        csvinput = csvinput[~csvinput['entrep_id'].isin(excluded)]
+    Utils.printTime(startTime)
+    print ""
     return csvinput
 
+def _loadBills(directory):
+    ''' reads the numbers of bills by entreprise stored by updateAndCleanCsv as a serie indexed by entrep_id '''
+    bills = ColumnStore.loadColumns(directory)
+    if bills is None:
+        return None
+    return pd.Series(bills['nbBills'].values, index=pd.Index(bills['entrep_id'].values))
+
+def _readIncrementalState(directory):
+    ''' reads the state of the last update of updateAndCleanCsv, returns None if there is none '''
+    try:
+        with open(os.path.join(directory, "state.txt"), "r") as fichier:
+            return dict([line[:-1].split("\t", 1) for line in fichier])
+    except (IOError, ValueError):
+        return None
+
+def _writeIncrementalState(directory, state):
+    ''' writes the state of the last update of updateAndCleanCsv, removes it if state is None '''
+    filename = os.path.join(directory, "state.txt")
+    try:
+        if state is None:
+            if os.path.isfile(filename):
+                os.remove(filename)
+            return True
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(filename+".tmp", "w") as fichier:
+            for (key, value) in sorted(state.items()):
+                fichier.write(key+"\t"+value+"\n")
+        os.rename(filename+".tmp", filename)
+    except (IOError, OSError) as e:
+        print "error : impossible to write the state of the update :",e
+        return False
+    return True
+
 def importAndAnalyseCsv(toPrint = False, toDrawGraph = True, ftp = False):
     '''
     Function that process the data:
@@ -1631,17 +2230,15 @@ def importAndAnalyseCsv(toPrint = False, toDrawGraph = True, ftp = False):
     startTime = time.time()
     # importing the csv file and creating the datframe
     if(ftp):
-        csvinput = importFTPCsv(addPaidBill=True,dtype=Constants.dtype)
+        csvinput = importFTPCsv(addPaidBill=True,dtype=balAGFileSpec[3])
     else:
-        csvinput = importCsv(addPaidBill=True,dtype=Constants.dtype) 
-    # prepricessing of the dates
-    csvinput['datePiece'] = pd.to_datetime(csvinput['datePiece'], format='%Y-%m-%d', errors='coerce') 
-    csvinput['dateEcheance'] = pd.to_datetime(csvinput['dateEcheance'], format='%Y-%m-%d', errors='coerce') 
-    csvinput['dateDernierPaiement'] = pd.to_datetime(csvinput['dateDernierPaiement'], format='%Y-%m-%d', errors='coerce')   
+        csvinput = importCsv(addPaidBill=True,dtype=balAGFileSpec[3]) 
+    # converting the columns, the dates are parsed
+    csvinput = Schema.applySchema(csvinput, Schema.balAGSchema)
+    if csvinput is None:
+        return None
     # preprocess the dataframe
-    csvinput = cleaningDates(csvinput)
-    csvinput = cleaningMontant(csvinput)
-    csvinput = cleaningEntrepId(csvinput)
+    csvinput = cleaningBalAG(csvinput)
     if toDrawGraph:
         prepareInput()
     # analysing the dateframe
@@ -1697,39 +2294,44 @@ def printLastGraphs(filename = "analysis"):
             DrawingTools.drawLargeHistogram2D(tab[0])
             print "...done"
 
-def printConfiguration(globalConfig = False):
+def printConfiguration(globalConfig = False, rules = None):
     '''
     function that print the configuration of the launch according to the constants in
     the Constants python module.
     -- IN
     globalConfig : booleanthat settles if the functions displays all the booleans (True)
                     or just the changes from the default launch configuration (False) (boolean) default : False
+    rules : the registry of the cleaning rules to display, if None the rules of Constants (CleaningRules.CleaningRules) default: None
     -- OUT
     returns nothing
     '''
+    if rules is None:
+        rules = CleaningRules.fromConstants()
+    enabled = rules.isEnabled
+    parameters = rules.parameters
     ### CLEANING ID
     print "CLEANING ID"
     # clean according to being an int
-    if globalConfig or not bclnIdIntFormat:
-        print "clean according to being an int :",bclnIdIntFormat
+    if globalConfig or not enabled('bclnIdIntFormat'):
+        print "clean according to being an int :",enabled('bclnIdIntFormat')
     # clean according to the number of bills
-    if globalConfig or bclnIdMinimalBillsNumber:
-        print "clean according to the number of bills :",bclnIdMinimalBillsNumber,
-        if bclnIdMinimalBillsNumber:
-            print ":",clnIdMinimalBillsNumber
+    if globalConfig or enabled('bclnIdMinimalBillsNumber'):
+        print "clean according to the number of bills :",enabled('bclnIdMinimalBillsNumber'),
+        if enabled('bclnIdMinimalBillsNumber'):
+            print ":",parameters['clnIdMinimalBillsNumber']
         else:
             print ""
     # clean according to the value of the ID
-    if globalConfig or not bclnIdMinimalIdValue or clnIdMinimalIdValue!=1:
-        print "clean according to the minimal value of the ID :",bclnIdMinimalIdValue,
-        if bclnIdMinimalIdValue:
-            print ":",clnIdMinimalIdValue
+    if globalConfig or not enabled('bclnIdMinimalIdValue') or parameters['clnIdMinimalIdValue']!=1:
+        print "clean according to the minimal value of the ID :",enabled('bclnIdMinimalIdValue'),
+        if enabled('bclnIdMinimalIdValue'):
+            print ":",parameters['clnIdMinimalIdValue']
         else:
             print ""
-    if globalConfig or bclnIdMaximalIdValue:
-        print "clean according to the maximl value of the ID :",bclnIdMaximalIdValue,
-        if bclnIdMaximalIdValue:
-            print ":",clnIdMaximalIdValue
+    if globalConfig or enabled('bclnIdMaximalIdValue'):
+        print "clean according to the maximl value of the ID :",enabled('bclnIdMaximalIdValue'),
+        if enabled('bclnIdMaximalIdValue'):
+            print ":",parameters['clnIdMaximalIdValue']
         else:
             print ""
     
@@ -1737,34 +2339,34 @@ def printConfiguration(globalConfig = False):
     ### CLEANING DATES
     print "CLEANING DATES"
     # clean according to the date format
-    if globalConfig or not bclnDatePieceFormat:
-        print "clean according to being a proper date for DatePiece :",bclnDatePieceFormat
-    if globalConfig or not bclnDateEcheanceFormat:
-        print "clean according to being a proper date for DateEcheance :",bclnDateEcheanceFormat
-    if globalConfig or bclnDateDernierPaiementFormat:
-        print "clean according to being a proper date for DateDernierPaiement :",bclnDateDernierPaiementFormat
+    if globalConfig or not enabled('bclnDatePieceFormat'):
+        print "clean according to being a proper date for DatePiece :",enabled('bclnDatePieceFormat')
+    if globalConfig or not enabled('bclnDateEcheanceFormat'):
+        print "clean according to being a proper date for DateEcheance :",enabled('bclnDateEcheanceFormat')
+    if globalConfig or enabled('bclnDateDernierPaiementFormat'):
+        print "clean according to being a proper date for DateDernierPaiement :",enabled('bclnDateDernierPaiementFormat')
     # clean according to the consistence of the dates (piece < echeance and piece < dernierpaiement)
-    if globalConfig or not bclnDateInconsistent:
-        print "clean according to the consistence of the dates :",bclnDateInconsistent
+    if globalConfig or not enabled('bclnDateInconsistent'):
+        print "clean according to the consistence of the dates :",enabled('bclnDateInconsistent')
     # clean according to a maximal gap in month between dates
-    if globalConfig or bclnDateMonthDiff:
-        print "clean according to a maximal gap in month between dates :",bclnDateMonthDiff,
-        if bclnDateMonthDiff:
-            print ":",clnDateMonthDiff
+    if globalConfig or enabled('bclnDateMonthDiff'):
+        print "clean according to a maximal gap in month between dates :",enabled('bclnDateMonthDiff'),
+        if enabled('bclnDateMonthDiff'):
+            print ":",parameters['clnDateMonthDiff']
         else:
             print ""
     # clean according to a minimal date
-    if globalConfig or bclnDateMinimalDate:
-        print "clean according to a minimal date :",bclnDateMinimalDate,
-        if bclnDateMinimalDate:
-            print ":",clnDateMinimalDate
+    if globalConfig or enabled('bclnDateMinimalDate'):
+        print "clean according to a minimal date :",enabled('bclnDateMinimalDate'),
+        if enabled('bclnDateMinimalDate'):
+            print ":",parameters['clnDateMinimalDate']
         else:
             print ""
     # clean according to a maximal date
-    if globalConfig or bclnDateMaximalDate:
-        print "clean according to a maximal date :",bclnDateMaximalDate,
-        if bclnDateMaximalDate:
-            print ":",clnDateMaximalDate
+    if globalConfig or enabled('bclnDateMaximalDate'):
+        print "clean according to a maximal date :",enabled('bclnDateMaximalDate'),
+        if enabled('bclnDateMaximalDate'):
+            print ":",parameters['clnDateMaximalDate']
         else:
             print ""
     
@@ -1772,26 +2374,26 @@ def printConfiguration(globalConfig = False):
     ### CLEANING MONTANTS
     print "CLEANING MONTANTS"
     # clean according to being an int
-    if globalConfig or not bclnMontantIntFormat:
-        print "clean according to being an int :",bclnMontantIntFormat
+    if globalConfig or not enabled('bclnMontantIntFormat'):
+        print "clean according to being an int :",enabled('bclnMontantIntFormat')
     # clean according to being a positive value
-    if globalConfig or not bclnMontantNonNegativeValue:
-        print "clean according to being a positive value :",bclnMontantNonNegativeValue
+    if globalConfig or not enabled('bclnMontantNonNegativeValue'):
+        print "clean according to being a positive value :",enabled('bclnMontantNonNegativeValue')
     # clean according to being an non-zero value
-    if globalConfig or not bclnMontantNonZeroValue:
-        print "clean according to being an non-zero value :",bclnMontantNonZeroValue
+    if globalConfig or not enabled('bclnMontantNonZeroValue'):
+        print "clean according to being an non-zero value :",enabled('bclnMontantNonZeroValue')
     # clean according to a minimal value of the montant
-    if globalConfig or bclnMontMinimalValue:
-        print "clean according to a minimal value of the montant :",bclnMontMinimalValue,
-        if bclnMontMinimalValue:
-            print ":",clnMontMinimalValue
+    if globalConfig or enabled('bclnMontMinimalValue'):
+        print "clean according to a minimal value of the montant :",enabled('bclnMontMinimalValue'),
+        if enabled('bclnMontMinimalValue'):
+            print ":",parameters['clnMontMinimalValue']
         else:
             print ""
     # clean according to a maximal value of the montant
-    if globalConfig or bclnMontMaximalValue:
-        print "clean according to a maximal value of the montant :",bclnMontMaximalValue,
-        if bclnMontMaximalValue:
-            print ":",clnMontMaximalValue
+    if globalConfig or enabled('bclnMontMaximalValue'):
+        print "clean according to a maximal value of the montant :",enabled('bclnMontMaximalValue'),
+        if enabled('bclnMontMaximalValue'):
+            print ":",parameters['clnMontMaximalValue']
         else:
             print ""
     
@@ -1799,7 +2401,7 @@ def printConfiguration(globalConfig = False):
     ### CLEANING MONTANT LITIGE
     print "CLEANING MONTANT LITIGE"
     # clean according to a zero-valued montantLitige
-    if globalConfig or bclnMontantLitigeNonZero:
-        print "clean according to a zero-valued montantLitige :",bclnMontantLitigeNonZero
+    if globalConfig or Constants.bclnMontantLitigeNonZero:
+        print "clean according to a zero-valued montantLitige :",Constants.bclnMontantLitigeNonZero
       
 
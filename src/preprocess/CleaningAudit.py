@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module recording the rows rejected by each cleaning rule (see CleaningRules),
+so that the reason why a bill was removed is found without cleaning the file again.
+
+The ids of the rejected rows (their index in the BalAG file, that is their line number)
+are stored in compressed bitmaps in the manner of the roaring bitmaps: the ids are split
+by their high bits into parts of 65536 ids, and the low bits of each part are stored
+in the smallest of three containers:
+- array : the sorted low bits, 2 bytes by id, for the sparse parts
+- bitmap : one bit by id of the part, 8 kB, for the dense parts
+- runs : the start and the length of each run of consecutive ids, 4 bytes by run
+so that a bitmap never takes more than 2 bytes by rejected row, and much less for the dense parts.
+
+An audit is a dictionary {rule name:RowBitmap}. As for the counts printed by the cleaning,
+a row rejected by several rules is only in the bitmap of the first rule that rejected it.
+
+Layout of an audit directory, one for each cleaning saved next to the snapshot:
+- rules.txt : one line per rule "name<tab>number of rejected rows"
+- <name>.npz : the containers of the bitmap of the rule
+
+=== functions :
+fromIds(ids) : creates a RowBitmap holding row ids
+saveAudit(audit, directory, run) : writes the audit of a cleaning
+loadAudit(directory, run) : reads the audit of a cleaning written by saveAudit
+getRuns(directory) : returns the names of the saved audits
+explainRows(audit, ids) : returns the rule that rejected each row
+'''
+
+import os
+import shutil
+import time
+
+import numpy as np
+
+import Constants
+
+
+# kinds of the containers
+_ARRAY = 0
+_BITMAP = 1
+_RUNS = 2
+# number of ids of a container
+_containerSize = 1<<16
+# size in uint16 of a bitmap container
+_bitmapLength = _containerSize/16
+
+
+def fromIds(ids):
+    '''
+    function that creates a RowBitmap holding row ids
+    -- IN
+    ids : the ids of the rows, in any order and with duplicates (int[])
+    -- OUT
+    bitmap : the compressed bitmap (CleaningAudit.RowBitmap)
+    returns None if an id is negative
+    '''
+    ids = np.unique(np.asarray(ids, dtype=np.int64))
+    if len(ids)>0 and ids[0]<0:
+        print "error : impossible to store negative row ids"
+        return None
+    high = ids>>16
+    low = (ids&(_containerSize-1)).astype(np.uint16)
+    (keys, starts) = np.unique(high, return_index=True)
+    bounds = np.append(starts, len(ids))
+    kinds = np.zeros(len(keys), dtype=np.uint8)
+    payloads = []
+    for i in range(len(keys)):
+        (kinds[i], payload) = _encodeContainer(low[bounds[i]:bounds[i+1]])
+        payloads.append(payload)
+    offsets = np.zeros(len(keys)+1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(payload) for payload in payloads])
+    payload = np.concatenate(payloads) if len(payloads)>0 else np.zeros(0, dtype=np.uint16)
+    return RowBitmap(keys.astype(np.uint32), kinds, offsets, payload, np.diff(bounds).astype(np.uint32))
+
+def saveAudit(audit, directory = None, run = None):
+    '''
+    function that writes the audit of a cleaning in a directory of its own,
+    the audits of the previous cleanings are kept
+    -- IN
+    audit : the rows rejected by each rule ({string:CleaningAudit.RowBitmap})
+    directory : the directory of the audits (string) default: Constants.auditDirectory
+    run : the name of the audit, if None the date and time of the cleaning (string) default: None
+    -- OUT
+    path : the directory of the audit (string)
+    returns None if an error occurs
+    '''
+    if directory is None:
+        directory = Constants.auditDirectory
+    if run is None:
+        run = time.strftime("%Y%m%d-%H%M%S")
+    path = os.path.join(directory, run)
+    tmpPath = path+".tmp"
+    try:
+        if os.path.isdir(tmpPath):
+            shutil.rmtree(tmpPath)
+        os.makedirs(tmpPath)
+        with open(os.path.join(tmpPath, "rules.txt"), "w") as fichier:
+            for name in sorted(audit.keys()):
+                bitmap = audit[name]
+                np.savez(os.path.join(tmpPath, name+".npz"), keys=bitmap.keys, kinds=bitmap.kinds,
+                         offsets=bitmap.offsets, payload=bitmap.payload, cardinalities=bitmap.cardinalities)
+                fichier.write(name+"\t"+str(len(bitmap))+"\n")
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmpPath, path)
+    except (IOError, OSError) as e:
+        print "error : impossible to save the audit of the cleaning :",e
+        shutil.rmtree(tmpPath, ignore_errors=True)
+        return None
+    return path
+
+def loadAudit(directory = None, run = None):
+    '''
+    function that reads the audit of a cleaning written by saveAudit
+    -- IN
+    directory : the directory of the audits (string) default: Constants.auditDirectory
+    run : the name of the audit, if None the last one (string) default: None
+    -- OUT
+    audit : the rows rejected by each rule ({string:CleaningAudit.RowBitmap})
+    returns None if an error occurs
+    '''
+    if directory is None:
+        directory = Constants.auditDirectory
+    if run is None:
+        runs = getRuns(directory)
+        if len(runs)==0:
+            print "error : no audit of the cleaning in :",directory
+            return None
+        run = runs[-1]
+    path = os.path.join(directory, run)
+    audit = {}
+    try:
+        with open(os.path.join(path, "rules.txt"), "r") as fichier:
+            names = [line.split("\t")[0] for line in fichier.read().splitlines() if line!=""]
+        for name in names:
+            data = np.load(os.path.join(path, name+".npz"))
+            audit[name] = RowBitmap(data["keys"], data["kinds"], data["offsets"], data["payload"], data["cardinalities"])
+    except (IOError, OSError, KeyError) as e:
+        print "error : impossible to read the audit of the cleaning :",e
+        return None
+    return audit
+
+def getRuns(directory = None):
+    '''
+    function that returns the names of the audits saved in a directory, from the oldest to the last one
+    -- IN
+    directory : the directory of the audits (string) default: Constants.auditDirectory
+    -- OUT
+    runs : the names of the audits (string[])
+    '''
+    if directory is None:
+        directory = Constants.auditDirectory
+    if not os.path.isdir(directory):
+        return []
+    return sorted([run for run in os.listdir(directory)
+                   if os.path.isfile(os.path.join(directory, run, "rules.txt")) and not run.endswith(".tmp")])
+
+def explainRows(audit, ids):
+    '''
+    function that returns the rule that rejected each row
+    -- IN
+    audit : the rows rejected by each rule ({string:CleaningAudit.RowBitmap})
+    ids : the ids of the rows (int[])
+    -- OUT
+    rules : the name of the rule that rejected each row, "" for the kept rows (numpy.ndarray of string)
+    '''
+    ids = np.asarray(ids, dtype=np.int64)
+    rules = np.zeros(len(ids), dtype=object)
+    rules[:] = ""
+    for (name, bitmap) in audit.items():
+        rules[bitmap.contains(ids)] = name
+    return rules
+
+class RowBitmap(object):
+    '''
+    compressed set of row ids, see the description of the module
+    '''
+    def __init__(self, keys, kinds, offsets, payload, cardinalities):
+        '''
+        -- IN
+        keys : the high bits of the ids of each container, in increasing order (numpy.ndarray of uint32)
+        kinds : the kind of each container (numpy.ndarray of uint8)
+        offsets : the bounds of each container in the payload (numpy.ndarray of int64)
+        payload : the contents of the containers (numpy.ndarray of uint16)
+        cardinalities : the number of ids of each container (numpy.ndarray of uint32)
+        '''
+        self.keys = keys
+        self.kinds = kinds
+        self.offsets = offsets
+        self.payload = payload
+        self.cardinalities = cardinalities
+
+    def __len__(self):
+        return int(self.cardinalities.sum())
+
+    def getSize(self):
+        ''' returns the size of the bitmap in bytes '''
+        return sum([array.nbytes for array in [self.keys, self.kinds, self.offsets, self.payload, self.cardinalities]])
+
+    def toIds(self):
+        ''' returns the ids of the bitmap in increasing order (numpy.ndarray of int64) '''
+        parts = [(np.int64(self.keys[i])<<16)+_decodeContainer(self.kinds[i], self.payload[self.offsets[i]:self.offsets[i+1]])
+                 for i in range(len(self.keys))]
+        return np.concatenate(parts) if len(parts)>0 else np.zeros(0, dtype=np.int64)
+
+    def contains(self, ids):
+        ''' returns the mask of the ids held by the bitmap (numpy.ndarray of bool) '''
+        ids = np.asarray(ids, dtype=np.int64)
+        held = self.toIds()
+        if len(held)==0:
+            return np.zeros(len(ids), dtype=np.bool_)
+        positions = np.minimum(np.searchsorted(held, ids), len(held)-1)
+        return held[positions]==ids
+
+    def union(self, other):
+        ''' returns the bitmap of the ids held by one of the bitmaps '''
+        return fromIds(np.union1d(self.toIds(), other.toIds()))
+
+    def intersection(self, other):
+        ''' returns the bitmap of the ids held by both bitmaps '''
+        return fromIds(np.intersect1d(self.toIds(), other.toIds(), assume_unique=True))
+
+    def difference(self, other):
+        ''' returns the bitmap of the ids held by this bitmap and not by the other one '''
+        return fromIds(np.setdiff1d(self.toIds(), other.toIds(), assume_unique=True))
+
+def _encodeContainer(low):
+    ''' returns the kind and the payload of the smallest container holding the sorted low bits '''
+    # the last id of each run
+    breaks = np.flatnonzero(np.diff(low.astype(np.int32))!=1)
+    nbRuns = len(breaks)+1
+    kind = np.argmin([len(low), _bitmapLength, 2*nbRuns])
+    if kind==_ARRAY:
+        return (_ARRAY, low)
+    if kind==_BITMAP:
+        bits = np.zeros(_containerSize, dtype=np.bool_)
+        bits[low] = True
+        return (_BITMAP, np.packbits(bits).view(np.uint16))
+    starts = low[np.append(0, breaks+1)]
+    ends = low[np.append(breaks, len(low)-1)]
+    return (_RUNS, np.column_stack((starts, ends-starts)).ravel().astype(np.uint16))
+
+def _decodeContainer(kind, payload):
+    ''' returns the sorted low bits held by a container (numpy.ndarray of int64) '''
+    if kind==_ARRAY:
+        return payload.astype(np.int64)
+    if kind==_BITMAP:
+        return np.flatnonzero(np.unpackbits(payload.view(np.uint8))).astype(np.int64)
+    runs = payload.reshape(-1, 2).astype(np.int64)
+    lengths = runs[:, 1]+1
+    # consecutive ids inside the runs, a jump at the start of each run
+    steps = np.ones(lengths.sum(), dtype=np.int64)
+    steps[0] = runs[0, 0]
+    steps[np.cumsum(lengths)[:-1]] = runs[1:, 0]-(runs[:-1, 0]+runs[:-1, 1])
+    return np.cumsum(steps)
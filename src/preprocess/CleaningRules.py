@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing the registry of the rules cleaning the BalAG dataframe (see CameliaBalAGPreprocess.cleaningBalAG).
+
+A rule is a vectorized predicate over some columns returning the mask of the rejected rows.
+It is named after the boolean of Constants that enables it, and its thresholds
+are read from the parameters of the registry, named after the values of Constants.
+The registry is built from Constants when it is created and can then be changed at runtime,
+so that several cleaning configurations can be applied to the same loaded dataframe
+without reloading any module.
+The registry can be pickled to be sent to other processes: the rules of Constants are sent by name,
+the predicates of the other rules must be functions of a module.
+
+The rules are evaluated in the order that rejects the most rows first, each rule only
+on the rows kept by the previous ones. The rejection rates are estimated on a sample
+of the dataframe before the first cleaning, then updated after each cleaning.
+
+=== functions :
+fromConstants() : creates a registry with the rules and the thresholds of Constants
+
+=== classes :
+CleaningRules : registry of cleaning rules
+'''
+
+import collections
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+import Constants
+
+
+# a cleaning rule
+# name : name of the boolean of Constants enabling the rule (string)
+# group : group of the rule, see CameliaBalAGPreprocess.cleaningGroups (string)
+# description : text printed with the number of rejected rows (string)
+# columns : the columns read by the predicate (string[])
+# predicate : function taking a dictionary of the arrays of the columns and the parameters of the registry
+#    and returning the mask of the rejected rows, if the rule is dependent it also takes the mask
+#    of the rows already rejected and is evaluated after all the others on all the rows (function)
+# dependent : boolean that settles if the rule depends on the rows rejected by the other ones (boolean)
+Rule = collections.namedtuple("Rule", ["name","group","description","columns","predicate","dependent"])
+
+# length of a month used by the rule on the delays, as in pandas
+_monthLength = np.timedelta64(2629746, 's')
+
+
+def fromConstants():
+    '''
+    function that creates a registry with the rules of the cleaning of the BalAG dataframe,
+    enabled and parametrized as in Constants at the time of the call
+    -- IN
+    nothing
+    -- OUT
+    rules : the registry (CleaningRules.CleaningRules)
+    '''
+    parameters = dict([(name, getattr(Constants, name)) for name in _constantsParameters])
+    rules = CleaningRules(parameters)
+    for rule in _constantsRules:
+        rules.addRule(rule, enabled=getattr(Constants, rule.name))
+    return rules
+
+class CleaningRules(object):
+    '''
+    registry of the rules cleaning a dataframe
+    '''
+    def __init__(self, parameters = None):
+        '''
+        -- IN
+        parameters : the thresholds used by the rules ({string:value}) default: None
+        '''
+        self.parameters = {} if parameters is None else dict(parameters)
+        # observed proportion of the evaluated rows rejected by each rule
+        self.rejectionRates = {}
+        self._rules = collections.OrderedDict()
+        self._enabled = set()
+
+    def addRule(self, rule, enabled = True):
+        '''
+        adds a rule to the registry, replacing the rule with the same name
+        -- IN
+        rule : the rule (CleaningRules.Rule)
+        enabled : boolean that settles if the rule is applied (boolean) default: True
+        '''
+        self._rules[rule.name] = rule
+        self.rejectionRates.pop(rule.name, None)
+        self.enable(rule.name, enabled)
+
+    def enable(self, name, enabled = True):
+        '''
+        enables or disables a rule
+        -- IN
+        name : the name of the rule (string)
+        enabled : boolean that settles if the rule is applied (boolean) default: True
+        '''
+        if not name in self._rules:
+            raise KeyError(name)
+        if enabled:
+            self._enabled.add(name)
+        else:
+            self._enabled.discard(name)
+
+    def isEnabled(self, name):
+        ''' returns True if the rule is in the registry and applied '''
+        return name in self._enabled
+
+    def setParameter(self, name, value):
+        '''
+        changes a threshold used by the rules
+        -- IN
+        name : the name of the parameter (string)
+        value : the new value
+        '''
+        self.parameters[name] = value
+
+    def copy(self):
+        ''' returns an independent copy of the registry, with the same rules, parameters and rates '''
+        rules = CleaningRules(self.parameters)
+        rules._rules = collections.OrderedDict(self._rules)
+        rules._enabled = set(self._enabled)
+        rules.rejectionRates = dict(self.rejectionRates)
+        return rules
+
+    def __getstate__(self):
+        ''' the rules of Constants, whose predicates can't be pickled, are replaced by their name '''
+        state = dict(self.__dict__)
+        state['_rules'] = collections.OrderedDict([(name, name if _constantsRulesByName.get(name) is rule else rule)
+                                                   for (name, rule) in self._rules.items()])
+        return state
+
+    def __setstate__(self, state):
+        state['_rules'] = collections.OrderedDict([(name, _constantsRulesByName[rule] if isinstance(rule, str) else rule)
+                                                   for (name, rule) in state['_rules'].items()])
+        self.__dict__.update(state)
+
+    def getSignature(self):
+        ''' returns a string identifying the enabled rules and their parameters '''
+        return hashlib.md5(repr((sorted(self._enabled), sorted(self.parameters.items())))).hexdigest()
+
+    def getRules(self, groups = None, dependent = True):
+        '''
+        returns the enabled rules in the order they are evaluated:
+        the highest rejection rate first, the dependent rules last
+        -- IN
+        groups : the groups of the rules, if None all of them (string[]) default: None
+        dependent : boolean that settles if the dependent rules are returned (boolean) default: True
+        -- OUT
+        rules : the rules (CleaningRules.Rule[])
+        '''
+        rules = [rule for rule in self._rules.values()
+                 if rule.name in self._enabled and (groups is None or rule.group in groups)
+                 and (dependent or not rule.dependent)]
+        return sorted(rules, key=lambda rule: (rule.dependent, -self.rejectionRates.get(rule.name, 0.0)))
+
+    def apply(self, dataframe, groups = None, dependent = True, rejected = None):
+        '''
+        applies the enabled rules to a dataframe and removes the rejected rows at once,
+        the dataframe is not modified
+        -- IN
+        dataframe : the dataframe to clean, with all the columns of the rules (pandas.Dataframe)
+        groups : the groups of the rules to apply, if None all of them (string[]) default: None
+        dependent : boolean that settles if the dependent rules are applied (boolean) default: True
+        rejected : dictionary filled with the positions of the rows rejected by each rule (see select) default: None
+        -- OUT
+        dataframe : the cleaned dataframe (pandas.Dataframe)
+        counts : the number of rows rejected by each rule in the order they were evaluated,
+            a row rejected by several rules is only counted for the first one ([(CleaningRules.Rule, int)])
+        '''
+        (kept, counts) = self.select(dataframe, groups, dependent, rejected=rejected)
+        return (dataframe.take(kept), counts)
+
+    def select(self, dataframe, groups = None, dependent = True, kept = None, rejected = None):
+        '''
+        evaluates the enabled rules on a dataframe as apply, but returns the positions of the kept rows
+        -- IN
+        dataframe : the dataframe to clean, with all the columns of the rules (pandas.Dataframe)
+        groups : the groups of the rules to apply, if None all of them (string[]) default: None
+        dependent : boolean that settles if the dependent rules are applied (boolean) default: True
+        kept : the positions of the rows already kept by the other rules, only the dependent rules
+            are then evaluated, if None all the rules are evaluated (numpy.ndarray of int) default: None
+        rejected : dictionary filled with the positions of the rows rejected by each evaluated rule,
+            a row rejected by several rules is only in the positions of the first one ({string:numpy.ndarray of int}) default: None
+        -- OUT
+        kept : the positions of the kept rows in increasing order (numpy.ndarray of int)
+        counts : the number of rows rejected by each rule in the order they were evaluated ([(CleaningRules.Rule, int)])
+        '''
+        rules = self.getRules(groups, dependent)
+        if kept is not None:
+            rules = [rule for rule in rules if rule.dependent]
+        values = dict([(column, dataframe[column].values) for rule in rules for column in rule.columns])
+        if len([rule for rule in rules if not rule.name in self.rejectionRates])>0:
+            self._estimateRates(values, rules, len(dataframe))
+            rules = [rule for rule in self.getRules(groups, dependent) if kept is None or rule.dependent]
+        if kept is None:
+            kept = np.arange(len(dataframe))
+        # the arrays of the columns restricted to the kept rows
+        keptValues = dict(values)
+        if len(kept)<len(dataframe):
+            keptValues = dict([(column, array[kept]) for (column, array) in values.items()])
+        counts = []
+        for rule in rules:
+            evaluated = len(kept)
+            if rule.dependent:
+                excluded = np.ones(len(dataframe), dtype=np.bool_)
+                excluded[kept] = False
+                test = np.asarray(rule.predicate(values, self.parameters, excluded), dtype=np.bool_)[kept]
+            else:
+                test = np.asarray(rule.predicate(keptValues, self.parameters), dtype=np.bool_)
+            count = np.count_nonzero(test)
+            if rejected is not None:
+                rejected[rule.name] = kept[test]
+            if count>0:
+                kept = kept[~test]
+                keptValues = dict([(column, array[~test]) for (column, array) in keptValues.items()])
+            self.rejectionRates[rule.name] = float(count)/max(evaluated, 1)
+            counts.append((rule, count))
+        return (kept, counts)
+
+    def _estimateRates(self, values, rules, length):
+        ''' estimates the rejection rates of the rules on evenly spaced rows '''
+        sample = np.unique(np.linspace(0, max(length-1, 0), min(length, Constants.clnRulesSampleSize)).astype(np.int64))
+        sampleValues = dict([(column, array[sample]) for (column, array) in values.items()])
+        for rule in rules:
+            if rule.dependent or len(sample)==0:
+                self.rejectionRates.setdefault(rule.name, 0.0)
+                continue
+            test = np.asarray(rule.predicate(sampleValues, self.parameters), dtype=np.bool_)
+            self.rejectionRates[rule.name] = float(np.count_nonzero(test))/len(sample)
+
+def _tooFewBills(values, parameters, rejected):
+    ''' returns the mask of the rows whose entreprise has at most clnIdMinimalBillsNumber bills not rejected '''
+    # the missing ids have the code 0
+    codes = pd.factorize(values['entrep_id'])[0]+1
+    nbBills = np.bincount(codes[~rejected], minlength=codes.max()+1)
+    return (nbBills[codes]<=parameters['clnIdMinimalBillsNumber']) & (codes>0)
+
+def _monthDiff(later, earlier):
+    ''' returns the number of months between two arrays of dates, the missing dates give -1 '''
+    delays = (later-earlier)/_monthLength
+    return np.where(np.isnan(delays), -1, np.floor(delays))
+
+# the thresholds of Constants used by the rules
+_constantsParameters = ["clnIdMinimalBillsNumber","clnIdMinimalIdValue","clnIdMaximalIdValue",
+                        "clnDateMonthDiff","clnDateMinimalDate","clnDateMaximalDate",
+                        "clnMontMinimalValue","clnMontMaximalValue"]
+
+# the rules enabled by the booleans of Constants
+_constantsRules = [
+    # - NaN date for datePiece, dateEcheance or dateDernierPaiement
+    # - Echeance or DernierPaiement date anterior to Piece
+    # - Time gap between Echeance or DernierPaiement and Piece larger than threshold
+    # - datePiece before minimal date or after maximal date
+    Rule("bclnDatePieceFormat", "dates", "wrong datePiece", ["datePiece"],
+         lambda v, p: pd.isnull(v['datePiece']), False),
+    Rule("bclnDateEcheanceFormat", "dates", "wrong dateEcheance", ["dateEcheance"],
+         lambda v, p: pd.isnull(v['dateEcheance']), False),
+    Rule("bclnDateDernierPaiementFormat", "dates", "wrong dateDernierPaiement", ["dateDernierPaiement"],
+         lambda v, p: pd.isnull(v['dateDernierPaiement']), False),
+    Rule("bclnDateInconsistent", "dates", "inconsistent dates", ["datePiece","dateEcheance","dateDernierPaiement"],
+         lambda v, p: (v['dateDernierPaiement']<v['datePiece']) | (v['dateEcheance']<v['datePiece']), False),
+    Rule("bclnDateMonthDiff", "dates", "too long delay", ["datePiece","dateEcheance","dateDernierPaiement"],
+         lambda v, p: (_monthDiff(v['dateDernierPaiement'], v['datePiece'])>p['clnDateMonthDiff'])
+                      | (_monthDiff(v['dateEcheance'], v['datePiece'])>p['clnDateMonthDiff']), False),
+    Rule("bclnDateMinimalDate", "dates", "datePiece too early", ["datePiece"],
+         lambda v, p: v['datePiece']<np.datetime64(p['clnDateMinimalDate']), False),
+    Rule("bclnDateMaximalDate", "dates", "datePiece too late", ["datePiece"],
+         lambda v, p: v['datePiece']>np.datetime64(p['clnDateMaximalDate']), False),
+    # - NaN, negative or zero montantPieceEur
+    # - montantPieceEur smaller than minimal montant or bigger than maximal montant
+    Rule("bclnMontantIntFormat", "montant", "wrong montant", ["montantPieceEur"],
+         lambda v, p: pd.isnull(v['montantPieceEur']), False),
+    Rule("bclnMontantNonNegativeValue", "montant", "negative montant", ["montantPieceEur"],
+         lambda v, p: v['montantPieceEur']<0, False),
+    Rule("bclnMontantNonZeroValue", "montant", "zero montant", ["montantPieceEur"],
+         lambda v, p: v['montantPieceEur']==0, False),
+    Rule("bclnMontMinimalValue", "montant", "montant too small", ["montantPieceEur"],
+         lambda v, p: v['montantPieceEur']<p['clnMontMinimalValue'], False),
+    Rule("bclnMontMaximalValue", "montant", "montant too big", ["montantPieceEur"],
+         lambda v, p: v['montantPieceEur']>p['clnMontMaximalValue'], False),
+    # - non-positive id, id smaller than the minimal id or bigger than the maximal id
+    # - entreprise with too few bills among the rows not rejected by the other rules
+    Rule("bclnIdIntFormat", "entrep_id", "wrong entrep_id", ["entrep_id"],
+         lambda v, p: v['entrep_id']<=0, False),
+    Rule("bclnIdMinimalIdValue", "entrep_id", "entrep_id too small", ["entrep_id"],
+         lambda v, p: v['entrep_id']<p['clnIdMinimalIdValue'], False),
+    Rule("bclnIdMaximalIdValue", "entrep_id", "entrep_id too big", ["entrep_id"],
+         lambda v, p: v['entrep_id']>p['clnIdMaximalIdValue'], False),
+    Rule("bclnIdMinimalBillsNumber", "entrep_id", "too few bills", ["entrep_id"],
+         _tooFewBills, True),
+    ]
+
+_constantsRulesByName = dict([(rule.name, rule) for rule in _constantsRules])
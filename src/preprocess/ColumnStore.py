@@ -0,0 +1,296 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module that stores pandas dataframes on the hard disk in a binary columnar format.
+Each column is saved in its own numpy .npy file, so that a stored dataframe
+is reloaded without any csv parsing and only the needed columns are read.
+Categorical columns are stored as their integer codes plus their categories.
+
+Layout of a store directory:
+- columns.txt : one line per column "name<tab>kind" with kind in ["array","category"]
+- index.npy : the index of the dataframe
+- col_<i>.npy : the values (or the codes) of the i-th column
+- col_<i>_categories.npy : the categories of the i-th column if it is categorical
+- col_<i>_part<k>.npy : the k-th block of values appended to the i-th column if it is an object column
+
+=== functions :
+saveColumns(dataframe, directory) : writes a dataframe into a store directory
+appendColumns(dataframe, directory) : appends the rows of a dataframe at the end of a store
+loadColumns(directory, usecols, mmap) : reads a dataframe (or some of its columns) from a store directory
+getColumnNames(directory) : returns the names of the columns of a store
+getStoreSize(directory) : returns the size in bytes of a store
+isStore(directory) : checks if a directory contains a complete store
+'''
+
+import io
+import os
+import shutil
+
+import numpy as np
+import pandas as pd
+try:
+    # private api of pandas, only used to keep the memory-mapped columns without copy (see _buildMappedFrame)
+    from pandas.core.internals import BlockManager, make_block
+except ImportError:
+    (BlockManager, make_block) = (None, None)
+
+
+def saveColumns(dataframe, directory):
+    '''
+    function that writes a dataframe into a store directory.
+    The store is first written in a temporary directory then renamed,
+    so that an interrupted writing never leaves an incomplete store.
+    An existing store in the directory is replaced.
+    -- IN
+    dataframe : the dataframe to store (pandas.Dataframe)
+    directory : the path of the store directory (string)
+    -- OUT
+    flag : boolean that settles if everything was successful (True: no problem, False: an error occured)
+    '''
+    tmpDirectory = directory+".tmp"
+    try:
+        if os.path.isdir(tmpDirectory):
+            shutil.rmtree(tmpDirectory)
+        os.makedirs(tmpDirectory)
+        np.save(os.path.join(tmpDirectory, "index.npy"), np.asarray(dataframe.index.values))
+        with open(os.path.join(tmpDirectory, "columns.txt"), "w") as fichier:
+            for i, column in enumerate(dataframe.columns):
+                serie = dataframe[column]
+                if str(serie.dtype)=="category":
+                    np.save(os.path.join(tmpDirectory, "col_"+str(i)+".npy"), serie.cat.codes.values)
+                    np.save(os.path.join(tmpDirectory, "col_"+str(i)+"_categories.npy"), np.asarray(serie.cat.categories.values))
+                    fichier.write(str(column)+"\tcategory\n")
+                else:
+                    np.save(os.path.join(tmpDirectory, "col_"+str(i)+".npy"), serie.values)
+                    fichier.write(str(column)+"\tarray\n")
+        if os.path.isdir(directory):
+            shutil.rmtree(directory)
+        os.rename(tmpDirectory, directory)
+    except Exception as e:
+        print "error : impossible to store the dataframe in",directory,":",e
+        if os.path.isdir(tmpDirectory):
+            shutil.rmtree(tmpDirectory, ignore_errors=True)
+        return False
+    return True
+
+def appendColumns(dataframe, directory):
+    '''
+    function that appends the rows of a dataframe at the end of a store,
+    the dataframe must have the columns of the store in the same order.
+    Only the new rows are written at the end of the files, the rows of the object columns
+    in a new part of the column, except for the columns whose type must change (wider types) which are rewritten.
+    The dataframes already read with memory mapping are not modified.
+    If an error occurs, the store may be incomplete and must be saved again.
+    -- IN
+    dataframe : the rows to append (pandas.Dataframe)
+    directory : the path of the store directory (string)
+    -- OUT
+    flag : boolean that settles if everything was successful (True: no problem, False: an error occured)
+    '''
+    columns = _readColumnsFile(directory)
+    if columns is None:
+        return False
+    if [name for (name, _, _) in columns]!=[str(column) for column in dataframe.columns]:
+        print "error : the columns of the dataframe are not the ones of the store",directory
+        return False
+    try:
+        _appendArray(os.path.join(directory, "index.npy"), np.asarray(dataframe.index.values))
+        for (name, kind, i) in columns:
+            serie = dataframe[name]
+            filename = os.path.join(directory, "col_"+str(i)+".npy")
+            if kind=="category":
+                categoriesFilename = os.path.join(directory, "col_"+str(i)+"_categories.npy")
+                categories = pd.Index(np.load(categoriesFilename, allow_pickle=True))
+                # the new categories are added at the end, so that the stored codes are still valid
+                newCategories = pd.Index(pd.unique(serie.dropna().values)).difference(categories)
+                if len(newCategories)>0:
+                    categories = categories.append(newCategories)
+                    _saveArray(categoriesFilename, np.asarray(categories.values))
+                codes = pd.Categorical(serie, categories=categories).codes
+                _appendArray(filename, codes)
+            else:
+                _appendArray(filename, np.asarray(serie.values))
+    except Exception as e:
+        print "error : impossible to append the dataframe to the store",directory,":",e
+        return False
+    return True
+
+def loadColumns(directory, usecols = None, mmap = False):
+    '''
+    function that reads a dataframe from a store directory
+    -- IN
+    directory : the path of the store directory (string)
+    usecols : an array containing the name of the columns to read, if None read all (string[]) default: None
+    mmap : boolean that settles if the numeric columns are memory-mapped instead of read,
+        the pages are copied on write so the dataframe can still be modified (boolean) default: False
+    -- OUT
+    dataframe : the stored dataframe (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    columns = _readColumnsFile(directory)
+    if columns is None:
+        return None
+    if usecols is None:
+        usecols = [name for (name, _, _) in columns]
+    try:
+        index = _loadArray(os.path.join(directory, "index.npy"), mmap)
+        data = {}
+        for (name, kind, i) in columns:
+            if not name in usecols:
+                continue
+            data[name] = _loadColumn(directory, kind, i, mmap)
+        missing = [name for name in usecols if not name in data]
+        if len(missing)>0:
+            print "error : missing columns in the store",directory,":",missing
+            return None
+        if mmap:
+            return _buildMappedFrame(data, index, usecols)
+        return pd.DataFrame(data, index=index, columns=usecols)
+    except Exception as e:
+        print "error : impossible to read the store",directory,":",e
+        return None
+
+def getColumnNames(directory):
+    '''
+    function that returns the names of the columns of a store
+    -- IN
+    directory : the path of the store directory (string)
+    -- OUT
+    names : the names of the columns (string[])
+    returns None if an error occurs
+    '''
+    columns = _readColumnsFile(directory)
+    if columns is None:
+        return None
+    return [name for (name, _, _) in columns]
+
+def getStoreSize(directory):
+    '''
+    function that returns the size of a store on the hard disk
+    -- IN
+    directory : the path of the store directory (string)
+    -- OUT
+    size : the size of all the files of the store in bytes (int)
+    '''
+    size = 0
+    for root, _, files in os.walk(directory):
+        for f in files:
+            size += os.path.getsize(os.path.join(root, f))
+    return size
+
+def isStore(directory):
+    '''
+    function that checks if a directory contains a complete store
+    -- IN
+    directory : the path of the directory (string)
+    -- OUT
+    b : True if the store can be read (boolean)
+    '''
+    return os.path.isfile(os.path.join(directory, "columns.txt")) \
+        and os.path.isfile(os.path.join(directory, "index.npy"))
+
+def _readColumnsFile(directory):
+    ''' reads the columns.txt file of a store and returns a list of (name, kind, position) '''
+    try:
+        columns = []
+        with open(os.path.join(directory, "columns.txt"), "r") as fichier:
+            for i, line in enumerate(fichier):
+                (name, kind) = line[:-1].split("\t")
+                columns.append((name, kind, i))
+        return columns
+    except:
+        print "error : non-existing store :",directory
+        return None
+
+def _loadColumn(directory, kind, i, mmap):
+    ''' reads the i-th column of a store as an array or a categorical '''
+    values = _loadArray(os.path.join(directory, "col_"+str(i)+".npy"), mmap)
+    if kind=="category":
+        categories = _loadArray(os.path.join(directory, "col_"+str(i)+"_categories.npy"), False)
+        return pd.Categorical.from_codes(values, categories)
+    return values
+
+def _loadArray(filename, mmap):
+    ''' reads a npy file and the parts appended to it, object arrays can't be memory-mapped '''
+    parts = _getPartFilenames(filename)
+    if len(parts)>0:
+        return np.concatenate([np.load(part, allow_pickle=True) for part in [filename]+parts])
+    if mmap:
+        try:
+            return np.load(filename, mmap_mode='c')
+        except ValueError:
+            pass
+    return np.load(filename, allow_pickle=True)
+
+def _appendArray(filename, values):
+    ''' appends values at the end of a one-dimensional npy file, in place if the type of the file allows it '''
+    with open(filename, "rb") as fichier:
+        version = np.lib.format.read_magic(fichier)
+        if version==(1, 0):
+            (shape, fortranOrder, dtype) = np.lib.format.read_array_header_1_0(fichier)
+        else:
+            (shape, fortranOrder, dtype) = np.lib.format.read_array_header_2_0(fichier)
+        headerLength = fichier.tell()
+    if len(shape)==1 and dtype.hasobject:
+        # an object array is pickled, the values are written in a new part instead of rewriting the file
+        np.save(_getPartFilename(filename, len(_getPartFilenames(filename))+1), np.asarray(values, dtype=object))
+        return
+    if len(shape)==1 and np.can_cast(values.dtype, dtype, casting="safe"):
+        header = io.BytesIO()
+        descriptor = {'descr':np.lib.format.dtype_to_descr(dtype), 'fortran_order':False, 'shape':(shape[0]+len(values),)}
+        if version==(1, 0):
+            np.lib.format.write_array_header_1_0(header, descriptor)
+        else:
+            np.lib.format.write_array_header_2_0(header, descriptor)
+        if len(header.getvalue())==headerLength:
+            with open(filename, "r+b") as fichier:
+                fichier.seek(0, os.SEEK_END)
+                fichier.write(np.ascontiguousarray(values, dtype=dtype).tostring())
+                fichier.seek(0)
+                fichier.write(header.getvalue())
+            return
+    # the file must be rewritten
+    stored = np.load(filename, allow_pickle=True)
+    _saveArray(filename, np.concatenate([stored, values]))
+
+def _getPartFilename(filename, k):
+    ''' returns the name of the k-th part appended to a npy file '''
+    return filename[:-len(".npy")]+"_part"+str(k)+".npy"
+
+def _getPartFilenames(filename):
+    ''' returns the names of the parts appended to a npy file, in their order '''
+    parts = []
+    while os.path.isfile(_getPartFilename(filename, len(parts)+1)):
+        parts.append(_getPartFilename(filename, len(parts)+1))
+    return parts
+
+def _saveArray(filename, values):
+    ''' writes a npy file in a new file, so that the arrays memory-mapped on the old one stay valid '''
+    np.save(filename+".tmp.npy", values)
+    os.rename(filename+".tmp.npy", filename)
+
+def _buildMappedFrame(data, index, columns):
+    '''
+    builds a dataframe with one block per column, so that pandas doesn't
+    copy the memory-mapped columns of the same type into a single block.
+    The blocks are made with the internals of pandas, if they are not available
+    or if they changed, the dataframe is built with the public constructor which copies the columns
+    '''
+    try:
+        return _buildBlockFrame(data, index, columns)
+    except Exception:
+        return pd.DataFrame(data, index=index, columns=columns)
+
+def _buildBlockFrame(data, index, columns):
+    ''' builds a dataframe from one block per column with the internals of pandas '''
+    blocks = []
+    for (i, name) in enumerate(columns):
+        values = data[name]
+        if isinstance(values, np.ndarray):
+            blocks.append(make_block(values.reshape(1, -1), placement=[i]))
+        else:
+            blocks.append(make_block(values, placement=[i], ndim=2))
+    return pd.DataFrame(BlockManager(blocks, [pd.Index(columns), pd.Index(index)]))
@@ -12,6 +12,7 @@ Convention :
 '''
 
 import datetime
+import os
 import numpy as np
 
 
@@ -27,6 +28,81 @@ dtype = {"entrep_id":np.int32,
          "dateInsert":np.str}
 
 
+### About the FTP transfers
+# number of rows of each dataframe chunk produced by the streaming download
+ftpStreamChunkSize = 500000
+# size in bytes of the blocks requested to the ftp server
+ftpStreamBlockSize = 65536
+# maximal number of decompressed blocks waiting for the csv parser
+# the memory used by a streaming download is bounded by blockSize*maxBufferedBlocks
+ftpStreamMaxBufferedBlocks = 64
+# number of rows converted into csv lines at a time by the upload
+ftpUploadChunkSize = 100000
+# compression level of the uploaded files, from 1 (fastest) to 9 (smallest)
+ftpCompressionLevel = 6
+# number of times an interrupted transfer is resumed before giving up
+ftpNbRetries = 5
+# delay in seconds before the first resumption, doubled at each new attempt
+ftpRetryDelay = 2
+# directory of the downloaded files and of the partial files of the interrupted transfers
+ftpDownloadDirectory = os.path.join("..","..","ftpDownloads")
+
+
+### About the FTP connection pool
+# maximal number of idle connections kept authenticated in the pool
+ftpPoolMaxSize = 4
+# time in seconds after which an idle connection is closed instead of being reused
+ftpPoolMaxIdleTime = 240
+
+
+### About the FTP cache
+# boolean that settles if the dataframes downloaded from the ftp server are cached on the hard disk
+bftpCache = True
+# directory of the cache, relative to the preprocess directory
+ftpCacheDirectory = os.path.join("..","..","ftpCache")
+# maximal size of the cache in MB, the least recently used files are removed beyond it
+ftpCacheMaxSize = 4000
+
+
+### About the snapshot of the cleaned BalAG dataframe
+# directory of the snapshot, relative to the preprocess directory
+snapshotDirectory = os.path.join("..","..","cameliaBalAGKevin")
+# csv export of the cleaned dataframe, relative to the preprocess directory
+cleanedCsvFilename = os.path.join("..","..","cameliaBalAGKevin.csv")
+# types of the columns in the snapshot, the other text columns are stored as categories
+snapshotDtype = {"entrep_id":np.uint32,
+                 "montantPieceEur":np.int32,
+                 "montantLitige":np.int32,
+                 "paidBill":np.bool_}
+# columns stored as datetime64
+snapshotDateColumns = ["datePiece","dateEcheance","dateDernierPaiement"]
+# directory of the audits of the cleanings saved with the snapshot (see CleaningAudit), relative to the preprocess directory
+auditDirectory = os.path.join("..","..","cameliaBalAGAudit")
+
+
+### About the incremental cleaning of the BalAG dataframe
+# directory of the cleaned rows and of the watermark of the last update, relative to the preprocess directory
+incrementalDirectory = os.path.join("..","..","cameliaBalAGIncremental")
+
+
+### About the cleaning of the BalAG dataframe by chunks
+# directory of the rows cleaned by chunks, relative to the preprocess directory
+chunkDirectory = os.path.join("..","..","cameliaBalAGChunks")
+
+
+### About the store of the features by entreprise
+# directory of the features by entreprise (see FeatureStore), relative to the preprocess directory
+featureStoreDirectory = os.path.join("..","..","cameliaFeatures")
+# year of the first bit of the sets of years of the features, the sets hold 64 years
+featureFirstYear = 1990
+
+
+### About the conversion of the dates
+# maximal number of distinct date strings kept parsed in memory by Utils.parseIsoDatesCached,
+# the cache is emptied beyond it
+dateCacheMaxSize = 200000
+
+
 ### About printing graphs
 # label by month
 labelByMonth = ['Jan','Feb','Mar','Apr','May','Jun','Jul','Aug','Sep','Oct','Nov','Dec']
@@ -111,6 +187,12 @@ clnMontMaximalValue = 500000
 bclnMontantLitigeNonZero = False
 
 
+### CLEANING RULES
+# number of rows on which the rejection rates of the rules are estimated
+# to order them before the first cleaning (see CleaningRules)
+clnRulesSampleSize = 10000
+
+
 ### ANALYSING DATES
 # boolean settling if we analyse mean, var and median or just mean (changes the computation time)
 banaDateLargeAnalysis = False
@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing an index of the entreprises shared by the BalAG, Etab and Scores dataframes,
+built once from the cleaned BalAG and reused by every operation across the files:
+- the sorted unique entrep_id of the reference dataframe, so that the membership of the ids
+    of another file is a binary search, or a lookup in a table indexed by the ids when they are dense
+- for each registered dataframe, the order of its rows sorted by entrep_id
+    and the offsets of the rows of each entreprise in this order,
+    so that the rows of some entreprises are found without scanning the dataframe
+- the left joins on entrep_id are then lookups of the sorted ids,
+    or of a table indexed by the ids, instead of hash joins of pandas.merge
+    (the joins on (entrep_id, year) with the scores are made by ScoreLookup)
+
+=== functions :
+fromDataFrame(dataframe) : creates the index of the entreprises of a dataframe
+'''
+
+import numpy as np
+import pandas as pd
+
+
+# the tables indexed by the ids or by the keys are used when they are at most
+# this number of times bigger than the ids or the rows
+denseMembershipRatio = 64
+
+
+def fromDataFrame(dataframe):
+    '''
+    function that creates the index of the entreprises of a dataframe, usually the cleaned BalAG
+    -- IN
+    dataframe : dataframe with a column entrep_id (pandas.Dataframe)
+    -- OUT
+    index : the index of the entreprises (EntrepriseIndex.EntrepriseIndex)
+    '''
+    return EntrepriseIndex(dataframe['entrep_id'].values)
+
+class EntrepriseIndex(object):
+    '''
+    sorted unique ids of entreprises and rows of the registered dataframes sorted by id
+    '''
+    def __init__(self, entrepIds):
+        '''
+        -- IN
+        entrepIds : the ids of the entreprises, in any order and with duplicates (int[])
+        '''
+        self.ids = np.unique(np.asarray(entrepIds, dtype=np.int64))
+        # the rows of the registered dataframes {name:{string:value}}
+        self._frames = {}
+        # position of each id in a table indexed by the ids, built if the ids are dense
+        self._table = None
+        if len(self.ids)>0 and self.ids[0]>=0 and self.ids[-1]<denseMembershipRatio*len(self.ids):
+            self._table = np.zeros(self.ids[-1]+1, dtype=np.int64)-1
+            self._table[self.ids] = np.arange(len(self.ids))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def getPositions(self, entrepIds):
+        '''
+        returns the position of each id in the sorted unique ids, -1 for the unknown ids
+        -- IN
+        entrepIds : the ids (int[])
+        -- OUT
+        positions : the positions (numpy.ndarray of int64)
+        '''
+        entrepIds = np.asarray(entrepIds, dtype=np.int64)
+        if len(self.ids)==0:
+            return np.zeros(len(entrepIds), dtype=np.int64)-1
+        if self._table is not None:
+            return _takeFromTable(self._table, entrepIds)
+        positions = np.minimum(np.searchsorted(self.ids, entrepIds), len(self.ids)-1)
+        positions[self.ids[positions]!=entrepIds] = -1
+        return positions
+
+    def contains(self, entrepIds):
+        '''
+        returns the mask of the ids of the index
+        -- IN
+        entrepIds : the ids (int[])
+        -- OUT
+        mask : boolean for each id (numpy.ndarray of bool)
+        '''
+        return self.getPositions(entrepIds)>=0
+
+    def addFrame(self, name, dataframe):
+        '''
+        registers the rows of a dataframe sorted by entrep_id,
+        the rows of the entreprises out of the index are left aside
+        -- IN
+        name : the name of the dataframe in the index (string)
+        dataframe : dataframe with a column entrep_id (pandas.Dataframe)
+        '''
+        codes = self.getPositions(dataframe['entrep_id'].values)
+        rows = np.flatnonzero(codes>=0)
+        order = rows[np.argsort(codes[rows], kind='mergesort')]
+        sortedCodes = codes[order]
+        frame = {"order":order, "sortedCodes":sortedCodes,
+                 # the rows of the entreprise of position i are order[offsets[i]:offsets[i+1]]
+                 "offsets":np.searchsorted(sortedCodes, np.arange(len(self.ids)+1)),
+                 "table":None}
+        if len(self.ids)<denseMembershipRatio*max(len(order), 1):
+            # the first row of each entreprise in a table indexed by the positions of the ids
+            firsts = np.flatnonzero(np.concatenate(([True], sortedCodes[1:]!=sortedCodes[:-1]))) if len(order)>0 else order
+            frame["table"] = np.zeros(len(self.ids), dtype=np.int64)-1
+            frame["table"][sortedCodes[firsts]] = order[firsts]
+        self._frames[name] = frame
+
+    def getRows(self, name, entrepIds):
+        '''
+        returns the positions of the rows of a registered dataframe of some entreprises
+        -- IN
+        name : the name of the dataframe in the index (string)
+        entrepIds : the ids of the entreprises (int[])
+        -- OUT
+        rows : the positions of the rows, grouped by entreprise in the order of the ids (numpy.ndarray of int64)
+        '''
+        frame = self._frames[name]
+        codes = self.getPositions(entrepIds)
+        codes = codes[codes>=0]
+        starts = frame["offsets"][codes]
+        lengths = frame["offsets"][codes+1]-starts
+        nonEmpty = lengths>0
+        (starts, lengths) = (starts[nonEmpty], lengths[nonEmpty])
+        if len(lengths)==0:
+            return np.zeros(0, dtype=np.int64)
+        # consecutive positions in each range
+        steps = np.ones(lengths.sum(), dtype=np.int64)
+        steps[0] = starts[0]
+        steps[np.cumsum(lengths)[:-1]] = starts[1:]-(starts[:-1]+lengths[:-1]-1)
+        return frame["order"][np.cumsum(steps)]
+
+    def lookup(self, name, entrepIds):
+        '''
+        returns for each id the position of the first matching row of a registered dataframe,
+        found in a table indexed by the positions of the ids or by binary search in the sorted ids
+        -- IN
+        name : the name of the dataframe in the index (string)
+        entrepIds : the ids of the entreprises (int[])
+        -- OUT
+        rows : the position of the matching row, -1 if there is none (numpy.ndarray of int64)
+        '''
+        frame = self._frames[name]
+        codes = self.getPositions(entrepIds)
+        if frame["table"] is not None:
+            return _takeFromTable(frame["table"], codes)
+        (order, sortedCodes) = (frame["order"], frame["sortedCodes"])
+        rows = np.zeros(len(codes), dtype=np.int64)-1
+        if len(sortedCodes)==0:
+            return rows
+        positions = np.minimum(np.searchsorted(sortedCodes, codes), len(sortedCodes)-1)
+        found = (sortedCodes[positions]==codes)&(codes>=0)
+        rows[found] = order[positions[found]]
+        return rows
+
+    def join(self, left, right, name):
+        '''
+        left join of a dataframe with a registered dataframe on entrep_id,
+        as pandas.merge(left, right, on='entrep_id', how='left') when the ids of right are unique:
+        the rows of left keep their order, the columns of right are added,
+        with missing values for the rows without a match
+        -- IN
+        left : dataframe with a column entrep_id (pandas.Dataframe)
+        right : the registered dataframe (pandas.Dataframe)
+        name : the name of right in the index (string)
+        -- OUT
+        dataframe : the joined dataframe, with a new index (pandas.Dataframe)
+        '''
+        rows = self.lookup(name, left['entrep_id'].values)
+        missing = rows<0
+        dataframe = pd.DataFrame(dict([(column, left[column].values) for column in left.columns]), columns=list(left.columns))
+        for column in right.columns:
+            if column=='entrep_id':
+                continue
+            if len(right)>0:
+                values = right[column].values.take(np.maximum(rows, 0))
+            else:
+                values = np.zeros(len(rows), dtype=right[column].dtype)
+            if missing.any():
+                # the missing values are NaN as with pandas.merge
+                if values.dtype.kind in "iub":
+                    values = values.astype(np.float64)
+                if values.dtype.kind=="M":
+                    values[missing] = np.datetime64("NaT")
+                elif values.dtype.kind=="O":
+                    values[missing] = None
+                else:
+                    values[missing] = np.nan
+            dataframe[column] = values
+        return dataframe
+
+def _takeFromTable(table, keys):
+    ''' returns the values of a table for some keys, -1 for the keys out of the table '''
+    inside = (keys>=0)&(keys<len(table))
+    if inside.all():
+        return table[keys]
+    values = np.zeros(len(keys), dtype=table.dtype)-1
+    values[inside] = table[keys[inside]]
+    return values
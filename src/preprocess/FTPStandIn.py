@@ -0,0 +1,355 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing a local stand-in for the remote FTP server,
+so that the functions of FTPTools can be tested and measured offline.
+The stand-in serves the files of a local directory and implements
+the commands used by ftplib: login, passive transfers, RETR, STOR, REST, SIZE and MDTM.
+If a certificate is given, the control and data connections are secured
+with TLS (AUTH TLS, PBSZ, PROT P), as on the remote server.
+The stand-in can also drop the data connections in the middle of the transfers,
+to reproduce a flaky link.
+
+The fixtures served by the stand-in are produced by the module SyntheticData.
+
+=== functions :
+startStandIn(rootDirectory, host, port, user, password, certfile) : starts a stand-in server in a background thread
+stopStandIn(server) : stops a stand-in server
+useStandIn(server) : makes FTPTools connect to a stand-in server instead of the remote server
+dropTransfers(server, nbDrops, dropAfter) : makes the next transfers of a stand-in server fail
+'''
+
+import datetime
+import os
+import socket
+import SocketServer
+import ssl
+import threading
+
+import FTPTools
+
+
+def startStandIn(rootDirectory, host = "127.0.0.1", port = 0, user = "standin", password = "standin", certfile = None):
+    '''
+    function that starts a stand-in server in a background thread
+    -- IN
+    rootDirectory : the local directory containing the served files (string)
+    host : the address the server listens to (string) default: "127.0.0.1"
+    port : the port the server listens to, 0 for any free port (int) default: 0
+    user : the user name accepted by the server (string) default: "standin"
+    password : the password accepted by the server (string) default: "standin"
+    certfile : a pem file containing the certificate and the private key of the server,
+        if None the connections are not secured (string) default: None
+    -- OUT
+    server : the running server (FTPStandIn.StandInServer)
+    returns None if an error occurs
+    '''
+    if not os.path.isdir(rootDirectory):
+        print "error : non-existing directory :",rootDirectory
+        return None
+    try:
+        server = StandInServer((host, port), rootDirectory, user, password, certfile)
+    except socket.error as e:
+        print "error : impossible to start the stand-in server :",e
+        return None
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+def stopStandIn(server):
+    '''
+    function that stops a stand-in server
+    -- IN
+    server : the server returned by startStandIn (FTPStandIn.StandInServer)
+    -- OUT
+    returns nothing
+    '''
+    FTPTools.closeFtpPool()
+    server.shutdown()
+    server.server_close()
+
+def useStandIn(server):
+    '''
+    function that makes FTPTools connect to a stand-in server,
+    FTPTools.setAccount() restores the remote server
+    -- IN
+    server : the server returned by startStandIn (FTPStandIn.StandInServer)
+    -- OUT
+    returns nothing
+    '''
+    (host, port) = server.server_address
+    FTPTools.setAccount((server.user, server.password, host, port), secure=server.certfile is not None)
+
+def dropTransfers(server, nbDrops = 1, dropAfter = 0):
+    '''
+    function that makes the next transfers of a stand-in server fail:
+    the data connections are closed after some bytes were sent
+    -- IN
+    server : the server returned by startStandIn (FTPStandIn.StandInServer)
+    nbDrops : number of transfers that will fail (int) default: 1
+    dropAfter : number of bytes sent before the data connection is closed (int) default: 0
+    -- OUT
+    returns nothing
+    '''
+    with server.lock:
+        server.nbDrops = nbDrops
+        server.dropAfter = dropAfter
+
+class StandInServer(SocketServer.ThreadingMixIn, SocketServer.TCPServer):
+    '''
+    threaded server handling one control connection per thread
+    '''
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, address, rootDirectory, user, password, certfile):
+        SocketServer.TCPServer.__init__(self, address, _StandInHandler)
+        self.rootDirectory = os.path.abspath(rootDirectory)
+        self.user = user
+        self.password = password
+        self.certfile = certfile
+        self.lock = threading.Lock()
+        self.nbDrops = 0
+        self.dropAfter = 0
+
+    def takeDrop(self):
+        ''' returns the number of bytes after which the current transfer is dropped, None if it is not '''
+        with self.lock:
+            if self.nbDrops<=0:
+                return None
+            self.nbDrops -= 1
+            return self.dropAfter
+
+class _StandInHandler(SocketServer.StreamRequestHandler):
+    '''
+    handler of a control connection, each command XXX is handled by the method ftp_XXX
+    '''
+    blockSize = 65536
+
+    def handle(self):
+        self.authenticated = False
+        self.userName = None
+        self.protected = False
+        self.restOffset = 0
+        self.passiveSocket = None
+        self.reply("220 stand-in FTP server ready")
+        try:
+            while True:
+                line = self.rfile.readline()
+                if not line:
+                    break
+                (command, _, argument) = line.rstrip("\r\n").partition(" ")
+                command = command.upper()
+                method = getattr(self, "ftp_"+command, None)
+                if method is None:
+                    self.reply("502 command not implemented")
+                    continue
+                if not self.authenticated and not command in ["USER","PASS","AUTH","PBSZ","PROT","SYST","QUIT"]:
+                    self.reply("530 not logged in")
+                    continue
+                if method(argument) is False:
+                    break
+        except (socket.error, ssl.SSLError):
+            pass
+        finally:
+            self.closePassiveSocket()
+
+    def reply(self, message):
+        self.wfile.write(message+"\r\n")
+        self.wfile.flush()
+
+    def getPath(self, argument):
+        ''' returns the local path of a remote filename, None if it is outside of the root directory '''
+        path = os.path.normpath(os.path.join(self.server.rootDirectory, argument.lstrip("/")))
+        if not path.startswith(self.server.rootDirectory+os.sep):
+            return None
+        return path
+
+    def closePassiveSocket(self):
+        if self.passiveSocket is not None:
+            self.passiveSocket.close()
+            self.passiveSocket = None
+
+    def openDataConnection(self):
+        ''' accepts the data connection on the passive socket '''
+        if self.passiveSocket is None:
+            return None
+        try:
+            (connection, _) = self.passiveSocket.accept()
+        except socket.error:
+            return None
+        finally:
+            self.closePassiveSocket()
+        if self.protected:
+            connection = ssl.wrap_socket(connection, server_side=True, certfile=self.server.certfile)
+        return connection
+
+    def closeDataConnection(self, connection):
+        try:
+            if isinstance(connection, ssl.SSLSocket):
+                connection = connection.unwrap()
+        except (socket.error, ssl.SSLError):
+            pass
+        connection.close()
+
+    # login and security commands
+    def ftp_USER(self, argument):
+        self.userName = argument
+        self.reply("331 password required")
+
+    def ftp_PASS(self, argument):
+        if self.userName==self.server.user and argument==self.server.password:
+            self.authenticated = True
+            self.reply("230 logged in")
+        else:
+            self.reply("530 wrong user or password")
+
+    def ftp_AUTH(self, argument):
+        if self.server.certfile is None or not argument.upper() in ["TLS","SSL"]:
+            self.reply("504 security mechanism not available")
+            return
+        self.reply("234 AUTH "+argument.upper()+" successful")
+        self.connection = ssl.wrap_socket(self.request, server_side=True, certfile=self.server.certfile)
+        self.rfile = self.connection.makefile("rb", -1)
+        self.wfile = self.connection.makefile("wb", 0)
+
+    def ftp_PBSZ(self, argument):
+        self.reply("200 PBSZ=0")
+
+    def ftp_PROT(self, argument):
+        if argument.upper()=="P" and self.server.certfile is not None:
+            self.protected = True
+            self.reply("200 protection level set to P")
+        elif argument.upper()=="C":
+            self.protected = False
+            self.reply("200 protection level set to C")
+        else:
+            self.reply("536 protection level not supported")
+
+    def ftp_QUIT(self, argument):
+        self.reply("221 goodbye")
+        return False
+
+    # information commands
+    def ftp_SYST(self, argument):
+        self.reply("215 UNIX Type: L8")
+
+    def ftp_NOOP(self, argument):
+        self.reply("200 NOOP ok")
+
+    def ftp_TYPE(self, argument):
+        self.reply("200 type set to "+argument)
+
+    def ftp_PWD(self, argument):
+        self.reply('257 "/" is the current directory')
+
+    def ftp_SIZE(self, argument):
+        path = self.getPath(argument)
+        if path is None or not os.path.isfile(path):
+            self.reply("550 no such file")
+            return
+        self.reply("213 "+str(os.path.getsize(path)))
+
+    def ftp_MDTM(self, argument):
+        path = self.getPath(argument)
+        if path is None or not os.path.isfile(path):
+            self.reply("550 no such file")
+            return
+        modification = datetime.datetime.utcfromtimestamp(os.path.getmtime(path))
+        self.reply("213 "+modification.strftime("%Y%m%d%H%M%S"))
+
+    # transfer commands
+    def ftp_PASV(self, argument):
+        self.closePassiveSocket()
+        self.passiveSocket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.passiveSocket.bind((self.server.server_address[0], 0))
+        self.passiveSocket.listen(1)
+        self.passiveSocket.settimeout(30)
+        (host, port) = self.passiveSocket.getsockname()
+        self.reply("227 Entering Passive Mode ("+host.replace(".",",")+","+str(port//256)+","+str(port%256)+")")
+
+    def ftp_REST(self, argument):
+        try:
+            self.restOffset = int(argument)
+        except ValueError:
+            self.reply("501 invalid offset")
+            return
+        self.reply("350 restarting at "+argument)
+
+    def ftp_RETR(self, argument):
+        offset = self.restOffset
+        self.restOffset = 0
+        path = self.getPath(argument)
+        if path is None or not os.path.isfile(path):
+            self.closePassiveSocket()
+            self.reply("550 no such file")
+            return
+        self.reply("150 opening data connection")
+        connection = self.openDataConnection()
+        if connection is None:
+            self.reply("425 can't open data connection")
+            return
+        dropAfter = self.server.takeDrop()
+        sent = 0
+        try:
+            with open(path, "rb") as fichier:
+                fichier.seek(offset)
+                while True:
+                    data = fichier.read(self.blockSize)
+                    if not data:
+                        break
+                    if dropAfter is not None and sent+len(data)>dropAfter:
+                        connection.sendall(data[:max(dropAfter-sent,0)])
+                        # closing without any TLS shutdown, as a dropped link
+                        connection.close()
+                        self.reply("426 connection closed, transfer aborted")
+                        return
+                    connection.sendall(data)
+                    sent += len(data)
+        except (socket.error, ssl.SSLError):
+            connection.close()
+            self.reply("426 connection closed, transfer aborted")
+            return
+        self.closeDataConnection(connection)
+        self.reply("226 transfer complete")
+
+    def ftp_STOR(self, argument):
+        offset = self.restOffset
+        self.restOffset = 0
+        path = self.getPath(argument)
+        if path is None or not os.path.isdir(os.path.dirname(path)):
+            self.closePassiveSocket()
+            self.reply("553 impossible to create the file")
+            return
+        self.reply("150 opening data connection")
+        connection = self.openDataConnection()
+        if connection is None:
+            self.reply("425 can't open data connection")
+            return
+        try:
+            with open(path, "r+b" if offset>0 and os.path.isfile(path) else "wb") as fichier:
+                fichier.seek(offset)
+                fichier.truncate()
+                while True:
+                    data = connection.recv(self.blockSize)
+                    if not data:
+                        break
+                    fichier.write(data)
+        except (socket.error, ssl.SSLError):
+            connection.close()
+            self.reply("426 connection closed, transfer aborted")
+            return
+        self.closeDataConnection(connection)
+        self.reply("226 transfer complete")
+
+    def ftp_DELE(self, argument):
+        path = self.getPath(argument)
+        if path is None or not os.path.isfile(path):
+            self.reply("550 no such file")
+            return
+        os.remove(path)
+        self.reply("250 file removed")
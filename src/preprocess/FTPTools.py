@@ -13,23 +13,69 @@ but with several configurations Chilkat must be use instead.
 
 List of functions:
 getAccount() : retrieve the information necessary to connect to the ftp server
-retrieveFtplib(filename, compression, usecols, dtype) : download, decompress and extract a pandas dataframe using FTPLib
+setAccount(account, secure) : replace the account of the ftp server, for instance by a local stand-in
+connectFtplib(toPrint) : open an authenticated and secured connection to the ftp server using FTPLib
+retrieveFtplib(filename, compression, usecols, dtype, chunkFilter) : download, decompress and extract a pandas dataframe using FTPLib
+downloadFtplib(filename, localFilename) : download a remote file to the hard disk, resuming the interrupted transfers
+retrieveLazyFtplib(filename, compression, dtype) : retrieve a remote file as a LazyFrame reading its columns from the cache on demand
+retrieveMultipleFtplib(specs, nbWorkers, chunkFilters) : retrieve several remote files concurrently using FTPLib
+streamFtplib(filename, compression, usecols, dtype, chunksize) : download, decompress and parse a remote file chunk by chunk using FTPLib
+getRemoteIdentity(ftp, filename) : retrieve the size and the modification time of a remote file
+clearFtpCache() : remove all the dataframes stored in the local cache
+getFtpConnection(toPrint) : take an authenticated connection from the pool or open a new one
+releaseFtpConnection(ftp, broken) : give a connection back to the pool
+ftpSession(toPrint) : context manager borrowing a connection from the pool
+closeFtpPool() : close all the idle connections of the pool
 retrieveCKFtp(filename, compression, usecols, dtype) : download, decompress and extract a pandas dataframe using chilkat.CkFTP2
+
+The dataframes extracted by retrieveFtplib are cached on the hard disk (see Constants.bftpCache),
+in the binary columnar format of ColumnStore. A cache entry is identified by the remote filename,
+its size and its MDTM timestamp: an unchanged remote file is read from the disk instead of being downloaded.
+The rows of a file can be filtered while it is parsed (chunkFilter), chunk by chunk, so that the rejected rows
+never make a whole dataframe. With the cache, the whole file is cached and the filter is applied chunk by chunk
+to its memory-mapped columns when they are read back.
+
+The connections are shared through a pool: a connection that is not used anymore stays
+authenticated and is handed to the next transfer after a NOOP check, so that the functions
+called one after the other don't pay a TLS handshake and a login each time.
+
+The transfers are resumed where they stopped when the connection drops (REST command),
+so that a flaky link only costs the re-transfer of a few blocks (see Constants.ftpNbRetries).
 '''
 
+import atexit
+import contextlib
 import gzip
 import bz2
+import zlib
+import hashlib
 import time
 import os
+import shutil
+import threading
+import Queue
 
 import StringIO
 from cStringIO import StringIO as cS
 
-from ftplib import FTP_TLS
+from ftplib import FTP, FTP_TLS, error_perm
+from multiprocessing.pool import ThreadPool
 # from chilkat import CkFtp2, CkByteData
 
 import pandas as pd
 
+import ColumnStore
+import Constants
+import LazyFrame
+
+# idle authenticated connections of the pool, as (connection, time of last use)
+_ftpPool = []
+_ftpPoolLock = threading.Lock()
+# account information, read once from the hard disk
+_ftpAccount = None
+# boolean that settles if the connections are secured with TLS
+_ftpSecure = True
+
 
 def getAccount():
     """
@@ -62,8 +108,160 @@ def getAccount():
     except:
         print "error : coundn't read the account file"
         return (None, None, None, None)
+
+def setAccount(account = None, secure = True):
+    """
+    function that replaces the account stored on the hard disk,
+    for instance to connect to a local stand-in server (see FTPStandIn).
+    The idle connections of the pool are closed.
+    -- IN
+    account : a tuple (user, password, host, port), if None the account file is read again ((string, string, string, int)) default: None
+    secure : boolean that settles if the connections are secured with TLS (boolean) default: True
+    -- OUT
+    returns nothing
+    """
+    global _ftpAccount, _ftpSecure
+    closeFtpPool()
+    _ftpAccount = account
+    _ftpSecure = secure
+
+def connectFtplib(toPrint = False):
+    """
+    function that opens a new connection to the remote FTP server,
+    logs in with the account stored on the hard disk (see getAccount)
+    and establishes the security protocol.
+    The account file is read only once.
+    The transfer functions use the pool (see getFtpConnection) rather than this function.
+    -- IN
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    -- OUT
+    ftp : the connected ftp object (ftplib.FTP_TLS)
+    returns None if an error occurs
+    """
+    global _ftpAccount
+    ftp = FTP_TLS() if _ftpSecure else FTP()
+    # retrieving information about account on ftp server
+    if _ftpAccount is None or _ftpAccount[0] is None:
+        _ftpAccount = getAccount()
+    (user, password, host, port) = _ftpAccount
+    if user==None:
+        print "error : coudn't read the account information"
+        return None
+    # connecting and logging in
+    try:
+        ftp.connect(host,port)
+        ftp.login(user,password)
+    except:
+        print "error : unable to connect to the ftp server"
+        return None
+    # establishing the security protocol
+    if _ftpSecure:
+        ftp.prot_p()
+    if toPrint:
+        print "connected to the FTP server"
+    return ftp
+
+def getFtpConnection(toPrint = False):
+    """
+    function that takes an idle connection from the pool.
+    The connection is checked with a NOOP command before being returned,
+    the connections closed by the server are dropped.
+    A new connection is opened if there is no valid idle connection.
+    The connection must be given back with releaseFtpConnection.
+    -- IN
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    -- OUT
+    ftp : the connected ftp object (ftplib.FTP_TLS)
+    returns None if an error occurs
+    """
+    while True:
+        with _ftpPoolLock:
+            if len(_ftpPool)==0:
+                break
+            (ftp, lastUse) = _ftpPool.pop()
+        if time.time()-lastUse > Constants.ftpPoolMaxIdleTime:
+            _closeFtpConnection(ftp)
+            continue
+        try:
+            ftp.voidcmd("NOOP")
+            if toPrint:
+                print "reusing a connection to the FTP server"
+            return ftp
+        except:
+            _closeFtpConnection(ftp)
+    return connectFtplib(toPrint)
+
+def releaseFtpConnection(ftp, broken = False):
+    """
+    function that gives a connection back to the pool
+    -- IN
+    ftp : the connection taken with getFtpConnection (ftplib.FTP_TLS)
+    broken : boolean that settles if the connection is in an unknown state
+        after an error and must be closed instead (boolean) default: False
+    -- OUT
+    returns nothing
+    """
+    if ftp is None:
+        return
+    if not broken:
+        with _ftpPoolLock:
+            if len(_ftpPool)<Constants.ftpPoolMaxSize:
+                _ftpPool.append((ftp, time.time()))
+                return
+    _closeFtpConnection(ftp)
+
+@contextlib.contextmanager
+def ftpSession(toPrint = False):
+    """
+    context manager borrowing a connection from the pool:
+    the connection is given back at the end of the block,
+    or closed if an exception other than a refusal of the server was raised in the block
+    -- IN
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    -- OUT
+    ftp : the connected ftp object, None if the connection failed (ftplib.FTP_TLS)
+    """
+    ftp = getFtpConnection(toPrint)
+    try:
+        yield ftp
+    except error_perm:
+        # the server refused the command, the connection is still valid
+        releaseFtpConnection(ftp)
+        raise
+    except:
+        releaseFtpConnection(ftp, broken=True)
+        raise
+    else:
+        releaseFtpConnection(ftp)
+
+def closeFtpPool():
+    """
+    function that closes all the idle connections of the pool
+    -- IN
+    the function takes no arguments
+    -- OUT
+    returns nothing
+    """
+    with _ftpPoolLock:
+        connections = [ftp for (ftp, _) in _ftpPool]
+        del _ftpPool[:]
+    for ftp in connections:
+        _closeFtpConnection(ftp)
+
+def _closeFtpConnection(ftp):
+    """ closes a connection, politely if possible """
+    try:
+        ftp.quit()
+    except:
+        try:
+            ftp.close()
+        except:
+            pass
+
+atexit.register(closeFtpPool)
      
-def retrieveFtplib(filename, compression = None, usecols=None, dtype=None, toPrint = False, sep="\t"):
+def retrieveFtplib(filename, compression = None, usecols=None, dtype=None, toPrint = False, sep="\t",
+                   stream = False, chunksize = None, useCache = None, chunkFilter = None):
     """
     function that connects to the remote FTP serveur and extract a pandas dataframe
     the downloaded file must contain a csv file.
@@ -75,6 +273,15 @@ def retrieveFtplib(filename, compression = None, usecols=None, dtype=None, toPri
     usecols : an array containing the name of the column to extract (string[]) default: None
     dtype : a dictionary containing the name of the columns and the type to cast them ({string:string}) default: None
     toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    sep : separator for the pandas read_csv function (regexp) default: '\t'
+    stream : boolean that settles if the file is parsed while being downloaded (see streamFtplib)
+        instead of being entirely stored in memory first (boolean) default: False
+    chunksize : number of rows parsed at a time in stream mode or with a chunkFilter (int) default: Constants.ftpStreamChunkSize
+    useCache : boolean that settles if the local cache is used (boolean) default: Constants.bftpCache
+    chunkFilter : function called on each parsed chunk of the file, returning its kept rows or None if an error occurs,
+        the kept rows keep their line number as index. With the cache, the whole file is cached: each chunk is written
+        in the cache before being filtered, and a cached file is filtered chunk by chunk on its memory-mapped
+        columns, so the whole file is never in memory (function(pandas.Dataframe) -> pandas.Dataframe) default: None
     -- OUT
     db : a pandas dataframe containing the remote database (pandas.Dataframe)
     return None when an error occurs
@@ -88,87 +295,699 @@ def retrieveFtplib(filename, compression = None, usecols=None, dtype=None, toPri
         print "using ftplib"
         print "loading :",filename
         print "" 
-    ftp = FTP_TLS()
-    # retrieving information about account on ftp server
-    (user, password, host, port) = getAccount()
-    if user==None:
-        print "error : coudn't read the account information"
+    if useCache is None:
+        useCache = Constants.bftpCache
+    entry = None
+    if useCache:
+        entry = _getCacheEntry(filename, compression, usecols, dtype, sep)
+        if entry is not None and ColumnStore.isStore(entry):
+            # the cached file is only filtered, its columns are memory-mapped instead of read
+            db = ColumnStore.loadColumns(entry, mmap=chunkFilter is not None)
+            if db is not None:
+                # marking the entry as recently used
+                os.utime(os.path.join(entry,"columns.txt"), None)
+                if chunkFilter is not None:
+                    db = _concatChunks(_sliceChunks(db, chunksize), chunkFilter)
+                if toPrint:
+                    print 'Dataframe loaded from the cache :', time.time() - startTime, 'sec'
+                return db
+    # with a chunkFilter the whole file is cached chunk by chunk while its rows are filtered
+    chunksStore = None
+    if entry is not None and chunkFilter is not None:
+        chunksStore = entry+".tmp"
+    db = _retrieveFtplib(filename, compression, usecols, dtype, toPrint, sep, stream, chunksize, startTime,
+                         chunkFilter, chunksStore)
+    if db is not None and entry is not None:
+        _storeCacheEntry(db, entry, chunksStore)
+        if toPrint:
+            print 'Dataframe cached :', time.time() - startTime, 'sec'
+    elif chunksStore is not None:
+        shutil.rmtree(chunksStore, ignore_errors=True)
+    return db
+
+def _retrieveFtplib(filename, compression, usecols, dtype, toPrint, sep, stream, chunksize, startTime, chunkFilter = None,
+                    chunksStore = None):
+    """
+    function that downloads and parses the remote file, see retrieveFtplib,
+    with a chunkFilter the chunks are written in the store chunksStore before being filtered
+    """
+    if stream:
+        # parsing the file while it is downloaded
+        chunks = streamFtplib(filename, compression=compression, usecols=usecols, dtype=dtype,
+                              chunksize=chunksize, toPrint=toPrint, sep=sep)
+        if chunks is None:
+            return None
+        try:
+            if chunkFilter is None:
+                db = pd.concat(list(chunks), ignore_index=True)
+            else:
+                db = _concatChunks(chunks, chunkFilter, chunksStore)
+        except:
+            print "error : the file doesn't not contain a proper Dataframe"
+            return None
+        interval = time.time() - startTime 
+        if toPrint:
+            print 'Dataframe created :', interval, 'sec'
+        return db
+    if not compression in [None, "gz", "bz2"]:
+        print "error : unknown compression :",compression
         return None
-    # connecting and logging in
+    # retrieving the remote file as a local binary file
+    localFilename = downloadFtplib(filename, toPrint=toPrint)
+    if localFilename is None:
+        return None
+    interval = time.time() - startTime
+    if toPrint:
+        print 'Data downloaded :', interval, 'sec'
+    # extracting the file into a pandas dataframe, decompressing it on the fly
+    results = _FileReader(open(localFilename, "rb"), compression)
     try:
-        ftp.connect(host,port)
-        ftp.login(user,password)
+        if chunkFilter is None:
+            db = pd.read_csv(results,sep=sep, usecols = usecols, dtype = dtype)
+        else:
+            # only the kept rows of each chunk are gathered
+            if chunksize is None:
+                chunksize = Constants.ftpStreamChunkSize
+            db = _concatChunks(pd.read_csv(results, sep=sep, usecols=usecols, dtype=dtype, chunksize=chunksize), chunkFilter,
+                               chunksStore)
     except:
-        print "error : unable to connect to the ftp server"
+        print "error : the file doesn't not contain a proper Dataframe"
         return None
-    # establishing the security protocol
-    ftp.prot_p()
+    finally:
+        results.close()
+        os.remove(localFilename)
+    interval = time.time() - startTime 
     if toPrint:
-        print "connected to the FTP server"
-    # retrieving the remote file as a binary file
-    sio = StringIO.StringIO()
-    def handle_binary(more_data):
-        sio.write(more_data)
+        print 'Dataframe created :', interval, 'sec'
+    return db
+
+def _concatChunks(chunks, chunkFilter, chunksStore = None):
+    """
+    concatenates the rows of the chunks of a file kept by a filter, they keep their index,
+    returns None if the filter fails on a chunk.
+    The whole chunks are written at the end of the store chunksStore if it is given,
+    the store is removed if an error occurs while it is written
+    """
+    kept = []
+    nbChunks = 0
+    for chunk in chunks:
+        if chunksStore is not None:
+            if nbChunks==0:
+                stored = ColumnStore.saveColumns(chunk, chunksStore)
+            else:
+                stored = ColumnStore.appendColumns(chunk, chunksStore)
+            if not stored:
+                shutil.rmtree(chunksStore, ignore_errors=True)
+                chunksStore = None
+        nbChunks += 1
+        chunk = chunkFilter(chunk)
+        if chunk is None:
+            return None
+        kept.append(chunk)
+    if len(kept)==0:
+        return pd.DataFrame()
+    return pd.concat(kept)
+
+def _sliceChunks(db, chunksize):
+    """ yields the slices of chunksize rows of a dataframe, at least one """
+    if chunksize is None:
+        chunksize = Constants.ftpStreamChunkSize
+    for start in range(0, max(len(db), 1), chunksize):
+        yield db.iloc[start:start+chunksize].copy()
+
+def downloadFtplib(filename, localFilename = None, toPrint = False):
+    """
+    function that downloads a remote file to the hard disk.
+    The bytes are written in a partial file '<localFilename>.part': when the transfer is
+    interrupted, it is resumed with a new connection at the offset already received
+    (REST command) instead of being started over, at most Constants.ftpNbRetries times
+    with a growing delay. A partial file left by a previous call is resumed as well
+    if the remote file has not changed in between.
+    The complete file is checked against the remote size before being renamed.
+    -- IN
+    filename : the filename with its extension to be downloaded from the remote ftp server (string)
+    localFilename : the path of the downloaded file (string) default: the filename in Constants.ftpDownloadDirectory
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    -- OUT
+    localFilename : the path of the downloaded file (string)
+    returns None if an error occurs
+    """
+    if filename is None:
+        print "error : non-existing file :",filename
+        return None
+    if localFilename is None:
+        localFilename = os.path.join(Constants.ftpDownloadDirectory, filename.replace("/","_").replace("\\","_"))
+    partFilename = localFilename+".part"
+    identityFilename = partFilename+".id"
+    ftp = getFtpConnection(toPrint)
+    if ftp is None:
+        return None
+    identity = getRemoteIdentity(ftp, filename)
+    releaseFtpConnection(ftp)
+    if identity is None:
+        print "error : non-existing file :",filename
+        return None
+    size = identity[0]
     try:
-        ftp.retrbinary("RETR "+filename, callback=handle_binary)
+        os.makedirs(os.path.dirname(localFilename))
+    except OSError:
+        # the directory already exists, possibly created by another thread
+        pass
+    try:
+        # a partial file of another version of the remote file can't be resumed
+        if os.path.isfile(partFilename) and _readIdentityFile(identityFilename)!=repr(identity):
+            os.remove(partFilename)
+        with open(identityFilename, "w") as fichier:
+            fichier.write(repr(identity))
+    except (IOError, OSError) as e:
+        print "error : impossible to write in",os.path.dirname(localFilename),":",e
+        return None
+    nbAttempts = 0
+    while True:
+        offset = os.path.getsize(partFilename) if os.path.isfile(partFilename) else 0
+        if offset>size:
+            # the partial file is corrupted, starting over
+            os.remove(partFilename)
+            offset = 0
+        if offset==size:
+            break
+        if nbAttempts>Constants.ftpNbRetries:
+            print "error : download failed after",nbAttempts,"attempts :",filename
+            return None
+        if nbAttempts>0:
+            time.sleep(Constants.ftpRetryDelay*2**(nbAttempts-1))
+        nbAttempts += 1
+        if toPrint and offset>0:
+            print "resuming the download of",filename,"at byte",offset,"/",size
+        ftp = getFtpConnection(toPrint)
+        if ftp is None:
+            continue
+        try:
+            with open(partFilename, "ab") as fichier:
+                ftp.retrbinary("RETR "+filename, callback=fichier.write,
+                               blocksize=Constants.ftpStreamBlockSize, rest=offset if offset>0 else None)
+        except error_perm:
+            releaseFtpConnection(ftp)
+            if offset==0:
+                print "error : non-existing file :",filename
+                return None
+            # the server refused to restart the transfer, downloading the whole file again
+            os.remove(partFilename)
+            continue
+        except Exception as e:
+            if toPrint:
+                print "transfer interrupted :",e
+            releaseFtpConnection(ftp, broken=True)
+            continue
+        releaseFtpConnection(ftp)
+    if os.path.isfile(localFilename):
+        os.remove(localFilename)
+    os.rename(partFilename, localFilename)
+    os.remove(identityFilename)
+    return localFilename
+
+def _readIdentityFile(identityFilename):
+    """ returns the identity of the remote file of a partial file, None if unknown """
+    try:
+        with open(identityFilename, "r") as fichier:
+            return fichier.read()
+    except IOError:
+        return None
+
+def retrieveLazyFtplib(filename, compression = None, dtype = None, toPrint = False, sep = "\t"):
+    """
+    function that retrieves a remote csv file as a LazyFrame: the file is downloaded
+    and stored in the cache once (see retrieveFtplib), then the columns are only read
+    from the cache the first time they are accessed.
+    If the remote file can't be identified for the cache, the dataframe is downloaded and wrapped.
+    -- IN
+    filename : the filename with its extension to be downloaded from the remote ftp server (string)
+    compression : string that specifies the encoding of the file (string in [None,"gz","bz2"] default: None
+    dtype : a dictionary containing the name of the columns and the type to cast them ({string:string}) default: None
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    sep : separator for the pandas read_csv function (regexp) default: '\t'
+    -- OUT
+    frame : the lazy dataframe (LazyFrame.LazyFrame)
+    return None when an error occurs
+    """
+    startTime = time.time()
+    entry = _getCacheEntry(filename, compression, None, dtype, sep)
+    if entry is not None and ColumnStore.isStore(entry):
+        # marking the entry as recently used
+        os.utime(os.path.join(entry,"columns.txt"), None)
+    else:
+        db = _retrieveFtplib(filename, compression, None, dtype, toPrint, sep, False, None, startTime)
+        if db is None:
+            return None
+        if entry is not None:
+            _storeCacheEntry(db, entry)
+        if entry is None or not ColumnStore.isStore(entry):
+            # the dataframe couldn't be cached, it is wrapped as it is
+            return LazyFrame.fromDataFrame(db)
+        del db
+    if toPrint:
+        print 'Lazy dataframe ready :', time.time() - startTime, 'sec'
+    return LazyFrame.fromStore(entry)
+
+def retrieveMultipleFtplib(specs, nbWorkers = None, toPrint = False, stream = False, chunkFilters = None):
+    """
+    function that downloads, decompresses and parses several remote files concurrently.
+    Each file is handled by retrieveFtplib in its own thread with its own connection from the pool:
+    the transfers and the decompressions overlap, so that the total time approaches
+    the time of the slowest file instead of the sum of all of them.
+    Threads are used rather than processes as the dataframes would otherwise
+    have to be serialized back to the calling process.
+    -- IN
+    specs : list of specifications of the files, each one is a tuple
+        (filename, compression, usecols, dtype, sep) with the meaning of the arguments of retrieveFtplib
+        ([(string, string, string[], {string:string}, string)])
+    nbWorkers : number of files retrieved at the same time, if None all of them (int) default: None
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    stream : boolean that settles if the files are parsed while being downloaded (boolean) default: False
+    chunkFilters : the filter of the chunks of some files, see the argument chunkFilter of retrieveFtplib
+        ({string:function(pandas.Dataframe) -> pandas.Dataframe}) default: None
+    -- OUT
+    dbs : a dictionary linking each filename to its dataframe, None for the files that failed ({string:pandas.Dataframe})
+    """
+    startTime = time.time()
+    if len(specs)==0:
+        return {}
+    if nbWorkers is None:
+        nbWorkers = len(specs)
+    if chunkFilters is None:
+        chunkFilters = {}
+    def retrieve(spec):
+        (filename, compression, usecols, dtype, sep) = spec
+        return retrieveFtplib(filename, compression=compression, usecols=usecols, dtype=dtype, sep=sep, stream=stream,
+                              chunkFilter=chunkFilters.get(filename))
+    pool = ThreadPool(min(nbWorkers, len(specs)))
+    try:
+        results = pool.map(retrieve, specs)
+    finally:
+        pool.close()
+        pool.join()
+    dbs = {}
+    for (spec, db) in zip(specs, results):
+        dbs[spec[0]] = db
+    if toPrint:
+        print 'Dataframes created :', [spec[0] for spec in specs], time.time() - startTime, 'sec'
+    return dbs
+
+def streamFtplib(filename, compression = None, usecols=None, dtype=None, chunksize = None, toPrint = False, sep="\t"):
+    """
+    function that connects to the remote FTP serveur and parses a csv file while downloading it.
+    The bytes received by retrbinary are decompressed on the fly and handed to a chunked
+    pandas reader, so that the memory used does not depend on the size of the file
+    and the parsing overlaps with the network transfer.
+    It can be bz2, gz encoded or not encoded at all
+    -- IN
+    filename : the filename with its extension to be downloaded from the remote ftp server (string)
+    compression : string that specifies the encoding of the file (string in [None,"gz","bz2"] default: None
+    usecols : an array containing the name of the column to extract (string[]) default: None
+    dtype : a dictionary containing the name of the columns and the type to cast them ({string:string}) default: None
+    chunksize : number of rows of each yielded dataframe (int) default: Constants.ftpStreamChunkSize
+    toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    sep : separator for the pandas read_csv function (regexp) default: '\t'
+    -- OUT
+    chunks : an iterator over pandas dataframes of at most chunksize rows (iterator of pandas.Dataframe)
+        an IOError is raised during the iteration if the transfer fails
+    return None when an error occurs before the transfer
+    """
+    if chunksize is None:
+        chunksize = Constants.ftpStreamChunkSize
+    if not compression in [None, "gz", "bz2"]:
+        print "error : unknown compression :",compression
+        return None
+    ftp = getFtpConnection(toPrint)
+    if ftp is None:
+        return None
+    # checking the existence of the file before starting the transfer
+    try:
+        ftp.voidcmd("TYPE I")
+        ftp.size(filename)
+    except error_perm:
+        print "error : non-existing file :",filename
+        releaseFtpConnection(ftp)
+        return None
     except:
         print "error : non-existing file :",filename
+        releaseFtpConnection(ftp, broken=True)
         return None
-    # Go back to the start of the binary file
-    sio.seek(0) 
-    interval = time.time() - startTime
+    reader = _StreamReader(Constants.ftpStreamMaxBufferedBlocks)
+    thread = threading.Thread(target=_downloadStream, args=(ftp, filename, compression, reader))
+    thread.daemon = True
+    thread.start()
     if toPrint:
-        print 'Data downloaded :', interval, 'sec'
-    
-    # Unziping the file
-    if compression!=None:
-        if compression=="gz":
+        print "streaming :",filename
+    return _iterateStream(reader, thread, usecols, dtype, chunksize, sep)
+
+def _iterateStream(reader, thread, usecols, dtype, chunksize, sep):
+    """
+    generator yielding the dataframes parsed out of a _StreamReader,
+    stops the download thread if the iteration is interrupted
+    """
+    try:
+        for chunk in pd.read_csv(reader, sep=sep, usecols=usecols, dtype=dtype, chunksize=chunksize):
+            yield chunk
+        if reader.error is not None:
+            raise IOError("transfer interrupted : "+str(reader.error))
+    finally:
+        reader.close()
+        thread.join()
+
+def _downloadStream(ftp, filename, compression, reader):
+    """
+    target of the download thread of streamFtplib:
+    retrieves the remote file, decompresses the blocks and feeds the reader.
+    An interrupted transfer is resumed with a new connection at the offset already received.
+    """
+    decompressor = _StreamDecompressor(compression)
+    received = [0]
+    def handle_binary(more_data):
+        try:
+            data = decompressor.decompress(more_data)
+        except Exception as e:
+            # corrupted data, there is no point in resuming the transfer
+            raise _StreamClosed(e)
+        received[0] += len(more_data)
+        if not reader.put(data):
+            # the parser stopped reading, aborting the transfer
+            raise _StreamClosed()
+    broken = True
+    nbAttempts = 0
+    try:
+        while True:
             try:
-                results = gzip.GzipFile(fileobj=sio)
-            except:
-                print "error : decompression impossible : not a gzip file"
-                return None
-            if toPrint:
-                interval = time.time() - startTime
-                print 'Decompression done :', interval, 'sec'
-        elif compression=="bz2":
-            results = StringIO.StringIO()
-            a = bz2.decompress(sio.read())
-            results.write(a)
-            results.seek(0)
+                ftp.retrbinary("RETR "+filename, callback=handle_binary, blocksize=Constants.ftpStreamBlockSize,
+                               rest=received[0] if received[0]>0 else None)
+                break
+            except (_StreamClosed, error_perm):
+                raise
+            except Exception:
+                if nbAttempts>=Constants.ftpNbRetries:
+                    raise
+                nbAttempts += 1
+                releaseFtpConnection(ftp, broken=True)
+                ftp = None
+                time.sleep(Constants.ftpRetryDelay*2**(nbAttempts-1))
+                ftp = getFtpConnection()
+                if ftp is None:
+                    raise IOError("unable to reconnect to the ftp server")
+        reader.put(decompressor.flush())
+        broken = False
+    except _StreamClosed as e:
+        # an interrupted transfer leaves the connection in an unknown state
+        if len(e.args)>0:
+            reader.error = e.args[0]
+    except Exception as e:
+        reader.error = e
+    finally:
+        reader.put(None)
+        releaseFtpConnection(ftp, broken=broken)
+
+class _StreamClosed(Exception):
+    """ raised in the download callback when the parser stopped reading """
+    pass
+
+class _StreamDecompressor(object):
+    """
+    incremental decompressor for the gz and bz2 files,
+    handles the files made of several concatenated compressed members
+    """
+    def __init__(self, compression):
+        self.compression = compression
+        self.decompressor = self._newDecompressor()
+
+    def _newDecompressor(self):
+        if self.compression=="gz":
+            # 16 + MAX_WBITS tells zlib to expect the gzip header and trailer
+            return zlib.decompressobj(16+zlib.MAX_WBITS)
+        if self.compression=="bz2":
+            return bz2.BZ2Decompressor()
+        return None
+
+    def decompress(self, data):
+        if self.decompressor is None:
+            return data
+        results = []
+        while data:
+            if self.compression=="bz2":
+                try:
+                    results.append(self.decompressor.decompress(data))
+                except EOFError:
+                    # the previous member is over, the data belongs to the next one
+                    self.decompressor = self._newDecompressor()
+                    continue
+            else:
+                results.append(self.decompressor.decompress(data))
+            data = self.decompressor.unused_data
+            if data:
+                self.decompressor = self._newDecompressor()
+        return "".join(results)
+
+    def flush(self):
+        if self.compression=="gz":
+            return self.decompressor.flush()
+        return ""
+
+class _BufferedReader(object):
+    """
+    file-like object read by the csv parser, made of the blocks given by _nextBlock
+    """
+    def __init__(self):
+        self.buffer = []
+        self.bufferSize = 0
+        self.finished = False
+
+    def _nextBlock(self):
+        """ returns the next block of data, None at the end of the file """
+        raise NotImplementedError()
+
+    def read(self, size=-1):
+        while not self.finished and (size<0 or self.bufferSize<size):
+            data = self._nextBlock()
+            if data is None:
+                self.finished = True
+            else:
+                self.buffer.append(data)
+                self.bufferSize += len(data)
+        data = "".join(self.buffer)
+        if size<0 or size>=len(data):
+            self.buffer = []
+            self.bufferSize = 0
+            return data
+        self.buffer = [data[size:]]
+        self.bufferSize = len(data)-size
+        return data[:size]
+
+    def readline(self):
+        data = ""
+        while not "\n" in data:
+            block = self.read(Constants.ftpStreamBlockSize)
+            if block == "":
+                return data
+            data += block
+        position = data.index("\n")+1
+        self.buffer.insert(0, data[position:])
+        self.bufferSize += len(data)-position
+        return data[:position]
+
+    def __iter__(self):
+        # the iteration protocol is required by pandas to recognize a file-like object
+        line = self.readline()
+        while line:
+            yield line
+            line = self.readline()
+
+class _StreamReader(_BufferedReader):
+    """
+    reader fed by the download thread.
+    The blocks are exchanged through a bounded queue: the download waits
+    when the parser is late, which keeps the memory usage bounded.
+    """
+    def __init__(self, maxBlocks):
+        _BufferedReader.__init__(self)
+        self.queue = Queue.Queue(maxBlocks)
+        self.closed = False
+        self.error = None
+
+    def put(self, data):
+        """ called by the download thread, returns False if the reader was closed """
+        if data == "":
+            return not self.closed
+        while not self.closed:
             try:
-                pass
-            except:
-                print "error : decompression impossible : not a bz2 file"
-                return None
-            if toPrint:
-                interval = time.time() - startTime
-                print 'Decompression done :', interval, 'sec'
-    else:
-        results = sio
-    # extracting the file into a pandas dataframe
+                self.queue.put(data, timeout=1)
+                return True
+            except Queue.Full:
+                continue
+        return False
+
+    def _nextBlock(self):
+        return self.queue.get()
+
+    def close(self):
+        self.closed = True
+        # emptying the queue to release a waiting download thread
+        while True:
+            try:
+                self.queue.get_nowait()
+            except Queue.Empty:
+                break
+
+class _FileReader(_BufferedReader):
+    """
+    reader decompressing a local file block by block
+    """
+    def __init__(self, fileobj, compression):
+        _BufferedReader.__init__(self)
+        self.fileobj = fileobj
+        self.decompressor = _StreamDecompressor(compression)
+        self.flushed = False
+
+    def _nextBlock(self):
+        if self.flushed:
+            return None
+        data = self.fileobj.read(Constants.ftpStreamBlockSize)
+        if data == "":
+            self.flushed = True
+            return self.decompressor.flush()
+        return self.decompressor.decompress(data)
+
+    def close(self):
+        self.fileobj.close()
+
+def getRemoteIdentity(ftp, filename):
+    """
+    function that retrieves the size and the modification time of a remote file,
+    which together identify a version of the file
+    -- IN
+    ftp : a connected ftp object (ftplib.FTP_TLS)
+    filename : the filename with its extension on the remote ftp server (string)
+    -- OUT
+    identity : a tuple (size, timestamp) (int, string)
+    returns None if the file doesn't exist or the server doesn't give the information
+    """
     try:
-        db = pd.read_csv(results,sep=sep, usecols = usecols)
+        # the SIZE command requires the binary mode
+        ftp.voidcmd("TYPE I")
+        size = ftp.size(filename)
+        timestamp = ftp.sendcmd("MDTM "+filename).split(" ")[-1]
     except:
-        print "error : the file doesn't not contain a proper Dataframe"
         return None
-    sio.close()
-    interval = time.time() - startTime 
-    if toPrint:
-        print 'Dataframe created :', interval, 'sec'
-    return db
+    if size is None:
+        return None
+    return (size, timestamp)
+
+def clearFtpCache():
+    """
+    function that removes all the dataframes stored in the local cache
+    -- IN
+    the function takes no arguments
+    -- OUT
+    returns nothing
+    """
+    if os.path.isdir(Constants.ftpCacheDirectory):
+        shutil.rmtree(Constants.ftpCacheDirectory)
+
+def _getCacheEntry(filename, compression, usecols, dtype, sep, ftp = None):
+    """
+    returns the directory of the cache entry of a remote file
+    or None if the remote file can't be identified.
+    The remote file is identified with the given open connection,
+    or with a connection borrowed from the pool
+    """
+    if ftp is None:
+        with ftpSession() as ftp:
+            if ftp is None:
+                return None
+            return _getCacheEntry(filename, compression, usecols, dtype, sep, ftp)
+    identity = getRemoteIdentity(ftp, filename)
+    if identity is None:
+        return None
+    # the name of an entry is made of the filename, a hash of the parsing parameters
+    # (as they change the dataframe) and a hash of the version of the remote file
+    dtypeItems = None if dtype is None else sorted([(str(k), str(v)) for (k, v) in dtype.items()])
+    parameters = repr((filename, compression, usecols, dtypeItems, sep))
+    name = filename.replace("/","_").replace("\\","_")+"_" \
+        +hashlib.md5(parameters).hexdigest()[:16]+hashlib.md5(repr(identity)).hexdigest()[:16]
+    return os.path.join(Constants.ftpCacheDirectory, name)
+
+def _storeCacheEntry(db, entry, chunksStore = None):
+    """
+    stores a dataframe in the cache, or the store chunksStore of its chunks written while it was read if it exists,
+    removes the outdated versions of the same remote file and keeps the cache under its maximal size
+    """
+    try:
+        os.makedirs(Constants.ftpCacheDirectory)
+    except OSError:
+        # the directory already exists, possibly created by another thread
+        pass
+    # the outdated entries only differ by the hash of the version of the remote file
+    prefix = os.path.basename(entry)[:-16]
+    for name in os.listdir(Constants.ftpCacheDirectory):
+        if name.startswith(prefix) and len(name)==len(prefix)+16 and name!=os.path.basename(entry):
+            shutil.rmtree(os.path.join(Constants.ftpCacheDirectory, name), ignore_errors=True)
+    if chunksStore is None:
+        stored = ColumnStore.saveColumns(db, entry)
+    else:
+        stored = ColumnStore.isStore(chunksStore)
+        try:
+            if stored:
+                if os.path.isdir(entry):
+                    shutil.rmtree(entry)
+                os.rename(chunksStore, entry)
+        except OSError as e:
+            print "error : impossible to store the dataframe in",entry,":",e
+            shutil.rmtree(chunksStore, ignore_errors=True)
+            stored = False
+    if stored:
+        _evictFtpCache(keep=entry)
+
+def _evictFtpCache(keep = None):
+    """
+    removes the least recently used entries of the cache
+    until its size is under Constants.ftpCacheMaxSize
+    """
+    entries = []
+    totalSize = 0
+    for name in os.listdir(Constants.ftpCacheDirectory):
+        entry = os.path.join(Constants.ftpCacheDirectory, name)
+        # skipping the entries being written by another thread
+        if name.endswith(".tmp") or not ColumnStore.isStore(entry):
+            continue
+        try:
+            lastUse = os.path.getmtime(os.path.join(entry,"columns.txt"))
+        except OSError:
+            # the entry was removed by another thread
+            continue
+        size = ColumnStore.getStoreSize(entry)
+        totalSize += size
+        entries.append((lastUse, size, entry))
+    entries.sort()
+    maxSize = Constants.ftpCacheMaxSize*2**20
+    for (_, size, entry) in entries:
+        if totalSize<=maxSize:
+            break
+        if entry==keep:
+            continue
+        shutil.rmtree(entry, ignore_errors=True)
+        totalSize -= size
        
-def storeFtplib(dataframe, filename="cameliaBalAGKevin.csv", compression = None, toPrint = False):
+def storeFtplib(dataframe, filename="cameliaBalAGKevin.csv", compression = None, toPrint = False, chunksize = None):
     """
     function that connects to the remote FTP serveur and upload a pandas dataframe
     the upload file must be a pandasDataframe and will be written in a csv file.
     It can be uploaded as a bz2, gz encoded or not encoded at all
     if it is encoded, the right extension must be present in the name
+    The csv lines are produced chunk by chunk, compressed on the fly and sent
+    with storbinary, so that the whole csv text is never held in memory.
     -- IN
     dataframe : the dataframe to upload (pandas.Dataframe)
     filename : the filename with its extension to be downloaded from the remote ftp server (string)
     compression : string that specifies the encoding of the file (string in [None,"gz","bz2"] default: None
     toPrint : boolean that settles if the function should print its progress and results (boolean) default: False
+    chunksize : number of rows converted into csv lines at a time (int) default: Constants.ftpUploadChunkSize
     -- OUT
     flag : boolean that settles if everything was successful (True: no problem, False: an error occured)
     """
@@ -183,37 +1002,77 @@ def storeFtplib(dataframe, filename="cameliaBalAGKevin.csv", compression = None,
         print "using ftplib"
         print "loading :",filename
         print "" 
-    ftp = FTP_TLS()
-    # retrieving information about account on ftp server
-    (user, password, host, port) = getAccount()
-    if user==None:
-        print "error : coudn't read the account information"
+    if dataframe is None:
+        print "error : impossible to convert the dataframe into csv lines"
         return False
-    # connecting and logging in
-    try:
-        ftp.connect(host,port)
-        ftp.login(user,password)
-    except:
-        print "error : unable to connect to the ftp server"
+    if not compression in [None, "gz", "bz2"]:
+        print "error : unknown compression :",compression
         return False
-    # establishing the security protocol
-    ftp.prot_p()
-    if toPrint:
-        print "connected to the FTP server"
+    if chunksize is None:
+        chunksize = Constants.ftpUploadChunkSize
+    reader = _CsvReader(dataframe, compression, chunksize)
     try:
-        lines = dataframe.to_csv(path_or_buff = None,sep="\t",columns=dataframe.columns)
-    except:
-        print "error : impossible to convert the dataframe into csv lines"
+        with ftpSession(toPrint) as ftp:
+            if ftp is None:
+                return False
+            ftp.storbinary("STOR "+filename, reader, blocksize=Constants.ftpStreamBlockSize)
+    except _CsvConversionError as e:
+        print "error : impossible to convert the dataframe into csv lines :",e.args[0]
+        return False
+    except Exception as e:
+        print "error : impossible to upload the file :",e
         return False
-    sio = StringIO.StringIO(lines)
-    ftp.storlines(cmd="STOR "+filename, fp=sio)
-#     try:
-#         ftp.storlines(cmd="STOR "+filename, file=lines)
-#     except:
-#         print "error : impossible to upload the file"
-#         return False
     interval = time.time() - startTime 
     if toPrint:
-        print 'Dataframe uploaded :', interval, 'sec'
+        print 'Dataframe uploaded :', reader.nbBytes, 'bytes sent', interval, 'sec'
     return True
-    
\ No newline at end of file
+
+class _CsvConversionError(Exception):
+    """ raised by _CsvReader when the dataframe can't be written as csv lines """
+    pass
+
+class _CsvReader(_BufferedReader):
+    """
+    reader giving the csv lines of a dataframe, chunksize rows at a time,
+    compressed on the fly
+    """
+    def __init__(self, dataframe, compression, chunksize):
+        _BufferedReader.__init__(self)
+        self.dataframe = dataframe
+        self.chunksize = chunksize
+        self.position = 0
+        self.nbBytes = 0
+        if compression=="gz":
+            # 16 + MAX_WBITS tells zlib to write the gzip header and trailer
+            self.compressor = zlib.compressobj(Constants.ftpCompressionLevel, zlib.DEFLATED, 16+zlib.MAX_WBITS)
+        elif compression=="bz2":
+            self.compressor = bz2.BZ2Compressor(Constants.ftpCompressionLevel)
+        else:
+            self.compressor = None
+        # the header is written even for an empty dataframe
+        self.started = False
+        self.flushed = False
+
+    def _nextBlock(self):
+        if self.flushed:
+            return None
+        if self.started and self.position>=len(self.dataframe):
+            self.flushed = True
+            data = "" if self.compressor is None else self.compressor.flush()
+        else:
+            chunk = self.dataframe.iloc[self.position:self.position+self.chunksize]
+            try:
+                lines = chunk.to_csv(None, sep="\t", header=(self.position==0))
+            except UnicodeEncodeError:
+                # the utf-8 writer of pandas is much slower, it is only used for the non-ascii chunks
+                lines = chunk.to_csv(None, sep="\t", header=(self.position==0), encoding="utf-8")
+            except Exception as e:
+                raise _CsvConversionError(e)
+            if isinstance(lines, unicode):
+                lines = lines.encode("utf-8")
+            self.position += self.chunksize
+            self.started = True
+            data = lines if self.compressor is None else self.compressor.compress(lines)
+        self.nbBytes += len(data)
+        return data
+
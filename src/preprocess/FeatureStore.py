@@ -0,0 +1,338 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing a persistent store of features by entreprise, keyed by entrep_id,
+computed once from the cleaned BalAG, the Etab and the Scores dataframes,
+so that the analyses read one row per entreprise instead of scanning the rows of the files.
+
+The features of each source (see sourceFeatures) are counts, sums, minimums, maximums
+and sets of years stored as bits (bit i for the year Constants.featureFirstYear+i),
+which can all be combined, so that:
+- a source can be refreshed alone when its file changes, the features of the other sources are kept
+- the new rows of a source (as the ones of updateAndCleanCsv) are added to its features without the old rows
+The features are computed without python loops: the rows are sorted by entrep_id
+and each run of equal ids is reduced by numpy.
+
+The store is a ColumnStore directory, with one row per entreprise sorted by entrep_id,
+and the file versions.txt with the version of each source given at its last refresh.
+A feature of an entreprise absent from a source is 0, or NaT for the dates.
+
+=== functions :
+computeFeatures(dataframe, source) : computes the features of the rows of a source by entreprise
+refreshFeatures(dataframe, source, directory, version, incremental) : updates the features of a source in the store
+loadFeatures(directory, columns, idRange, entrepIds) : reads the features of some entreprises from the store
+getSourceVersions(directory) : returns the versions of the sources of the store
+getMeanMontant(features) : computes the mean and the standard deviation of the montants of each entreprise
+getYearBits(dates) : returns the set of years of dates as bits
+countYears(years, firstYear, lastYear) : counts the years of sets of years between bounds
+'''
+
+import os
+
+import numpy as np
+import pandas as pd
+
+import ColumnStore
+import Constants
+
+
+# the features of each source: (name, aggregation, column, type, count)
+# - aggregation : "count" the rows, "sum", "min", "max" or "or" the values
+# - column : the function computing the values of the rows from the dataframe
+# - count : the feature counting the values, 0 when the entreprise has no value
+sourceFeatures = {
+    "balAG":[("nbBills", "count", None, np.uint32, None),
+             ("nbPaid", "sum", lambda df: _getPaid(df), np.uint32, None),
+             ("firstBill", "min", lambda df: df['datePiece'].values, "datetime64[ns]", "nbBills"),
+             ("lastBill", "max", lambda df: df['datePiece'].values, "datetime64[ns]", "nbBills"),
+             ("sumDelay", "sum", lambda df: _getDelays(df), np.int64, None),
+             ("sumMontant", "sum", lambda df: df['montantPieceEur'].values.astype(np.float64), np.float64, None),
+             ("sumSquaresMontant", "sum", lambda df: df['montantPieceEur'].values.astype(np.float64)**2, np.float64, None),
+             ("billYears", "or", lambda df: getYearBits(df['datePiece'].values), np.uint64, None)],
+    "etab":[("nbEtab", "count", None, np.uint32, None),
+            ("nbCapital", "sum", lambda df: _isValid(df['capital'].values), np.uint32, None),
+            ("capitalMin", "min", lambda df: df['capital'].values, np.uint32, "nbCapital"),
+            ("capitalMax", "max", lambda df: df['capital'].values, np.uint32, "nbCapital"),
+            ("nbDcren", "sum", lambda df: _isValid(df['DCREN'].values), np.uint32, None),
+            ("dcrenMin", "min", lambda df: df['DCREN'].values, "datetime64[ns]", "nbDcren"),
+            ("dcrenMax", "max", lambda df: df['DCREN'].values, "datetime64[ns]", "nbDcren"),
+            ("nbEffectif", "sum", lambda df: _isValid(df['EFF_ENT'].values), np.uint32, None),
+            ("effectifMin", "min", lambda df: df['EFF_ENT'].values, np.uint32, "nbEffectif"),
+            ("effectifMax", "max", lambda df: df['EFF_ENT'].values, np.uint32, "nbEffectif")],
+    "score":[("nbScores", "count", None, np.uint32, None),
+             ("scoreYears", "or", lambda df: _getScoreYearBits(df), np.uint64, None)]}
+
+
+def computeFeatures(dataframe, source):
+    '''
+    function that computes the features of the rows of a source by entreprise
+    -- IN
+    dataframe : the rows of the source, with parsed dates: the cleaned BalAG,
+        the Etab file or the Scores file with a column year or dateBilan (pandas.Dataframe)
+    source : the name of the source (string in sourceFeatures)
+    -- OUT
+    features : one row per entreprise sorted by entrep_id, with the features of the source (pandas.Dataframe)
+    '''
+    ids = dataframe['entrep_id'].values.astype(np.int64)
+    order = np.argsort(ids, kind='mergesort')
+    sortedIds = ids[order]
+    starts = np.flatnonzero(np.concatenate(([True], sortedIds[1:]!=sortedIds[:-1]))) if len(ids)>0 else np.zeros(0, dtype=np.int64)
+    counts = np.diff(np.append(starts, len(ids)))
+    features = pd.DataFrame({'entrep_id':sortedIds[starts].astype(np.uint32)})
+    for (name, aggregation, column, dtype, _) in sourceFeatures[source]:
+        if aggregation=="count":
+            features[name] = counts.astype(dtype)
+        else:
+            features[name] = _reduceRuns(column(dataframe)[order], starts, aggregation, dtype)
+    return features
+
+def refreshFeatures(dataframe, source, directory = None, version = None, incremental = False):
+    '''
+    function that updates the features of a source in the store, the features of the other sources are kept
+    -- IN
+    dataframe : the rows of the source (pandas.Dataframe)
+    source : the name of the source (string in sourceFeatures)
+    directory : the directory of the store (string) default: Constants.featureStoreDirectory
+    version : the version of the source, as the identity of its remote file, if it is the one
+        of the last refresh nothing is done, if None the features are always refreshed (string) default: None
+    incremental : boolean that settles if the rows are new rows added to the features of the source,
+        instead of all the rows of the source replacing them (boolean) default: False
+    -- OUT
+    flag : boolean that settles if everything was successful (True: no problem, False: an error occured)
+    '''
+    if directory is None:
+        directory = Constants.featureStoreDirectory
+    versions = getSourceVersions(directory)
+    if version is not None and versions.get(source)==str(version):
+        print "the features of",source,"are up to date"
+        return True
+    stored = None
+    if ColumnStore.isStore(directory):
+        stored = ColumnStore.loadColumns(directory)
+        if stored is None:
+            return False
+    features = _mergeFeatures(stored, computeFeatures(dataframe, source), source, incremental)
+    versions[source] = "" if version is None else str(version)
+    if not ColumnStore.saveColumns(features, directory):
+        return False
+    try:
+        with open(os.path.join(directory, "versions.txt"), "w") as fichier:
+            for (name, value) in sorted(versions.items()):
+                fichier.write(name+"\t"+value+"\n")
+    except IOError as e:
+        print "error : impossible to write the versions of the features :",e
+        return False
+    return True
+
+def loadFeatures(directory = None, columns = None, idRange = None, entrepIds = None):
+    '''
+    function that reads the features of some entreprises from the store, memory-mapped
+    -- IN
+    directory : the directory of the store (string) default: Constants.featureStoreDirectory
+    columns : the features to read, if None all of them (string[]) default: None
+    idRange : the entreprises whose id is in [first, last[, if None all of them ((int, int)) default: None
+    entrepIds : the ids of the entreprises, the unknown ones are left aside, if None all of them (int[]) default: None
+    -- OUT
+    features : one row per entreprise sorted by entrep_id, with the column entrep_id (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    if directory is None:
+        directory = Constants.featureStoreDirectory
+    if not ColumnStore.isStore(directory):
+        print "error : non-existing feature store :",directory
+        return None
+    usecols = None if columns is None else ['entrep_id']+[column for column in columns if column!='entrep_id']
+    features = ColumnStore.loadColumns(directory, usecols=usecols, mmap=True)
+    if features is None:
+        return None
+    ids = features['entrep_id'].values
+    if idRange is not None:
+        features = features.iloc[np.searchsorted(ids, idRange[0]):np.searchsorted(ids, idRange[1])]
+        ids = features['entrep_id'].values
+    if entrepIds is not None:
+        entrepIds = np.unique(np.asarray(entrepIds, dtype=np.int64))
+        positions = np.minimum(np.searchsorted(ids, entrepIds), max(len(ids)-1, 0))
+        if len(ids)>0:
+            features = features.take(positions[ids[positions]==entrepIds])
+    return features.reset_index(drop=True)
+
+def getSourceVersions(directory = None):
+    '''
+    function that returns the versions of the sources of the store given at their last refresh
+    -- IN
+    directory : the directory of the store (string) default: Constants.featureStoreDirectory
+    -- OUT
+    versions : the version of each refreshed source ({string:string})
+    '''
+    if directory is None:
+        directory = Constants.featureStoreDirectory
+    try:
+        with open(os.path.join(directory, "versions.txt"), "r") as fichier:
+            return dict([line.rstrip("\n").split("\t", 1) for line in fichier if line.strip()!=""])
+    except (IOError, ValueError):
+        return {}
+
+def getMeanMontant(features):
+    '''
+    function that computes the mean and the standard deviation of the montants of each entreprise
+    -- IN
+    features : the features of the BalAG (pandas.Dataframe)
+    -- OUT
+    mean : the mean montant, 0 without bill (numpy.ndarray of float)
+    std : the standard deviation of the montants, 0 without bill (numpy.ndarray of float)
+    '''
+    nbBills = np.maximum(features['nbBills'].values, 1).astype(np.float64)
+    mean = features['sumMontant'].values/nbBills
+    std = np.sqrt(np.maximum(features['sumSquaresMontant'].values/nbBills-mean**2, 0))
+    return (mean, std)
+
+def getYearBits(dates):
+    '''
+    function that returns the set of years of dates, as bits (bit i for the year Constants.featureFirstYear+i)
+    -- IN
+    dates : the dates (numpy.ndarray of datetime64)
+    -- OUT
+    bits : the bit of the year of each date, 0 for the missing dates and the years out of the 64 years (numpy.ndarray of uint64)
+    '''
+    years = pd.DatetimeIndex(dates).year.values
+    return _yearsToBits(years)
+
+def countYears(years, firstYear, lastYear):
+    '''
+    function that counts the years of sets of years between bounds
+    -- IN
+    years : the sets of years as bits, see getYearBits (numpy.ndarray of uint64)
+    firstYear : the first year counted of each set (int[])
+    lastYear : the last year counted of each set (int[])
+    -- OUT
+    counts : the number of years of each set between the bounds (numpy.ndarray of int)
+    '''
+    offsets = np.arange(64)
+    first = np.asarray(firstYear, dtype=np.int64)[:, np.newaxis]-Constants.featureFirstYear
+    last = np.asarray(lastYear, dtype=np.int64)[:, np.newaxis]-Constants.featureFirstYear
+    bits = (np.asarray(years, dtype=np.uint64)[:, np.newaxis]>>offsets.astype(np.uint64))&np.uint64(1)
+    return (bits.astype(np.bool_)&(offsets>=first)&(offsets<=last)).sum(axis=1)
+
+def _yearsToBits(years):
+    ''' returns the bit of each year, 0 for the years out of the 64 years '''
+    offsets = np.asarray(years, dtype=np.int64)-Constants.featureFirstYear
+    inside = (offsets>=0)&(offsets<64)
+    bits = np.zeros(len(offsets), dtype=np.uint64)
+    bits[inside] = np.left_shift(np.uint64(1), offsets[inside].astype(np.uint64))
+    return bits
+
+def _getPaid(dataframe):
+    ''' returns the paid bills of the BalAG '''
+    if 'paidBill' in dataframe.columns:
+        return dataframe['paidBill'].values.astype(np.uint32)
+    return dataframe['dateDernierPaiement'].notnull().values.astype(np.uint32)
+
+def _getDelays(dataframe):
+    ''' returns the delays of payment in days of the paid bills of the BalAG, 0 for the unpaid bills '''
+    delays = (dataframe['dateDernierPaiement'].values-dataframe['datePiece'].values).astype('timedelta64[D]')
+    paid = _isValid(delays)
+    return np.where(paid, delays.astype(np.int64), 0)
+
+def _getScoreYearBits(dataframe):
+    ''' returns the bit of the year of each balance sheet of the Scores '''
+    if 'year' in dataframe.columns:
+        return _yearsToBits(dataframe['year'].values)
+    return getYearBits(dataframe['dateBilan'].values)
+
+def _isValid(values):
+    ''' returns the mask of the values that are not missing '''
+    if values.dtype.kind in "mM":
+        return ~np.isnat(values)
+    if values.dtype.kind=="f":
+        return ~np.isnan(values)
+    if values.dtype.kind=="O":
+        return pd.notnull(values)
+    return np.ones(len(values), dtype=np.bool_)
+
+def _reduceRuns(values, starts, aggregation, dtype):
+    ''' reduces the runs of values beginning at starts, the missing values are left aside '''
+    valid = _isValid(values)
+    isDate = np.dtype(dtype).kind=="M"
+    if isDate:
+        values = values.astype("datetime64[ns]").view(np.int64)
+    elif values.dtype.kind=="f" or values.dtype.kind=="O":
+        values = np.where(valid, values, 0).astype(dtype)
+    if len(starts)==0:
+        return np.zeros(0, dtype=dtype)
+    if aggregation=="sum":
+        return np.add.reduceat(np.where(valid, values, 0).astype(dtype), starts).astype(dtype)
+    if aggregation=="or":
+        return np.bitwise_or.reduceat(values.astype(dtype), starts)
+    present = np.add.reduceat(valid.astype(np.int64), starts)>0
+    work = values.astype(np.int64) if not isDate and np.dtype(dtype).kind in "iu" else values
+    if aggregation=="min":
+        reduced = np.minimum.reduceat(np.where(valid, work, np.iinfo(np.int64).max), starts)
+    else:
+        reduced = np.maximum.reduceat(np.where(valid, work, np.iinfo(np.int64).min), starts)
+    return _fromWork(reduced, present, dtype)
+
+def _fromWork(reduced, present, dtype):
+    ''' converts the reduced int64 values into the type of a feature, missing if not present '''
+    if np.dtype(dtype).kind=="M":
+        reduced = np.where(present, reduced, np.iinfo(np.int64).min)
+        return reduced.view("datetime64[ns]")
+    return np.where(present, reduced, 0).astype(dtype)
+
+def _toWork(values, dtype):
+    ''' converts the values of a feature into int64 values '''
+    if np.dtype(dtype).kind=="M":
+        return values.astype("datetime64[ns]").view(np.int64)
+    return values.astype(np.int64)
+
+def _mergeFeatures(stored, features, source, incremental):
+    ''' merges the features of a source into the stored features of all the sources '''
+    if stored is None:
+        stored = pd.DataFrame({'entrep_id':np.zeros(0, dtype=np.uint32)})
+    ids = np.union1d(stored['entrep_id'].values.astype(np.int64), features['entrep_id'].values.astype(np.int64))
+    storedRows = np.searchsorted(ids, stored['entrep_id'].values.astype(np.int64))
+    newRows = np.searchsorted(ids, features['entrep_id'].values.astype(np.int64))
+    merged = pd.DataFrame({'entrep_id':ids.astype(np.uint32)})
+    specs = dict([(name, (aggregation, dtype, count)) for (name, aggregation, _, dtype, count) in sourceFeatures[source]])
+    # the features of the other sources
+    for column in stored.columns:
+        if column=='entrep_id' or (column in specs and not incremental):
+            continue
+        merged[column] = _spread(stored[column].values, storedRows, len(ids))
+    # the stored counts, before they are updated
+    old = merged.copy()
+    for (name, aggregation, _, dtype, count) in sourceFeatures[source]:
+        values = _spread(features[name].values.astype(dtype), newRows, len(ids))
+        if incremental and name in old.columns:
+            values = _combine(old[name].values, values, aggregation, dtype,
+                              None if count is None else (old[count].values>0, _spread(features[count].values, newRows, len(ids))>0))
+        merged[name] = values
+    # the entreprises absent from all the sources
+    counts = [name for specs in sourceFeatures.values() for (name, aggregation, _, _, _) in specs
+              if aggregation=="count" and name in merged.columns]
+    present = np.zeros(len(merged), dtype=np.bool_)
+    for name in counts:
+        present |= merged[name].values>0
+    return merged[present].reset_index(drop=True)
+
+def _spread(values, rows, length):
+    ''' places values at some rows of a column of length rows, the other rows are 0 or NaT '''
+    spread = np.zeros(length, dtype=values.dtype)
+    if values.dtype.kind=="M":
+        spread[:] = np.datetime64("NaT")
+    spread[rows] = values
+    return spread
+
+def _combine(old, new, aggregation, dtype, presences):
+    ''' combines the stored and the new values of a feature '''
+    if aggregation in ["count", "sum"]:
+        return (old+new).astype(dtype)
+    if aggregation=="or":
+        return old|new
+    (oldPresent, newPresent) = presences
+    (old, new) = (_toWork(old, dtype), _toWork(new, dtype))
+    function = np.minimum if aggregation=="min" else np.maximum
+    combined = np.where(oldPresent&newPresent, function(old, new), np.where(oldPresent, old, new))
+    return _fromWork(combined, oldPresent|newPresent, dtype)
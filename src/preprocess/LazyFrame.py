@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing a lazy dataframe: the columns are only read from their source
+the first time they are accessed, so that the memory used and the time spent
+reading depend on the columns actually used and not on the width of the file.
+
+The sources are:
+- a store of the module ColumnStore (cache of FTPTools, snapshot of the cleaned BalAG), read with memory mapping
+- a local csv file, parsed for the accessed columns only
+Columns computed out of other columns can be defined, they are computed when accessed.
+
+A LazyFrame supports the accesses frame['column'], frame.column, frame[['c1','c2']],
+the assignment and the deletion of columns, len(frame) and frame.columns.
+toDataFrame() gives a pandas dataframe of some of the columns for the other operations.
+
+=== functions :
+fromStore(directory) : creates a LazyFrame reading a store of ColumnStore
+fromCsv(filename, sep, dtype) : creates a LazyFrame reading a local csv file
+fromDataFrame(dataframe) : creates a LazyFrame over an already loaded dataframe
+'''
+
+import numpy as np
+import pandas as pd
+
+import ColumnStore
+
+
+def fromStore(directory):
+    '''
+    function that creates a LazyFrame reading the columns of a store of ColumnStore
+    -- IN
+    directory : the path of the store directory (string)
+    -- OUT
+    frame : the lazy dataframe (LazyFrame.LazyFrame)
+    returns None if the store can't be read
+    '''
+    columns = ColumnStore.getColumnNames(directory)
+    if columns is None:
+        return None
+    loader = lambda names: ColumnStore.loadColumns(directory, usecols=names, mmap=True)
+    return LazyFrame(loader, columns)
+
+def fromCsv(filename, sep = "\t", dtype = None):
+    '''
+    function that creates a LazyFrame reading a local csv file,
+    each access to new columns parses the file for those columns only
+    -- IN
+    filename : the path of the file (string)
+    sep : separator for the pandas read_csv function (regexp) default : '\t'
+    dtype : a dictionary containing the name of the columns and the type to cast them ({string:string}) default: None
+    -- OUT
+    frame : the lazy dataframe (LazyFrame.LazyFrame)
+    returns None if the file can't be read
+    '''
+    try:
+        columns = list(pd.read_csv(filename, sep=sep, nrows=0).columns)
+    except Exception:
+        print "error : impossible to read the file :",filename
+        return None
+    def loader(names):
+        usedtype = None if dtype is None else dict([(k, v) for (k, v) in dtype.items() if k in names])
+        try:
+            return pd.read_csv(filename, sep=sep, usecols=names, dtype=usedtype)
+        except Exception:
+            print "error : impossible to read the columns",names,"of the file :",filename
+            return None
+    return LazyFrame(loader, columns)
+
+def fromDataFrame(dataframe):
+    '''
+    function that creates a LazyFrame over an already loaded dataframe,
+    so that the functions expecting a LazyFrame can also be given a loaded dataframe
+    -- IN
+    dataframe : the loaded dataframe (pandas.Dataframe)
+    -- OUT
+    frame : the lazy dataframe (LazyFrame.LazyFrame)
+    '''
+    frame = LazyFrame(lambda names: dataframe[names], list(dataframe.columns))
+    frame._frame = pd.DataFrame(index=dataframe.index)
+    return frame
+
+class LazyFrame(object):
+    '''
+    dataframe whose columns are read from their source the first time they are accessed
+    '''
+    def __init__(self, loader, columns):
+        '''
+        -- IN
+        loader : function taking a list of column names and returning a dataframe
+            with those columns, or None if an error occurs (function)
+        columns : the names of the columns of the source (string[])
+        '''
+        self._loader = loader
+        self._columns = list(columns)
+        # functions computing the defined columns out of the frame
+        self._definitions = {}
+        # the columns already loaded, None while the index is unknown
+        self._frame = None
+
+    @property
+    def columns(self):
+        return pd.Index(self._columns)
+
+    @property
+    def index(self):
+        self._loadIndex()
+        return self._frame.index
+
+    @property
+    def loadedColumns(self):
+        ''' the names of the columns already loaded '''
+        return [] if self._frame is None else list(self._frame.columns)
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, name):
+        return name in self._columns
+
+    def __getattr__(self, name):
+        # only called when the normal lookup fails
+        if name in self.__dict__.get("_columns", []):
+            return self[name]
+        raise AttributeError(name)
+
+    def __getitem__(self, key):
+        if isinstance(key, (list, tuple, pd.Index, np.ndarray)):
+            return self.toDataFrame(list(key))
+        self._load([key])
+        return self._frame[key]
+
+    def __setitem__(self, name, value):
+        self._loadIndex()
+        self._frame[name] = value
+        self._definitions.pop(name, None)
+        if not name in self._columns:
+            self._columns.append(name)
+
+    def __delitem__(self, name):
+        if not name in self._columns:
+            raise KeyError(name)
+        self._columns.remove(name)
+        self._definitions.pop(name, None)
+        if self._frame is not None and name in self._frame.columns:
+            del self._frame[name]
+
+    def defineColumn(self, name, function):
+        '''
+        defines a column computed out of the other columns the first time it is accessed
+        -- IN
+        name : the name of the column (string)
+        function : function taking the LazyFrame and returning the values of the column (function)
+        '''
+        if self._frame is not None and name in self._frame.columns:
+            del self._frame[name]
+        self._definitions[name] = function
+        if not name in self._columns:
+            self._columns.append(name)
+
+    def toDataFrame(self, columns = None, rows = None):
+        '''
+        loads some columns and returns them in a pandas dataframe
+        -- IN
+        columns : the names of the columns, if None all of them (string[]) default: None
+        rows : the positions of the rows to return, if None all of them (int[]) default: None
+        -- OUT
+        dataframe : a dataframe containing the columns (pandas.Dataframe)
+        '''
+        if columns is None:
+            columns = list(self._columns)
+        self._load(columns)
+        if rows is None:
+            return self._frame[columns].copy()
+        # only the selected rows are copied
+        return pd.DataFrame(dict([(name, self._frame[name].take(rows).values) for name in columns]),
+                            index=self._frame.index.take(rows), columns=columns)
+
+    def _loadIndex(self):
+        ''' loads the smallest possible part of the source to know the index '''
+        if self._frame is not None:
+            return
+        sourceColumns = [name for name in self._columns if not name in self._definitions]
+        if len(sourceColumns)==0:
+            raise KeyError("no column to read the index from")
+        self._load(sourceColumns[:1])
+
+    def _load(self, names):
+        ''' loads the columns of names that are not loaded yet '''
+        for name in names:
+            if not name in self._columns:
+                raise KeyError(name)
+        missing = [name for name in names if self._frame is None or not name in self._frame.columns]
+        sourceColumns = [name for name in missing if not name in self._definitions]
+        if len(sourceColumns)>0:
+            loaded = self._loader(sourceColumns)
+            if loaded is None:
+                raise IOError("impossible to load the columns "+str(sourceColumns))
+            if self._frame is None:
+                self._frame = pd.DataFrame(index=loaded.index)
+            for name in sourceColumns:
+                self._frame[name] = loaded[name]
+        for name in missing:
+            if name in self._definitions:
+                self._loadIndex()
+                self._frame[name] = self._definitions[name](self)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing the types of the columns of the Camelia files,
+the narrowest types able to hold their values:
+- the ids and the numbers are read as small numpy ints or floats
+- the columns with a few distinct strings (devise, sourceModif) are read as pandas categories
+- the dates are read as strings then parsed into datetime64 (see Utils.parseIsoDatesCached)
+
+A schema is a dictionary {column:type} where type is the name of a numpy type,
+"category", "str" for the columns kept as strings, or "date".
+The columns out of the schema are read with the default types of pandas.
+The integer columns which may be empty in a file are read as floats, the rows with a missing value
+must be removed before their conversion by applySchema.
+
+=== functions :
+getDtype(schema, missingColumns) : returns the types to give to read_csv for a schema
+applySchema(dataframe, schema) : converts the columns of a dataframe into the types of a schema
+getMemoryUsage(dataframe) : computes the memory used by each column of a dataframe
+memoryReport(dataframe, schema, name) : prints the memory used by a dataframe before and after its conversion
+'''
+
+import numpy as np
+import pandas as pd
+
+import Utils
+
+
+# the BalAG file
+# entrep_id is signed so that the cleaning rejects the negative ids, it is stored as uint32 in the snapshot.
+# dateInsert is compared as a string to the watermark of the incremental cleaning
+balAGSchema = {"entrep_id":"int32",
+               "datePiece":"date",
+               "dateEcheance":"date",
+               "dateDernierPaiement":"date",
+               "montantPieceEur":"int32",
+               "montantLitige":"int32",
+               "devise":"category",
+               "dateInsert":"str"}
+# the Etab file
+etabSchema = {"entrep_id":"uint32",
+              "capital":"uint32",
+              "DCREN":"date",
+              "EFF_ENT":"uint32"}
+# the integer columns of the Etab file with empty cells, the rows without them are removed
+etabMissingColumns = ["entrep_id","capital","EFF_ENT"]
+# the Scores file
+scoreSchema = {"entrep_id":"uint32",
+               "dateBilan":"date",
+               "sourceModif":"category",
+               "scoreSolv":"float16",
+               "scoreZ":"float16",
+               "scoreCH":"float16",
+               "scoreAltman":"float16"}
+# the LiensEntites file
+liensEntitesSchema = {"id":"uint32",
+                      "entrep_id":"uint32",
+                      "cotationEnBourse":"category"}
+
+
+def getDtype(schema, missingColumns = None):
+    '''
+    function that returns the types to give to the read_csv function of pandas for a schema,
+    the dates are read as strings and must then be parsed by applySchema.
+    read_csv fails on an empty cell of an integer column, the integer columns which may be empty
+    are read as floats and must be converted by applySchema once the rows with a missing value are removed
+    -- IN
+    schema : the types of the columns ({string:string})
+    missingColumns : the columns which may have empty cells (string[]) default: None
+    -- OUT
+    dtype : the types of the columns for read_csv ({string:string})
+    '''
+    dtype = {}
+    for (column, columnType) in schema.items():
+        if columnType=="date":
+            dtype[column] = "str"
+        elif missingColumns is not None and column in missingColumns and np.issubdtype(np.dtype(columnType), np.integer):
+            dtype[column] = "float64"
+        else:
+            dtype[column] = columnType
+    return dtype
+
+def applySchema(dataframe, schema):
+    '''
+    function that converts the columns of a dataframe into the types of a schema,
+    the columns already converted and the columns out of the schema are left as they are.
+    The dataframe is modified
+    -- IN
+    dataframe : the dataframe to convert (pandas.Dataframe)
+    schema : the types of the columns ({string:string})
+    -- OUT
+    dataframe : the converted dataframe (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    try:
+        for column in dataframe.columns:
+            if not column in schema:
+                continue
+            columnType = schema[column]
+            serie = dataframe[column]
+            if columnType=="date":
+                if not np.issubdtype(serie.dtype, np.datetime64):
+                    dataframe[column] = Utils.parseIsoDatesCached(serie)
+            elif columnType=="str":
+                continue
+            elif columnType=="category":
+                if serie.dtype.name!="category":
+                    dataframe[column] = serie.astype("category")
+            elif serie.dtype!=columnType:
+                dataframe[column] = serie.astype(columnType)
+    except (ValueError, TypeError) as e:
+        print "error : impossible to convert the dataframe :",e
+        return None
+    return dataframe
+
+def getMemoryUsage(dataframe):
+    '''
+    function that computes the memory used by each column of a dataframe, including the strings
+    -- IN
+    dataframe : the dataframe (pandas.Dataframe)
+    -- OUT
+    usage : the memory used by each column in MB (pandas.Series)
+    '''
+    return dataframe.memory_usage(index=False, deep=True)/2.0**20
+
+def memoryReport(dataframe, schema, name = ""):
+    '''
+    function that prints the memory used by each column of a dataframe
+    before and after its conversion into the types of a schema, the dataframe is not modified
+    -- IN
+    dataframe : the dataframe as read without the schema (pandas.Dataframe)
+    schema : the types of the columns ({string:string})
+    name : the name of the dataframe printed in the title (string) default: ""
+    -- OUT
+    report : the memory in MB before and after for each column and the total (pandas.Dataframe)
+    returns None if an error occurs
+    '''
+    converted = applySchema(dataframe.copy(), schema)
+    if converted is None:
+        return None
+    report = pd.DataFrame({"before":getMemoryUsage(dataframe), "after":getMemoryUsage(converted)},
+                          columns=["before","after"])
+    report.loc["total"] = report.sum()
+    report["ratio"] = report["after"]/report["before"]
+    print "memory used by the dataframe",name,"in MB (",len(dataframe),"rows )"
+    print "%-22s%10s%10s%8s" % ("column","before","after","ratio")
+    for (column, line) in report.iterrows():
+        print "%-22s%10.2f%10.2f%8.2f" % (column, line["before"], line["after"], line["ratio"])
+    print ""
+    return report
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module containing a lookup structure of the scores of the entreprises by year,
+answering the join of the BalAG rows with the Scores file on (entrep_id, year)
+without hashing the keys of the rows as pandas.merge does.
+
+The scores are partitioned by year. Each partition holds the sorted entrep_id of the scores
+of its year and the score columns in the same order, as float16.
+The rows of a dataframe are then looked up year by year: the entrep_id of the rows of a year
+are searched in the sorted ids of its partition with one vectorized binary search,
+so that a whole BalAG column is answered in a few binary searches per year.
+All the scores of an (entrep_id, year) are kept in the order of the dataframe they come from:
+as with pandas.merge, a row joined with several scores is repeated once per score.
+
+=== functions :
+fromDataFrame(csvScore, columns) : creates the lookup of the scores of a dataframe
+'''
+
+import numpy as np
+import pandas as pd
+
+
+# the columns of the Scores file looked up by default
+scoreColumns = ['scoreSolv','scoreZ','scoreCH','scoreAltman']
+
+
+def fromDataFrame(csvScore, columns = None):
+    '''
+    function that creates the lookup of the scores of a dataframe
+    -- IN
+    csvScore : dataframe with the columns entrep_id, year and the scores (pandas.Dataframe)
+    columns : the names of the score columns, if None scoreColumns (string[]) default: None
+    -- OUT
+    lookup : the lookup of the scores by year (ScoreLookup.ScoreLookup)
+    '''
+    if columns is None:
+        columns = scoreColumns
+    return ScoreLookup(csvScore['entrep_id'].values, csvScore['year'].values,
+                       dict([(column, csvScore[column].values) for column in columns]), columns)
+
+class ScoreLookup(object):
+    '''
+    sorted entrep_id and scores of each year
+    '''
+    def __init__(self, entrepIds, years, scores, columns):
+        '''
+        -- IN
+        entrepIds : the entrep_id of each score (int[])
+        years : the year of each score (int[])
+        scores : the values of each score column ({string:float[]})
+        columns : the order of the score columns (string[])
+        '''
+        self.columns = list(columns)
+        entrepIds = np.asarray(entrepIds, dtype=np.int64)
+        years = np.asarray(years, dtype=np.int64)
+        # the rows sorted by year then by id, the scores of the same (year, id) keep their order
+        order = np.argsort((years<<32)|entrepIds, kind='mergesort')
+        sortedYears = years[order]
+        # the ids sorted within each year and the scores in the same order
+        self._ids = entrepIds[order]
+        self._scores = dict([(column, np.asarray(scores[column]).take(order).astype(np.float16)) for column in self.columns])
+        # the number of scores of each (year, id), at the position of its first score
+        self._counts = np.zeros(len(order), dtype=np.int64)
+        if len(order)>0:
+            firsts = np.flatnonzero(np.concatenate(([True], (sortedYears[1:]!=sortedYears[:-1])|(self._ids[1:]!=self._ids[:-1]))))
+            self._counts[firsts] = np.diff(np.append(firsts, len(order)))
+        # the range of the rows of each year {year:(start, end)}
+        self._partitions = {}
+        bounds = np.flatnonzero(np.concatenate(([True], sortedYears[1:]!=sortedYears[:-1], [True]))) if len(order)>0 else np.zeros(1, dtype=np.int64)
+        for (start, end) in zip(bounds[:-1], bounds[1:]):
+            self._partitions[int(sortedYears[start])] = (start, end)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def getYears(self):
+        ''' returns the years of the partitions in increasing order (int[]) '''
+        return sorted(self._partitions.keys())
+
+    def _find(self, entrepIds, years):
+        ''' returns the position of the first score of each (entrep_id, year) and the number of its scores, 0 without score '''
+        entrepIds = np.asarray(entrepIds, dtype=np.int64)
+        years = np.asarray(years)
+        firsts = np.zeros(len(entrepIds), dtype=np.int64)
+        counts = np.zeros(len(entrepIds), dtype=np.int64)
+        # the rows of the years of the partitions, the other years have no score
+        for (year, (start, end)) in self._partitions.items():
+            rows = np.flatnonzero(years==year)
+            if len(rows)==0:
+                continue
+            ids = self._ids[start:end]
+            positions = start+np.minimum(np.searchsorted(ids, entrepIds[rows]), len(ids)-1)
+            found = self._ids[positions]==entrepIds[rows]
+            firsts[rows] = positions
+            counts[rows[found]] = self._counts[positions[found]]
+        return (firsts, counts)
+
+    def lookup(self, entrepIds, years):
+        '''
+        returns the first score of some (entrep_id, year)
+        -- IN
+        entrepIds : the ids of the entreprises (int[])
+        years : the years, aligned with the ids (int[])
+        -- OUT
+        scores : the values of each score column, NaN without score for the entreprise and the year ({string:numpy.ndarray of float16})
+        '''
+        (firsts, counts) = self._find(entrepIds, years)
+        return self._takeScores(firsts, counts==0)
+
+    def _takeScores(self, positions, missing):
+        ''' returns the scores at some positions, NaN for the missing ones '''
+        scores = dict([(column, np.full(len(positions), np.nan, dtype=np.float16)) for column in self.columns])
+        found = np.flatnonzero(~missing)
+        for column in self.columns:
+            scores[column][found] = self._scores[column][positions[found]]
+        return scores
+
+    def join(self, dataframe):
+        '''
+        left join of a dataframe with the scores on entrep_id and year,
+        as pandas.merge(dataframe, csvScore, on=['entrep_id','year'], how='left'):
+        the rows keep their order, the score columns are added with NaN for the rows without a score,
+        and a row with several scores is repeated once per score, in the order of the scores
+        -- IN
+        dataframe : dataframe with the columns entrep_id and year (pandas.Dataframe)
+        -- OUT
+        dataframe : the joined dataframe, with a new index (pandas.Dataframe)
+        '''
+        (firsts, counts) = self._find(dataframe['entrep_id'].values, dataframe['year'].values)
+        if (counts<=1).all():
+            (rows, positions, missing) = (None, firsts, counts==0)
+        else:
+            # each row is repeated once per score, the repeated rows take the next scores
+            repeats = np.maximum(counts, 1)
+            rows = np.repeat(np.arange(len(counts)), repeats)
+            ends = np.cumsum(repeats)
+            positions = np.repeat(firsts-(ends-repeats), repeats)+np.arange(len(rows))
+            missing = np.repeat(counts==0, repeats)
+        scores = self._takeScores(positions, missing)
+        values = lambda column: dataframe[column].values if rows is None else dataframe[column].values.take(rows)
+        joined = pd.DataFrame(dict([(column, values(column)) for column in dataframe.columns]), columns=list(dataframe.columns))
+        for column in self.columns:
+            joined[column] = scores[column]
+        return joined
@@ -0,0 +1,206 @@
+# -*- coding: utf-8 -*-
+'''
+Created on 18 Oct 2026
+
+@author: agent
+
+Module generating synthetic versions of the files of the remote server:
+cameliaBalAG, cameliaEtabKevin and cameliaScores.
+The generated files have the columns, the separators, the formats and the compressions
+of the real files, and a part of their rows is corrupted in the ways met
+in the real files (wrong dates, negative or zero montants, wrong ids),
+so that the whole import and cleaning pipeline can run on them.
+The generation is seeded, two calls with the same parameters give the same files.
+
+=== functions :
+generateBalAG(nbRows, nbEntreprises, errorRate, seed) : generates a BalAG dataframe
+generateEtab(entrepIds, errorRate, seed, missingRate) : generates an Etab dataframe for some entreprises
+generateScores(entrepIds, errorRate, seed) : generates a Scores dataframe for some entreprises
+writeCsv(dataframe, filename, compression, sep) : writes a dataframe in a csv file, eventually compressed
+loadFixtures(rootDirectory, nbRows, nbEntreprises, errorRate, seed) : writes the three files in a directory, as they are on the remote server
+'''
+
+import bz2
+import gzip
+import os
+
+import numpy as np
+import pandas as pd
+
+import Constants
+
+
+def generateBalAG(nbRows, nbEntreprises = None, errorRate = 0.05, seed = 0):
+    '''
+    function that generates a synthetic BalAG dataframe,
+    all the columns are strings or ints as in the raw file
+    -- IN
+    nbRows : number of bills (int)
+    nbEntreprises : number of distinct entreprises, if None nbRows/20 (int) default: None
+    errorRate : proportion of rows with a wrong value (float) default: 0.05
+    seed : seed of the random generator (int) default: 0
+    -- OUT
+    csvinput : the generated dataframe (pandas.Dataframe)
+    '''
+    rng = np.random.RandomState(seed)
+    if nbEntreprises is None:
+        nbEntreprises = max(nbRows/20, 1)
+    ids = _generateIds(nbEntreprises, rng)
+    # a few entreprises have most of the bills
+    weights = 1.0/np.arange(1, nbEntreprises+1)**0.8
+    entrepId = ids[rng.choice(nbEntreprises, size=nbRows, p=weights/weights.sum())]
+    datePiece = np.datetime64("2008-01-01")+rng.randint(0, 9*365, size=nbRows).astype("timedelta64[D]")
+    dateEcheance = datePiece+rng.choice([0,30,45,60,90], size=nbRows).astype("timedelta64[D]")
+    dateDernierPaiement = dateEcheance+rng.randint(-20, 120, size=nbRows).astype("timedelta64[D]")
+    dateInsert = datePiece+rng.randint(0, 60, size=nbRows).astype("timedelta64[D]")
+    montantPieceEur = np.exp(rng.normal(8.5, 1.5, size=nbRows)).astype(np.int64)
+    montantLitige = np.where(rng.rand(nbRows)<0.02, montantPieceEur, 0)
+    csvinput = pd.DataFrame({"entrep_id":entrepId,
+                             "datePiece":_formatDates(datePiece),
+                             "dateEcheance":_formatDates(dateEcheance),
+                             "dateDernierPaiement":_formatDates(dateDernierPaiement),
+                             "montantPieceEur":montantPieceEur,
+                             "montantLitige":montantLitige,
+                             "devise":"EUR",
+                             "dateInsert":_formatDates(dateInsert)},
+                            columns=["entrep_id","datePiece","dateEcheance","dateDernierPaiement",
+                                     "montantPieceEur","montantLitige","devise","dateInsert"])
+    # the unpaid bills
+    csvinput.loc[rng.rand(nbRows)<0.15, "dateDernierPaiement"] = "0000-00-00"
+    # the wrong values
+    _corrupt(csvinput, "datePiece", ["0000-00-00","2014-13-01","20140101",""], errorRate/4, rng)
+    _corrupt(csvinput, "dateEcheance", ["0000-00-00","2014-02-31","1900-01-01"], errorRate/4, rng)
+    _corrupt(csvinput, "montantPieceEur", [0,-100,-1], errorRate/4, rng)
+    _corrupt(csvinput, "entrep_id", [0], errorRate/4, rng)
+    return csvinput
+
+def generateEtab(entrepIds, errorRate = 0.05, seed = 0, missingRate = 0.0):
+    '''
+    function that generates a synthetic Etab dataframe,
+    with one to three establishments per entreprise
+    -- IN
+    entrepIds : the ids of the entreprises (int[])
+    errorRate : proportion of rows with a wrong date of creation (float) default: 0.05
+    seed : seed of the random generator (int) default: 0
+    missingRate : proportion of rows without capital and of rows without number of employees (float) default: 0.0
+    -- OUT
+    csvEtab : the generated dataframe (pandas.Dataframe)
+    '''
+    rng = np.random.RandomState(seed)
+    entrepIds = np.unique(entrepIds)
+    entrepId = np.repeat(entrepIds, rng.randint(1, 4, size=len(entrepIds)))
+    nbRows = len(entrepId)
+    dcren = np.datetime64("1950-01-01")+rng.randint(0, 65*365, size=nbRows).astype("timedelta64[D]")
+    csvEtab = pd.DataFrame({"entrep_id":entrepId,
+                            "capital":(np.exp(rng.normal(9, 2, size=nbRows))).astype(np.int64),
+                            "DCREN":_formatDates(dcren),
+                            "EFF_ENT":rng.geometric(0.2, size=nbRows)},
+                           columns=["entrep_id","capital","DCREN","EFF_ENT"])
+    _corrupt(csvEtab, "DCREN", ["0000-00-00","2999-01-01","01/01/2001"], errorRate, rng)
+    if missingRate>0:
+        # the empty cells of the real file
+        _corrupt(csvEtab, "capital", [np.nan], missingRate, rng)
+        _corrupt(csvEtab, "EFF_ENT", [np.nan], missingRate, rng)
+    return csvEtab
+
+def generateScores(entrepIds, errorRate = 0.05, seed = 0):
+    '''
+    function that generates a synthetic Scores dataframe,
+    with one balance sheet per entreprise and year between 2008 and 2016
+    for a random part of the years
+    -- IN
+    entrepIds : the ids of the entreprises (int[])
+    errorRate : proportion of rows with a wrong date (float) default: 0.05
+    seed : seed of the random generator (int) default: 0
+    -- OUT
+    csvScore : the generated dataframe (pandas.Dataframe)
+    '''
+    rng = np.random.RandomState(seed)
+    entrepIds = np.unique(entrepIds)
+    years = np.arange(2008, 2017)
+    present = rng.rand(len(entrepIds), len(years))<0.7
+    entrepId = np.repeat(entrepIds, present.sum(axis=1))
+    year = np.tile(years, len(entrepIds))[present.ravel()]
+    nbRows = len(entrepId)
+    dateBilan = (year-1970).astype("datetime64[Y]").astype("datetime64[D]") \
+        +rng.randint(0, 365, size=nbRows).astype("timedelta64[D]")
+    csvScore = pd.DataFrame({"entrep_id":entrepId,
+                             "dateBilan":_formatDates(dateBilan),
+                             "sourceModif":rng.choice(["bilans1","bilans2","manuel"], size=nbRows, p=[0.8,0.15,0.05]),
+                             "scoreSolv":np.round(rng.uniform(0, 20, size=nbRows), 2),
+                             "scoreZ":np.round(rng.normal(0, 3, size=nbRows), 2),
+                             "scoreCH":np.round(rng.uniform(0, 20, size=nbRows), 2),
+                             "scoreAltman":np.round(rng.normal(2, 1.5, size=nbRows), 2)},
+                            columns=["entrep_id","dateBilan","sourceModif","scoreSolv","scoreZ","scoreCH","scoreAltman"])
+    _corrupt(csvScore, "dateBilan", ["0000-00-00","2012-00-00"], errorRate, rng)
+    return csvScore
+
+def writeCsv(dataframe, filename, compression = None, sep = "\t"):
+    '''
+    function that writes a dataframe in a csv file without its index, eventually compressed
+    -- IN
+    dataframe : the dataframe to write (pandas.Dataframe)
+    filename : the path of the file (string)
+    compression : string that specifies the encoding of the file (string in [None,"gz","bz2"] default: None
+    sep : separator of the csv file (string) default: '\t'
+    -- OUT
+    returns nothing
+    '''
+    if compression=="gz":
+        fichier = gzip.open(filename, "wb", Constants.ftpCompressionLevel)
+    elif compression=="bz2":
+        fichier = bz2.BZ2File(filename, "wb", compresslevel=Constants.ftpCompressionLevel)
+    else:
+        fichier = open(filename, "wb")
+    with fichier:
+        # the compressed files are much faster to write by large blocks
+        for position in range(0, max(len(dataframe), 1), Constants.ftpUploadChunkSize):
+            fichier.write(dataframe.iloc[position:position+Constants.ftpUploadChunkSize]
+                          .to_csv(None, sep=sep, index=False, header=(position==0)))
+
+def loadFixtures(rootDirectory, nbRows = 100000, nbEntreprises = None, errorRate = 0.05, seed = 0):
+    '''
+    function that writes the synthetic BalAG, Etab and Scores files in a directory,
+    with the names, separators and compressions of the remote server
+    (see the file specifications in CameliaBalAGPreprocess)
+    -- IN
+    rootDirectory : the directory served by the stand-in server (string)
+    nbRows : number of bills of the BalAG file (int) default: 100000
+    nbEntreprises : number of distinct entreprises, if None nbRows/20 (int) default: None
+    errorRate : proportion of rows with a wrong value (float) default: 0.05
+    seed : seed of the random generator (int) default: 0
+    -- OUT
+    filenames : the remote names of the written files (string[])
+    '''
+    csvinput = generateBalAG(nbRows, nbEntreprises, errorRate, seed)
+    entrepIds = csvinput["entrep_id"].unique()
+    # the wrong ids have no establishment nor score
+    entrepIds = entrepIds[entrepIds>0]
+    fixtures = [("cameliaBalAG.csv.gz", csvinput, "gz", "\t"),
+                ("ProcessedData/cameliaEtabKevin.csv.gz", generateEtab(entrepIds, errorRate, seed, errorRate), "gz", ";"),
+                ("cameliaScores.csv.bz2", generateScores(entrepIds, errorRate, seed), "bz2", "\t")]
+    for (filename, dataframe, compression, sep) in fixtures:
+        path = os.path.join(rootDirectory, filename)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        writeCsv(dataframe, path, compression, sep)
+    return [filename for (filename, _, _, _) in fixtures]
+
+def _generateIds(nbEntreprises, rng):
+    ''' returns nbEntreprises distinct ids in a random order '''
+    ids = np.unique(rng.randint(1, 10**8, size=int(nbEntreprises*1.1)+10))
+    rng.shuffle(ids)
+    return ids[:nbEntreprises]
+
+def _formatDates(dates):
+    ''' converts an array of datetime64[D] into 'YYYY-MM-DD' strings '''
+    return np.datetime_as_string(dates, unit="D")
+
+def _corrupt(dataframe, column, wrongValues, rate, rng):
+    ''' replaces a proportion rate of the values of a column by wrong values '''
+    wrong = np.flatnonzero(rng.rand(len(dataframe))<rate)
+    if len(wrong)==0:
+        return
+    if dataframe[column].dtype!=object and any(isinstance(v, str) for v in wrongValues):
+        dataframe[column] = dataframe[column].astype(object)
+    dataframe.iloc[wrong, dataframe.columns.get_loc(column)] = rng.choice(np.array(wrongValues, dtype=object), size=len(wrong))
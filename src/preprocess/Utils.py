@@ -13,6 +13,15 @@ validateDateError(txtDate) : checks if there are errors in the date format
 nbMonthsBetweenDates(d0, d1) : computes the number of months between two dates
 validateMontant(montant) : checks if there are errors in the montant value
 checkIntFormat(i, isNonNegative, isNonZero) : checks several behaviour of the input
+validateDateArray(txtDates0, txtDates1, txtDates2) : error codes of the dates of whole columns
+validateDateErrorArray(txtDates) : converts a whole column of dates, NaT for the errors
+nbMonthsBetweenDatesArray(d0, d1) : computes the number of months between the dates of two columns
+validateMontantArray(montants) : error codes of the montants of a whole column
+checkIntFormatArray(values, isNonNegative, isNonZero) : checks several behaviour of a whole column
+getErrorNames(code, errorBits) : converts an error code into the names of its errors
+parseIsoDates(txtDates, withTime) : converts a whole column of dates in format %Y-%m-%d, NaT for the errors
+parseIsoDatesCached(txtDates) : same as parseIsoDates, parsing only the distinct values not parsed yet
+clearDateCache() : empties the cache of the dates parsed by parseIsoDatesCached
 printTime(startTime) : print the time in HH:MM:SS format since startTime
 drawArray(openfile, array, arrayName) : write in an openfile the values of an array
 
@@ -24,6 +33,30 @@ import time
 from sys import getsizeof
 import os
 
+import numpy as np
+import pandas as pd
+
+# bits of the error codes returned by validateDateArray, one per result of validateDate
+dateErrorBits = [("pieceFormat", 1),
+                 ("echeanceFormat", 2),
+                 ("dernierPaiementFormat", 4),
+                 ("inconsistentDates", 8),
+                 ("monthDiff", 16),
+                 ("minimalDate", 32),
+                 ("maximalDate", 64)]
+# bits of the error codes returned by validateMontantArray, one per result of validateMontant
+montantErrorBits = [("format", 1),
+                    ("minimal", 2),
+                    ("maximal", 4)]
+# number of days of the months of a common year and of a leap year
+_monthDays = np.array([[31,28,31,30,31,30,31,31,30,31,30,31],
+                       [31,29,31,30,31,30,31,31,30,31,30,31]], dtype=np.int64)
+# years of the dates accepted by parseIsoDates, the range of the pandas timestamps
+_isoMinimalYear = 1678
+_isoMaximalYear = 2261
+# dates already parsed by parseIsoDatesCached, shared by all the files of the process {string:datetime64[D]}
+_dateCache = {}
+
 def validateDate(txtDate0, txtDate1, txtDate2):
     '''
     function that validates a row and its three dates Piece, Echeance and DernierPaiement
@@ -51,7 +84,6 @@ def validateDate(txtDate0, txtDate1, txtDate2):
     if date1 == None:
         result.append("echeanceFormat")
     date2 = validateDateError(txtDate2)
-    print "boolean DateDernierPaiementFormat :",Constants.bclnDateDernierPaiementFormat
     if date2 == None and Constants.bclnDateDernierPaiementFormat :
         result.append("dernierPaiementFormat")
     if date0 == None or date1 == None:
@@ -161,14 +193,236 @@ def checkIntFormat(i, isNonNegative=False, isNonZero=False):
         j = int(i)
     except:
         b = False
-    print b
     if isNonNegative:
         b = (b and j>=0)
-    print "isNonNegative:",isNonNegative, b
     if isNonZero:
         b = (b and j!=0)
-    print "isNonZero:",isNonZero,b
     return b
+
+def validateDateArray(txtDates0, txtDates1, txtDates2):
+    '''
+    function that validates the rows of three columns of dates Piece, Echeance and DernierPaiement
+    according to the booleans in Constants, with the same results as validateDate for each row
+    -- IN
+    txtDates0 : dates 0 (pandas.Series or numpy.ndarray of strings)
+    txtDates1 : dates 1 (pandas.Series or numpy.ndarray of strings)
+    txtDates2 : dates 2 (pandas.Series or numpy.ndarray of strings)
+    -- OUT
+    codes : the error codes of the rows, each error of validateDate sets one bit, see dateErrorBits (numpy.ndarray of uint8)
+    '''
+    bits = dict(dateErrorBits)
+    date0 = validateDateErrorArray(txtDates0)
+    date1 = validateDateErrorArray(txtDates1)
+    date2 = validateDateErrorArray(txtDates2)
+    (valid0, valid1, valid2) = (~np.isnat(date0), ~np.isnat(date1), ~np.isnat(date2))
+    codes = np.zeros(len(date0), dtype=np.uint8)
+    # checking dates format
+    codes[~valid0] |= bits["pieceFormat"]
+    codes[~valid1] |= bits["echeanceFormat"]
+    if Constants.bclnDateDernierPaiementFormat:
+        codes[~valid2] |= bits["dernierPaiementFormat"]
+    # the other checks need the dates 0 and 1
+    checked = valid0 & valid1
+    # checking consistency
+    if Constants.bclnDateInconsistent:
+        codes[checked & ((date0>date1) | (valid2 & (date0>date2)))] |= bits["inconsistentDates"]
+    # checking month difference between dates
+    if Constants.bclnDateMonthDiff:
+        monthDiff = Constants.clnDateMonthDiff
+        test = (nbMonthsBetweenDatesArray(date0, date1)>monthDiff) \
+            | (valid2 & (nbMonthsBetweenDatesArray(date0, date2)>monthDiff))
+        codes[checked & test] |= bits["monthDiff"]
+    # checking minimal date
+    if Constants.bclnDateMinimalDate:
+        codes[checked & (date0<np.datetime64(Constants.clnDateMinimalDate, 'D'))] |= bits["minimalDate"]
+    # checking maximal date
+    if Constants.bclnDateMaximalDate:
+        codes[checked & (date0>np.datetime64(Constants.clnDateMaximalDate, 'D'))] |= bits["maximalDate"]
+    return codes
+
+def validateDateErrorArray(txtDates):
+    '''
+    function that converts a column of dates, the values that are not valid dates
+    for validateDateError are converted into NaT.
+    Each distinct value is only checked once.
+    -- IN
+    txtDates : strings containing dates in format %Y-%m-%d (pandas.Series or numpy.ndarray)
+    -- OUT
+    dates : the converted dates (numpy.ndarray of datetime64[D])
+    '''
+    (codes, uniques) = pd.factorize(np.asarray(txtDates, dtype=object))
+    dates = parseIsoDates(uniques)
+    # the values rejected by the fixed format are checked again with validateDateError,
+    # which also accepts the dates without leading zeros or out of the range of parseIsoDates
+    for i in np.flatnonzero(np.isnat(dates)):
+        d = validateDateError(uniques[i])
+        if d is not None:
+            dates[i] = np.datetime64(d, 'D')
+    # adding the missing values at the end, at the position -1
+    dates = np.append(dates, np.datetime64('NaT')).astype('datetime64[D]')
+    return dates[codes]
+
+def nbMonthsBetweenDatesArray(d0, d1):
+    '''
+    function that returns the number of months between the dates of two columns,
+    with the same results as nbMonthsBetweenDates for each row
+    -- IN
+    d0 : dates of start (numpy.ndarray of datetime64)
+    d1 : dates of end (numpy.ndarray of datetime64)
+    -- OUT
+    number of month between the dates, -1 if one of them is missing (numpy.ndarray of int)
+    '''
+    days = (np.asarray(d0, dtype='datetime64[D]')-np.asarray(d1, dtype='datetime64[D]')).astype(np.int64)
+    months = (np.abs(days)/30.45).astype(np.int64)
+    months[np.isnat(np.asarray(d0, dtype='datetime64[D]')) | np.isnat(np.asarray(d1, dtype='datetime64[D]'))] = -1
+    return months
+
+def validateMontantArray(montants):
+    '''
+    function that validates a column of montantPiece values
+    according to the booleans in Constants, with the same results as validateMontant for each row
+    -- IN
+    montants : values of the montants to analyse (pandas.Series or numpy.ndarray)
+    -- OUT
+    codes : the error codes of the rows, the error of validateMontant sets one bit, see montantErrorBits (numpy.ndarray of uint8)
+    '''
+    bits = dict(montantErrorBits)
+    codes = np.zeros(len(montants), dtype=np.uint8)
+    (valid, values) = _toNumbers(montants)
+    if Constants.bclnMontantIntFormat:
+        formatOk = checkIntFormatArray(montants, Constants.bclnMontantNonNegativeValue, Constants.bclnMontantNonZeroValue)
+        codes[~formatOk] = bits["format"]
+    # as validateMontant, only the first error is returned
+    if Constants.bclnMontMinimalValue:
+        codes[(codes==0) & valid & (values<Constants.clnMontMinimalValue)] = bits["minimal"]
+    if Constants.bclnMontMaximalValue:
+        codes[(codes==0) & valid & (values>Constants.clnMontMaximalValue)] = bits["maximal"]
+    return codes
+
+def checkIntFormatArray(values, isNonNegative=False, isNonZero=False):
+    '''
+    function that checks the format of a column of numbers according to the booleans in input,
+    with the same results as checkIntFormat for each row
+    -- IN
+    values : the numbers to check (pandas.Series or numpy.ndarray)
+    isNonNegative : boolean that settles the checking of i>=0 (boolean)
+    isNonZero : boolean that settles the checking of i!=0 (boolean)
+    -- OUT
+    b : the results of the checks, True if everything is ok (numpy.ndarray of bool)
+    '''
+    values = np.asarray(values)
+    if values.dtype.kind in "biuf":
+        b = np.isfinite(values) if values.dtype.kind=="f" else np.ones(len(values), dtype=np.bool_)
+        j = np.trunc(np.where(b, values, 0))
+        if isNonNegative:
+            b &= j>=0
+        if isNonZero:
+            b &= j!=0
+        return b
+    # other types: each distinct value is only checked once
+    (codes, uniques) = pd.factorize(values.astype(object))
+    checks = np.array([checkIntFormat(i, isNonNegative, isNonZero) for i in uniques]
+                      +[checkIntFormat(None, isNonNegative, isNonZero)], dtype=np.bool_)
+    return checks[codes]
+
+def getErrorNames(code, errorBits):
+    '''
+    function that converts an error code of the array validators into the names of its errors
+    -- IN
+    code : the error code (int)
+    errorBits : the bits of the errors, dateErrorBits or montantErrorBits ([(string, int)])
+    -- OUT
+    names : the names of the errors in the code (string[])
+    '''
+    return [name for (name, bit) in errorBits if code & bit]
+
+def parseIsoDates(txtDates, withTime=False):
+    '''
+    function that converts a column of dates in the fixed format %Y-%m-%d, reading the digits
+    at their positions for all the rows at once. The values that are not valid dates,
+    such as "0000-00-00", the missing values and the dates out of the range of the pandas
+    timestamps (years 1678 to 2261) are converted into NaT, so that the result can be
+    put in a dataframe as with pd.to_datetime(errors='coerce')
+    -- IN
+    txtDates : strings containing dates in format %Y-%m-%d (pandas.Series or numpy.ndarray)
+    withTime : boolean that settles if the dates may be followed by a time, which is ignored (boolean) default: False
+    -- OUT
+    dates : the converted dates (numpy.ndarray of datetime64[D])
+    '''
+    txtDates = np.asarray(txtDates)
+    if txtDates.dtype.kind=="M":
+        return txtDates.astype('datetime64[D]')
+    # one more character than the format, so that the longer values are rejected
+    width = 10 if withTime else 11
+    try:
+        chars = txtDates.astype('S%d' % width)
+    except UnicodeError:
+        chars = np.array([(t.encode('utf-8') if isinstance(t, unicode) else str(t))[:width]
+                          for t in txtDates.ravel()], dtype='S%d' % width)
+    chars = chars.reshape(-1).view(np.uint8).reshape(-1, width)
+    digits = chars[:,[0,1,2,3,5,6,8,9]]-np.uint8(ord('0'))
+    # the characters under '0' give big values as unsigned integers
+    valid = (digits<=9).all(axis=1)
+    valid &= (chars[:,4]==ord('-')) & (chars[:,7]==ord('-'))
+    if not withTime:
+        valid &= chars[:,10]==0
+    digits = digits.astype(np.int32)
+    year = digits[:,0]*1000+digits[:,1]*100+digits[:,2]*10+digits[:,3]
+    month = digits[:,4]*10+digits[:,5]
+    day = digits[:,6]*10+digits[:,7]
+    valid &= (year>=_isoMinimalYear) & (year<=_isoMaximalYear) & (month>=1) & (month<=12) & (day>=1)
+    leap = ((year%4==0) & (year%100!=0)) | (year%400==0)
+    valid &= day<=_monthDays[leap.astype(np.int64), np.clip(month-1, 0, 11)]
+    # number of days since 1970-01-01, counting the years from March so that the leap day is the last one
+    year = year-(month<=2)
+    dayOfYear = (153*np.where(month>2, month-3, month+9)+2)//5+day-1
+    days = year*365+year//4-year//100+year//400+dayOfYear-719468
+    dates = days.astype('datetime64[D]')
+    dates[~valid] = np.datetime64('NaT')
+    return dates
+
+def parseIsoDatesCached(txtDates):
+    '''
+    function that converts a column of dates as parseIsoDates, but only parses its distinct values
+    and maps them back on the rows. The parsed values are kept for the next calls of the process,
+    so that the files sharing the same dates only parse them once.
+    The cost depends on the number of distinct dates rather than on the number of rows
+    -- IN
+    txtDates : strings containing dates in format %Y-%m-%d (pandas.Series or numpy.ndarray)
+    -- OUT
+    dates : the converted dates (numpy.ndarray of datetime64[D])
+    '''
+    txtDates = np.asarray(txtDates)
+    if txtDates.dtype.kind=="M":
+        return txtDates.astype('datetime64[D]')
+    (codes, uniques) = pd.factorize(txtDates.astype(object))
+    if len(uniques)>Constants.dateCacheMaxSize:
+        # the distinct dates don't fit in the cache, they are parsed without it
+        parsed = list(parseIsoDates(np.array(uniques, dtype=object)))
+    else:
+        missing = [txtDate for txtDate in uniques if not txtDate in _dateCache]
+        if len(missing)>0:
+            if len(_dateCache)+len(missing)>Constants.dateCacheMaxSize:
+                # all the distinct dates of the call are parsed again after the cache is emptied
+                _dateCache.clear()
+                missing = list(uniques)
+            _dateCache.update(zip(missing, parseIsoDates(np.array(missing, dtype=object))))
+        parsed = [_dateCache[txtDate] for txtDate in uniques]
+    # adding the missing values at the end, at the position -1
+    dates = np.array(parsed+[np.datetime64('NaT')], dtype='datetime64[D]')
+    return dates[codes]
+
+def clearDateCache():
+    '''
+    function that empties the cache of the dates parsed by parseIsoDatesCached
+    '''
+    _dateCache.clear()
+
+def _toNumbers(values):
+    ''' returns the mask of the values that are numbers and the values as floats, NaN for the others '''
+    numbers = pd.to_numeric(pd.Series(np.asarray(values)), errors='coerce').values.astype(np.float64)
+    valid = ~np.isnan(numbers)
+    return (valid, np.where(valid, numbers, 0))
         
 def printTime(startTime):
     totalTime = (time.time()-startTime)
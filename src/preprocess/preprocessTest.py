@@ -8,14 +8,20 @@ Created on 19 avr. 2016
 import datetime
 from ftplib import FTP_TLS
 import os
+import pickle
+import shutil
+import tempfile
 import unittest
 
+import numpy as np
 import pandas as pd
 import plotly.plotly as py
 
 import Constants
 from FTPTools import getAccount, retrieveFtplib
 from preprocess import FTPTools, DrawingTools, Utils
+from preprocess import FTPStandIn, LazyFrame, SyntheticData
+from preprocess import CameliaBalAGPreprocess, CleaningAudit, CleaningRules, ColumnStore, EntrepriseIndex, FeatureStore, Schema, ScoreLookup
 from preprocess.CameliaBalAGPreprocess import cleaningEntrepId, cleaningDates, \
     cleaningMontant, cleaningOther, analyzingDates, analyzingEntrepId, \
     analyzingMontant, analyzingOthers, analyzingComplete
@@ -75,6 +81,362 @@ class TestFTPTools(unittest.TestCase):
         self.assertTrue('entrep_id' in db.columns)
         self.assertTrue('cotationEnBourse' in db.columns)
 
+    def testCsvFileStreaming(self):
+        ''' tests if the streaming download gives the same dataframe as the buffered one'''
+        db = FTPTools.retrieveFtplib("cameliaLiensEntites.csv.bz2",compression="bz2")
+        dbStream = FTPTools.retrieveFtplib("cameliaLiensEntites.csv.bz2",compression="bz2",stream=True,chunksize=1000)
+        self.assertTrue(dbStream is not None)
+        self.assertEqual(len(db),len(dbStream))
+        self.assertEqual(list(db.columns),list(dbStream.columns))
+        # the iterator must give chunks of at most chunksize rows
+        chunks = FTPTools.streamFtplib("cameliaLiensEntites.csv.bz2",compression="bz2",chunksize=1000)
+        self.assertTrue(len(next(chunks))<=1000)
+        chunks.close()
+
+    def testCachedDownload(self):
+        ''' tests if a cached file gives the same dataframe as a downloaded one'''
+        FTPTools.clearFtpCache()
+        db = FTPTools.retrieveFtplib("cameliaLiensEntites.csv.bz2",compression="bz2",useCache=True)
+        self.assertTrue(os.path.isdir(Constants.ftpCacheDirectory))
+        self.assertEqual(len(os.listdir(Constants.ftpCacheDirectory)),1)
+        dbCached = FTPTools.retrieveFtplib("cameliaLiensEntites.csv.bz2",compression="bz2",useCache=True)
+        self.assertTrue(db.equals(dbCached))
+        FTPTools.clearFtpCache()
+
+    def testMultipleDownload(self):
+        ''' tests if the concurrent download gives the same dataframes as the sequential one'''
+        specs = [("cameliaLiensEntites.csv.bz2","bz2",None,None,"\t"),
+                 ("cameliaAnnonces.csv.gz","gz",None,None,"\t"),
+                 ("nonExistingFile.csv",None,None,None,"\t")]
+        dbs = FTPTools.retrieveMultipleFtplib(specs)
+        self.assertEqual(len(dbs),3)
+        self.assertTrue(dbs["nonExistingFile.csv"] is None)
+        db = FTPTools.retrieveFtplib("cameliaLiensEntites.csv.bz2",compression="bz2")
+        self.assertTrue(db.equals(dbs["cameliaLiensEntites.csv.bz2"]))
+
+class TestFTPStandIn(unittest.TestCase):
+    '''
+    tests for the FTPTools module against a local stand-in server
+    serving synthetic files, they don't need the remote server
+    '''
+
+    def setUp(self):
+        self.rootDirectory = tempfile.mkdtemp()
+        SyntheticData.loadFixtures(self.rootDirectory, nbRows=10000)
+        self.server = FTPStandIn.startStandIn(self.rootDirectory)
+        FTPStandIn.useStandIn(self.server)
+        self.retryDelay = FTPTools.Constants.ftpRetryDelay
+        FTPTools.Constants.ftpRetryDelay = 0
+
+    def tearDown(self):
+        FTPTools.Constants.ftpRetryDelay = self.retryDelay
+        FTPStandIn.stopStandIn(self.server)
+        FTPTools.setAccount()
+        shutil.rmtree(self.rootDirectory)
+
+    def testRetrieveFixtures(self):
+        ''' tests if the synthetic files are downloadable with their specifications'''
+        specs = [CameliaBalAGPreprocess.balAGFileSpec,
+                 CameliaBalAGPreprocess.etabFileSpec,
+                 CameliaBalAGPreprocess.scoreFileSpec]
+        dbs = FTPTools.retrieveMultipleFtplib(specs)
+        for spec in specs:
+            self.assertTrue(dbs[spec[0]] is not None)
+        self.assertEqual(len(dbs[CameliaBalAGPreprocess.balAGFileSpec[0]]),10000)
+
+    def testInterruptedTransfers(self):
+        ''' tests if the interrupted transfers are resumed'''
+        db = FTPTools.retrieveFtplib("cameliaBalAG.csv.gz",compression="gz",useCache=False)
+        FTPStandIn.dropTransfers(self.server, nbDrops=2, dropAfter=10000)
+        dbResumed = FTPTools.retrieveFtplib("cameliaBalAG.csv.gz",compression="gz",useCache=False)
+        self.assertTrue(db.equals(dbResumed))
+        FTPStandIn.dropTransfers(self.server, nbDrops=2, dropAfter=10000)
+        dbStream = FTPTools.retrieveFtplib("cameliaBalAG.csv.gz",compression="gz",useCache=False,stream=True)
+        self.assertTrue(db.equals(dbStream))
+
+    def testParsedTypes(self):
+        ''' tests if the columns are parsed with the types of the schemas, downloaded or streamed'''
+        (filename, compression, usecols, dtype, sep) = CameliaBalAGPreprocess.scoreFileSpec
+        for stream in [False, True]:
+            db = FTPTools.retrieveFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,
+                                         useCache=False,stream=stream,chunksize=1000)
+            self.assertEqual(str(db['entrep_id'].dtype),"uint32")
+            self.assertEqual(str(db['scoreSolv'].dtype),"float16")
+            self.assertEqual(db['dateBilan'].dtype,object)
+        (filename, compression, usecols, dtype, sep) = CameliaBalAGPreprocess.balAGFileSpec
+        chunk = next(FTPTools.streamFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,chunksize=1000))
+        self.assertEqual(str(chunk['montantPieceEur'].dtype),"int32")
+        self.assertEqual(str(chunk['devise'].dtype),"category")
+
+    def testStoreAndRetrieve(self):
+        ''' tests if an uploaded dataframe is downloaded unchanged'''
+        db = SyntheticData.generateBalAG(5000)
+        for compression in [None,"gz","bz2"]:
+            filename = "upload.csv"+("" if compression is None else "."+compression)
+            self.assertTrue(FTPTools.storeFtplib(db,filename,compression=compression,chunksize=1000))
+            dbUploaded = FTPTools.retrieveFtplib(filename,compression=compression,useCache=False,dtype=str)
+            self.assertEqual(len(dbUploaded),len(db))
+            self.assertEqual(list(dbUploaded.columns[1:]),list(db.columns))
+
+    def testChunkedCleaning(self):
+        ''' tests if the cleaning by chunks gives the same rows as the cleaning of the whole file'''
+        rules = CleaningRules.fromConstants()
+        rules.enable('bclnIdMinimalBillsNumber', True)
+        rules.setParameter('clnIdMinimalBillsNumber', 3)
+        chunkDirectory = CameliaBalAGPreprocess.Constants.chunkDirectory
+        CameliaBalAGPreprocess.Constants.chunkDirectory = os.path.join(self.rootDirectory, "chunks")
+        try:
+            cleaned = CameliaBalAGPreprocess.importAndCleanCsv(ftp=True, rules=rules, chunksize=3000)
+        finally:
+            CameliaBalAGPreprocess.Constants.chunkDirectory = chunkDirectory
+        expected = CameliaBalAGPreprocess.importAndCleanCsv(ftp=True, rules=rules)
+        self.assertEqual(list(cleaned.index),list(expected.index))
+        self.assertTrue((cleaned['datePiece'].values==expected['datePiece'].values).all())
+
+    def testSavedCleaning(self):
+        ''' tests if the saved cleaned dataframe is exported in csv, as a snapshot and with its audit'''
+        constants = CameliaBalAGPreprocess.Constants
+        saved = (constants.cleanedCsvFilename, constants.snapshotDirectory, constants.auditDirectory)
+        constants.cleanedCsvFilename = os.path.join(self.rootDirectory, "saved", "cameliaBalAGKevin.csv")
+        constants.snapshotDirectory = os.path.join(self.rootDirectory, "saved", "snapshot")
+        constants.auditDirectory = os.path.join(self.rootDirectory, "saved", "audit")
+        os.makedirs(os.path.join(self.rootDirectory, "saved"))
+        try:
+            cleaned = CameliaBalAGPreprocess.importAndCleanCsv(ftp=True, toSave=True)
+            exported = pd.read_csv(constants.cleanedCsvFilename, sep="\t", index_col=0)
+            self.assertTrue(ColumnStore.isStore(constants.snapshotDirectory))
+            self.assertTrue(os.path.isdir(constants.auditDirectory))
+        finally:
+            (constants.cleanedCsvFilename, constants.snapshotDirectory, constants.auditDirectory) = saved
+        self.assertEqual(list(exported.index),list(cleaned.index))
+        self.assertEqual(list(exported.columns),list(cleaned.columns))
+        self.assertTrue((exported['montantPieceEur'].values==cleaned['montantPieceEur'].values).all())
+
+    def testMissingEtabValues(self):
+        ''' tests if the rows of the Etab file with an empty capital or number of employees are removed'''
+        raw = pd.read_csv(os.path.join(self.rootDirectory, CameliaBalAGPreprocess.etabFileSpec[0]), sep=";", compression="gzip")
+        self.assertTrue(raw['capital'].isnull().any())
+        self.assertTrue(raw['EFF_ENT'].isnull().any())
+        csvinput = FTPTools.retrieveFtplib("cameliaBalAG.csv.gz",compression="gz",useCache=False)
+        useCache = FTPTools.Constants.bftpCache
+        FTPTools.Constants.bftpCache = False
+        try:
+            csvEtab = CameliaBalAGPreprocess.getAndPreprocessCsvEtab(csvinput)
+        finally:
+            FTPTools.Constants.bftpCache = useCache
+        self.assertTrue(csvEtab is not None)
+        for column in ['entrep_id','capital','EFF_ENT']:
+            self.assertEqual(csvEtab[column].dtype,np.uint32)
+        expected = Schema.applySchema(raw.dropna().copy(), Schema.etabSchema).dropna()
+        expected = expected[expected['entrep_id'].isin(csvinput['entrep_id'])]
+        self.assertEqual(sorted(csvEtab['entrep_id']),sorted(expected['entrep_id'].unique()))
+
+    def testFilteredDownload(self):
+        ''' tests if the rows filtered by chunks while the Scores are read are the rows filtered from the whole file'''
+        csvinput = FTPTools.retrieveFtplib("cameliaBalAG.csv.gz",compression="gz",useCache=False).iloc[::7]
+        (filename, compression, usecols, dtype, sep) = CameliaBalAGPreprocess.scoreFileSpec
+        csvScore = FTPTools.retrieveFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,useCache=False)
+        expected = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput, csvScore)
+        streamChunkSize = FTPTools.Constants.ftpStreamChunkSize
+        FTPTools.Constants.ftpStreamChunkSize = 1000
+        try:
+            filtered = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput)
+            predicates = [lambda chunk: (chunk['scoreZ']>=0).values]
+            positive = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput, predicates=predicates)
+        finally:
+            FTPTools.Constants.ftpStreamChunkSize = streamChunkSize
+        self.assertTrue(filtered.equals(expected))
+        self.assertTrue(set(filtered['entrep_id']).issubset(set(csvinput['entrep_id'])))
+        self.assertTrue((filtered['year']>=2010).all())
+        self.assertTrue(positive.equals(expected[expected['scoreZ']>=0]))
+
+    def testPrefetchedFiles(self):
+        ''' tests if the Scores and Etab files filtered while they are downloaded with the BalAG file
+        have fewer rows and give the same rows to their loaders'''
+        csvinput = FTPTools.retrieveFtplib("cameliaBalAG.csv.gz",compression="gz",useCache=False)
+        index = EntrepriseIndex.fromDataFrame(csvinput)
+        specs = [CameliaBalAGPreprocess.scoreFileSpec, CameliaBalAGPreprocess.etabFileSpec]
+        (scoreFilename, etabFilename) = (CameliaBalAGPreprocess.scoreFileSpec[0], CameliaBalAGPreprocess.etabFileSpec[0])
+        useCache = FTPTools.Constants.bftpCache
+        FTPTools.Constants.bftpCache = False
+        try:
+            raw = FTPTools.retrieveMultipleFtplib(specs)
+            prefetched = FTPTools.retrieveMultipleFtplib(specs, chunkFilters=CameliaBalAGPreprocess.getPrefetchChunkFilters())
+        finally:
+            FTPTools.Constants.bftpCache = useCache
+        self.assertTrue(0<len(prefetched[scoreFilename])<len(raw[scoreFilename]))
+        self.assertTrue(0<len(prefetched[etabFilename])<len(raw[etabFilename]))
+        expected = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput, raw[scoreFilename], index=index)
+        csvScore = CameliaBalAGPreprocess.getAndPreprocessCsvScore(csvinput, prefetched[scoreFilename], index=index, filtered=True)
+        self.assertTrue(csvScore.equals(expected))
+        expected = CameliaBalAGPreprocess.getAndPreprocessCsvEtab(csvinput, raw[etabFilename], index=index)
+        csvEtab = CameliaBalAGPreprocess.getAndPreprocessCsvEtab(csvinput, prefetched[etabFilename], index=index)
+        self.assertTrue(csvEtab.equals(expected))
+
+    def testFilteredCachedDownload(self):
+        ''' tests if a filtered file is cached whole and if the next filtered download is served from the cache'''
+        cacheDirectory = FTPTools.Constants.ftpCacheDirectory
+        FTPTools.Constants.ftpCacheDirectory = os.path.join(self.rootDirectory, "cache")
+        (filename, compression, usecols, dtype, sep) = CameliaBalAGPreprocess.scoreFileSpec
+        chunkFilter = CameliaBalAGPreprocess.getScoreChunkFilter(predicates=CameliaBalAGPreprocess.scoreFilters,
+                                                                 rawPredicates=CameliaBalAGPreprocess.scoreRawFilters)
+        # the number of rows of the dataframes written in the cache
+        (saveColumns, appendColumns) = (ColumnStore.saveColumns, ColumnStore.appendColumns)
+        storedLengths = []
+        def countedSaveColumns(dataframe, directory):
+            storedLengths.append(len(dataframe))
+            return saveColumns(dataframe, directory)
+        def countedAppendColumns(dataframe, directory):
+            storedLengths.append(len(dataframe))
+            return appendColumns(dataframe, directory)
+        try:
+            (ColumnStore.saveColumns, ColumnStore.appendColumns) = (countedSaveColumns, countedAppendColumns)
+            try:
+                filtered = FTPTools.retrieveFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,
+                                                   useCache=True,chunksize=1000,chunkFilter=chunkFilter)
+            finally:
+                (ColumnStore.saveColumns, ColumnStore.appendColumns) = (saveColumns, appendColumns)
+            # the file is cached chunk by chunk, it is never in memory at once
+            self.assertTrue(len(storedLengths)>1)
+            self.assertTrue(max(storedLengths)<=1000)
+            self.assertEqual(len(os.listdir(FTPTools.Constants.ftpCacheDirectory)),1)
+            # the transfers fail, the file can only come from the cache
+            FTPStandIn.dropTransfers(self.server, nbDrops=100)
+            filteredCached = FTPTools.retrieveFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,
+                                                     useCache=True,chunksize=1000,chunkFilter=chunkFilter)
+            whole = FTPTools.retrieveFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,useCache=True)
+        finally:
+            FTPStandIn.dropTransfers(self.server, nbDrops=0)
+            FTPTools.Constants.ftpCacheDirectory = cacheDirectory
+        self.assertTrue(filteredCached is not None)
+        self.assertTrue(filtered.equals(filteredCached))
+        self.assertTrue(whole is not None)
+        self.assertTrue(len(whole)>len(filtered))
+        downloaded = FTPTools.retrieveFtplib(filename,compression=compression,usecols=usecols,dtype=dtype,sep=sep,useCache=False)
+        self.assertTrue(whole.equals(downloaded))
+
+    def testConnectionPool(self):
+        ''' tests if a released connection is reused and a broken one is not'''
+        FTPTools.closeFtpPool()
+        ftp = FTPTools.getFtpConnection()
+        self.assertTrue(ftp is not None)
+        FTPTools.releaseFtpConnection(ftp)
+        ftpReused = FTPTools.getFtpConnection()
+        self.assertTrue(ftpReused is ftp)
+        FTPTools.releaseFtpConnection(ftpReused, broken=True)
+        ftpNew = FTPTools.getFtpConnection()
+        self.assertTrue(ftpNew is not ftp)
+        FTPTools.releaseFtpConnection(ftpNew)
+        FTPTools.closeFtpPool()
+
+    def testResumedDownload(self):
+        ''' tests if a download resumed from a partial file gives the whole file,
+        and if the partial file of another version of the remote file is not resumed'''
+        filename = "cameliaBalAG.csv.gz"
+        with open(os.path.join(self.rootDirectory, filename),"rb") as fichier:
+            data = fichier.read()
+        localFilename = os.path.join(tempfile.mkdtemp(), filename)
+        try:
+            with FTPTools.ftpSession() as ftp:
+                identity = FTPTools.getRemoteIdentity(ftp, filename)
+            # simulating a transfer interrupted in the middle of the file,
+            # the received bytes are marked to check that they are not downloaded again
+            with open(localFilename+".part","wb") as fichier:
+                fichier.write("x"*(len(data)/2))
+            with open(localFilename+".part.id","w") as fichier:
+                fichier.write(repr(identity))
+            self.assertEqual(FTPTools.downloadFtplib(filename, localFilename),localFilename)
+            with open(localFilename,"rb") as fichier:
+                self.assertEqual(fichier.read(),"x"*(len(data)/2)+data[len(data)/2:])
+            os.remove(localFilename)
+            # a partial file of another version is downloaded again
+            with open(localFilename+".part","wb") as fichier:
+                fichier.write("x"*(len(data)/2))
+            with open(localFilename+".part.id","w") as fichier:
+                fichier.write(repr((identity[0], "19700101000000")))
+            self.assertEqual(FTPTools.downloadFtplib(filename, localFilename),localFilename)
+            with open(localFilename,"rb") as fichier:
+                self.assertEqual(fichier.read(),data)
+        finally:
+            shutil.rmtree(os.path.dirname(localFilename))
+
+    def testCacheEntrySession(self):
+        ''' tests if the remote file of a cache entry is identified without opening a new connection'''
+        connectFtplib = FTPTools.connectFtplib
+        connections = []
+        def countedConnectFtplib(*args, **kwargs):
+            connections.append(1)
+            return connectFtplib(*args, **kwargs)
+        FTPTools.connectFtplib = countedConnectFtplib
+        try:
+            with FTPTools.ftpSession() as ftp:
+                entry = FTPTools._getCacheEntry("cameliaBalAG.csv.gz", "gz", None, None, '\t', ftp)
+            self.assertEqual(len(connections),1)
+            # the connection given back to the pool is reused
+            self.assertEqual(FTPTools._getCacheEntry("cameliaBalAG.csv.gz", "gz", None, None, '\t'),entry)
+            self.assertEqual(len(connections),1)
+        finally:
+            FTPTools.connectFtplib = connectFtplib
+        self.assertTrue(entry is not None)
+        self.assertTrue(FTPTools._getCacheEntry("missing.csv.gz", "gz", None, None, '\t') is None)
+
+class TestColumnStore(unittest.TestCase):
+    '''
+    tests for the ColumnStore module
+    '''
+    def setUp(self):
+        self.directory = os.path.join(tempfile.mkdtemp(), "store")
+        self.dataframe = pd.DataFrame({'entrep_id':np.arange(1000, dtype=np.uint32),
+                                       'montant':np.arange(1000, dtype=np.int32)*3,
+                                       'score':np.linspace(0, 1, 1000).astype(np.float16),
+                                       'devise':pd.Categorical(['EUR','USD']*500),
+                                       'dateInsert':['2016-01-01']*1000}, columns=['entrep_id','montant','score','devise','dateInsert'])
+        self.assertTrue(ColumnStore.saveColumns(self.dataframe, self.directory))
+
+    def tearDown(self):
+        shutil.rmtree(os.path.dirname(self.directory))
+
+    def testMappedColumns(self):
+        ''' tests if the memory-mapped dataframe is the stored one, its numeric columns being mapped without copy '''
+        mapped = ColumnStore.loadColumns(self.directory, mmap=True)
+        self.assertTrue(mapped.equals(self.dataframe))
+        self.assertTrue(ColumnStore.loadColumns(self.directory).equals(self.dataframe))
+        self.assertTrue(isinstance(mapped['montant'].values.base, np.memmap))
+        # the pages are copied on write, the store is not modified
+        mapped.loc[0, 'montant'] = -1
+        self.assertEqual(ColumnStore.loadColumns(self.directory)['montant'].values[0], 0)
+
+    def testMappedColumnsFallback(self):
+        ''' tests if the dataframe is still read when the internals of pandas are not available '''
+        makeBlock = ColumnStore.make_block
+        ColumnStore.make_block = None
+        try:
+            mapped = ColumnStore.loadColumns(self.directory, mmap=True)
+        finally:
+            ColumnStore.make_block = makeBlock
+        self.assertTrue(mapped.equals(self.dataframe))
+
+    def testAppendedColumns(self):
+        ''' tests if the appended rows are read back, the object columns being appended in parts'''
+        appended = self.dataframe.copy()
+        appended.index += len(self.dataframe)
+        appended['devise'] = pd.Categorical(['EUR','GBP']*500)
+        appended['dateInsert'] = ['2017-01-01']*1000
+        for start in [0, 500]:
+            self.assertTrue(ColumnStore.appendColumns(appended.iloc[start:start+500], self.directory))
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "col_4_part2.npy")))
+        expected = pd.concat([self.dataframe, appended])
+        expected['devise'] = expected['devise'].astype('category')
+        for mmap in [False, True]:
+            stored = ColumnStore.loadColumns(self.directory, mmap=mmap)
+            self.assertEqual(list(stored.index),list(expected.index))
+            self.assertTrue((stored['dateInsert'].values==expected['dateInsert'].values).all())
+            self.assertTrue((stored['devise'].astype(str).values==expected['devise'].astype(str).values).all())
+            self.assertTrue((stored['montant'].values==expected['montant'].values).all())
+        # the object column is rewritten in a single file when the store is saved again
+        self.assertTrue(ColumnStore.saveColumns(stored, self.directory))
+        self.assertFalse(os.path.isfile(os.path.join(self.directory, "col_4_part1.npy")))
+
 class TestDrawingTools(unittest.TestCase):
     '''
     tests for the DrawingTools module
@@ -329,7 +691,272 @@ class TestUtils(unittest.TestCase):
         self.assertTrue(Utils.validateMontant(montant)=="" or not Constants.bclnMontMaximalValue)
         montant = Constants.clnMontMaximalValue + 5 
         self.assertTrue(Utils.validateMontant(montant)=="maximal" or not Constants.bclnMontMaximalValue)
-    
+
+    def testValidateDateArray(self):
+        ''' tests if the validateDateArray function gives the results of validateDate '''
+        dates = [None, "example", "0000-00-00", "2012-01-01", "2012-02-01", "2011-03-01",
+                 "2048-04-01", "1009-01-01", "3009-01-01", "2013-01-01"]
+        rows = [(d0, d1, d2) for d0 in dates for d1 in dates for d2 in dates]
+        codes = Utils.validateDateArray(pd.Series([d0 for (d0, _, _) in rows]),
+                                        pd.Series([d1 for (_, d1, _) in rows]),
+                                        pd.Series([d2 for (_, _, d2) in rows]))
+        for (row, code) in zip(rows, codes):
+            self.assertEqual(sorted(Utils.getErrorNames(code, Utils.dateErrorBits)),sorted(Utils.validateDate(*row)))
+
+    def testValidateMontantArray(self):
+        ''' tests if the validateMontantArray function gives the results of validateMontant '''
+        montants = [None, -1, 0, 5, 2.5, Constants.clnMontMinimalValue+5, Constants.clnMontMinimalValue-5,
+                    Constants.clnMontMaximalValue-5, Constants.clnMontMaximalValue+5]
+        codes = Utils.validateMontantArray(pd.Series(montants))
+        for (montant, code) in zip(montants, codes):
+            self.assertEqual("".join(Utils.getErrorNames(code, Utils.montantErrorBits)),Utils.validateMontant(montant))
+        self.assertEqual(list(Utils.checkIntFormatArray(pd.Series(montants), True, True)),
+                         [Utils.checkIntFormat(montant, True, True) for montant in montants])
+
+    def testParseIsoDates(self):
+        ''' tests if the parseIsoDates function converts the valid dates and gives NaT for the others '''
+        dates = [None, np.nan, "example", "0000-00-00", "2012-01-01", "2012-02-29", "2011-02-29",
+                 "2011-13-01", "2011-04-31", "2011-4-01", "2011-04-011", "1600-01-01", "2011-12-31"]
+        expected = [None, None, None, None, "2012-01-01", "2012-02-29", None,
+                    None, None, None, None, None, "2011-12-31"]
+        expected = np.array([np.datetime64(d) if d is not None else np.datetime64('NaT') for d in expected], dtype='datetime64[D]')
+        np.testing.assert_array_equal(Utils.parseIsoDates(pd.Series(dates)), expected)
+        self.assertEqual(Utils.parseIsoDates(np.array(["2010-01-13 12:30:00"]), withTime=True)[0], np.datetime64(Constants.anaOtherStandardDate))
+        self.assertTrue(np.isnat(Utils.parseIsoDates(np.array(["2010-01-13 12:30:00"]))[0]))
+
+    def testParseIsoDatesCached(self):
+        ''' tests if the parseIsoDatesCached function gives the results of parseIsoDates and keeps the distinct dates '''
+        Utils.clearDateCache()
+        dates = pd.Series(["2012-01-01", None, "0000-00-00", "2012-01-01", "2011-02-29", "2013-05-06"]*3)
+        np.testing.assert_array_equal(Utils.parseIsoDatesCached(dates), Utils.parseIsoDates(dates))
+        self.assertEqual(len(Utils._dateCache),4)
+        np.testing.assert_array_equal(Utils.parseIsoDatesCached(dates[::-1]), Utils.parseIsoDates(dates[::-1]))
+        Utils.clearDateCache()
+        self.assertEqual(len(Utils._dateCache),0)
+
+    def testParseIsoDatesCacheOverflow(self):
+        ''' tests if the parseIsoDatesCached function still gives the results of parseIsoDates when its cache is emptied '''
+        Utils.clearDateCache()
+        dateCacheMaxSize = Utils.Constants.dateCacheMaxSize
+        Utils.Constants.dateCacheMaxSize = 3
+        try:
+            Utils.parseIsoDatesCached(np.array(["2012-01-01", "2012-01-02"], dtype=object))
+            # a partial hit whose missing dates overflow the cache
+            dates = np.array(["2012-01-01", "2012-01-03", "2012-01-04"], dtype=object)
+            np.testing.assert_array_equal(Utils.parseIsoDatesCached(dates), Utils.parseIsoDates(dates))
+            self.assertEqual(len(Utils._dateCache),3)
+            # more distinct dates than the cache can hold
+            dates = np.array(["2012-01-0"+str(day) for day in range(1, 10)], dtype=object)
+            np.testing.assert_array_equal(Utils.parseIsoDatesCached(dates), Utils.parseIsoDates(dates))
+            self.assertTrue(len(Utils._dateCache)<=3)
+        finally:
+            Utils.Constants.dateCacheMaxSize = dateCacheMaxSize
+            Utils.clearDateCache()
+
+class TestSchema(unittest.TestCase):
+    '''
+    tests for the Schema module
+    '''
+    def testApplySchema(self):
+        ''' tests if the synthetic files are converted into the types of their schemas and use less memory '''
+        csvinput = SyntheticData.generateBalAG(2000)
+        csvScore = SyntheticData.generateScores(csvinput['entrep_id'].unique())
+        for (dataframe, schema) in [(csvinput, Schema.balAGSchema), (csvScore, Schema.scoreSchema)]:
+            report = Schema.memoryReport(dataframe, schema)
+            self.assertTrue(report.loc["total","after"]<report.loc["total","before"])
+            converted = Schema.applySchema(dataframe.copy(), schema)
+            for (column, columnType) in schema.items():
+                if columnType=="date":
+                    self.assertEqual(converted[column].dtype, np.dtype("datetime64[ns]"))
+                elif columnType=="category":
+                    self.assertEqual(converted[column].dtype.name, "category")
+                elif columnType!="str":
+                    self.assertEqual(converted[column].dtype, np.dtype(columnType))
+        # the dates are parsed as by parseIsoDates
+        np.testing.assert_array_equal(converted['dateBilan'].values.astype('datetime64[D]'),
+                                      Utils.parseIsoDates(csvScore['dateBilan']))
+
+class TestCleaningAudit(unittest.TestCase):
+    '''
+    tests for the CleaningAudit module
+    '''
+    def testRowBitmap(self):
+        ''' tests if the ids are read back from the three kinds of containers and combined as sets '''
+        ids = np.concatenate([np.arange(0, 70000, 7), np.arange(70000, 140000), np.arange(140000, 200000, 2), [2**33]])
+        bitmap = CleaningAudit.fromIds(ids[::-1])
+        self.assertEqual(sorted(set(bitmap.kinds)),[0, 1, 2])
+        np.testing.assert_array_equal(bitmap.toIds(),ids)
+        self.assertEqual(len(bitmap),len(ids))
+        self.assertTrue(bitmap.getSize()<ids.nbytes/4)
+        self.assertEqual(list(bitmap.contains([0, 1, 69999, 100000, 140001, 2**33])),[True, False, False, True, False, True])
+        other = CleaningAudit.fromIds(np.arange(0, 200000, 3))
+        np.testing.assert_array_equal(bitmap.union(other).toIds(),np.union1d(ids, np.arange(0, 200000, 3)))
+        np.testing.assert_array_equal(bitmap.intersection(other).toIds(),np.intersect1d(ids, np.arange(0, 200000, 3)))
+        np.testing.assert_array_equal(bitmap.difference(other).toIds(),np.setdiff1d(ids, np.arange(0, 200000, 3)))
+        self.assertEqual(len(CleaningAudit.fromIds([])),0)
+        self.assertTrue(CleaningAudit.fromIds([-1]) is None)
+
+    def testCleaningAudit(self):
+        ''' tests if the audit of the cleaning gives the rule that rejected each removed row '''
+        csvinput = CameliaBalAGPreprocess.addPaidBillColumn(SyntheticData.generateBalAG(5000, errorRate=0.2))
+        csvinput = Schema.applySchema(csvinput, Schema.balAGSchema)
+        rules = CleaningRules.fromConstants()
+        rules.enable('bclnIdMinimalBillsNumber', True)
+        rules.setParameter('clnIdMinimalBillsNumber', 2)
+        audit = {}
+        cleaned = CameliaBalAGPreprocess.cleaningBalAG(csvinput, rules=rules, audit=audit)
+        explained = CleaningAudit.explainRows(audit, csvinput.index)
+        np.testing.assert_array_equal(explained=="",csvinput.index.isin(cleaned.index))
+        self.assertTrue((explained[csvinput['montantPieceEur'].values<Constants.clnMontMinimalValue]!="").all())
+        # the processes record the same rows, the rule of a row depends on the order of the rules
+        auditByPartitions = {}
+        CameliaBalAGPreprocess.cleaningBalAG(csvinput, rules=rules, nbProcesses=3, audit=auditByPartitions)
+        self.assertEqual(sorted(auditByPartitions.keys()),sorted(audit.keys()))
+        np.testing.assert_array_equal(CleaningAudit.explainRows(auditByPartitions, csvinput.index)=="",explained=="")
+        directory = tempfile.mkdtemp()
+        CleaningAudit.saveAudit(audit, directory, "first")
+        CleaningAudit.saveAudit({}, directory, "second")
+        self.assertEqual(CleaningAudit.getRuns(directory),["first","second"])
+        self.assertEqual(CleaningAudit.loadAudit(directory),{})
+        loaded = CleaningAudit.loadAudit(directory, "first")
+        np.testing.assert_array_equal(CleaningAudit.explainRows(loaded, csvinput.index),explained)
+        shutil.rmtree(directory)
+
+class TestEntrepriseIndex(unittest.TestCase):
+    '''
+    tests for the EntrepriseIndex module
+    '''
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        self.csvinput = pd.DataFrame({'entrep_id':rng.randint(1, 2000, 20000).astype(np.uint32),
+                                      'year':rng.randint(2009, 2017, 20000)}, columns=['entrep_id','year'])
+        self.csvEtab = pd.DataFrame({'entrep_id':rng.permutation(3000)[:1500].astype(np.uint32),
+                                     'capital':rng.randint(0, 10**6, 1500).astype(np.uint32)}, columns=['entrep_id','capital'])
+        self.csvScore = pd.DataFrame({'entrep_id':np.repeat(np.arange(2500), 3).astype(np.uint32),
+                                      'year':np.tile([2010, 2012, 2014], 2500),
+                                      'scoreZ':rng.rand(7500).astype(np.float16)}, columns=['entrep_id','year','scoreZ'])
+        self.csvScore = self.csvScore.take(rng.permutation(7500))
+        self.index = EntrepriseIndex.fromDataFrame(self.csvinput)
+
+    def testMembership(self):
+        ''' tests if the ids of another file are found in the index as with isin '''
+        expected = self.csvEtab['entrep_id'].isin(self.csvinput['entrep_id']).values
+        np.testing.assert_array_equal(self.index.contains(self.csvEtab['entrep_id'].values),expected)
+        # without the table of booleans
+        EntrepriseIndex.denseMembershipRatio = 0
+        try:
+            np.testing.assert_array_equal(EntrepriseIndex.fromDataFrame(self.csvinput).contains(self.csvEtab['entrep_id'].values),expected)
+        finally:
+            EntrepriseIndex.denseMembershipRatio = 64
+
+    def testJoin(self):
+        ''' tests if the join on entrep_id gives the same rows as pandas.merge '''
+        expected = pd.merge(self.csvinput, self.csvEtab, on='entrep_id', how='left')
+        # with and without the tables indexed by the ids
+        for ratio in [64, 0]:
+            EntrepriseIndex.denseMembershipRatio = ratio
+            try:
+                index = EntrepriseIndex.fromDataFrame(self.csvinput)
+                index.addFrame('etab', self.csvEtab)
+                index.addFrame('score', self.csvScore)
+            finally:
+                EntrepriseIndex.denseMembershipRatio = 64
+            joined = index.join(self.csvinput, self.csvEtab, 'etab')
+            self.assertTrue(joined.equals(expected))
+            # the rows of some entreprises
+            rows = index.getRows('score', [12, 5, 10**6])
+            self.assertEqual(list(self.csvScore['entrep_id'].values[rows]),[12]*3+[5]*3)
+
+class TestFeatureStore(unittest.TestCase):
+    '''
+    tests for the FeatureStore module
+    '''
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        datesPiece = pd.to_datetime('2005-01-01')+pd.to_timedelta(rng.randint(0, 4000, 5000), unit='D')
+        datesPaiement = pd.Series(datesPiece+pd.to_timedelta(rng.randint(0, 90, 5000), unit='D'))
+        datesPaiement[rng.rand(5000)<0.3] = pd.NaT
+        self.csvinput = pd.DataFrame({'entrep_id':rng.randint(1, 800, 5000).astype(np.uint32),
+                                      'datePiece':datesPiece,
+                                      'dateDernierPaiement':datesPaiement.values,
+                                      'montantPieceEur':rng.randint(1, 10**5, 5000).astype(np.int32)})
+        self.csvEtab = pd.DataFrame({'entrep_id':rng.randint(500, 1200, 2000).astype(np.uint32),
+                                     'capital':rng.randint(0, 10**6, 2000).astype(np.uint32),
+                                     'DCREN':pd.to_datetime('1990-01-01')+pd.to_timedelta(rng.randint(0, 9000, 2000), unit='D'),
+                                     'EFF_ENT':rng.randint(0, 50, 2000).astype(np.uint32)})
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def testComputeFeatures(self):
+        ''' tests if the features are the aggregations of groupby '''
+        features = FeatureStore.computeFeatures(self.csvinput, "balAG")
+        groups = self.csvinput.groupby('entrep_id')
+        np.testing.assert_array_equal(features['entrep_id'].values,groups.size().index.values)
+        np.testing.assert_array_equal(features['nbBills'].values,groups.size().values)
+        np.testing.assert_array_equal(features['nbPaid'].values,groups['dateDernierPaiement'].count().values)
+        np.testing.assert_array_equal(features['firstBill'].values,groups['datePiece'].min().values)
+        np.testing.assert_array_equal(features['lastBill'].values,groups['datePiece'].max().values)
+        delays = (self.csvinput['dateDernierPaiement']-self.csvinput['datePiece']).dt.days.fillna(0)
+        np.testing.assert_array_equal(features['sumDelay'].values,delays.groupby(self.csvinput['entrep_id']).sum().values)
+        (mean, std) = FeatureStore.getMeanMontant(features)
+        np.testing.assert_allclose(mean,groups['montantPieceEur'].mean().values)
+        np.testing.assert_allclose(std,groups['montantPieceEur'].std(ddof=0).values,atol=1e-6)
+        years = FeatureStore.computeFeatures(pd.DataFrame({'entrep_id':[1,1,1,2],'year':[2010,2012,2012,2011]}), "score")
+        self.assertEqual(list(years['nbScores']),[3,1])
+        self.assertEqual(list(FeatureStore.countYears(years['scoreYears'].values,[2009,2012],[2011,2012])),[1,0])
+
+    def testRefreshFeatures(self):
+        ''' tests if an incremental refresh gives the features of a complete one, and the queries of the store '''
+        expected = FeatureStore.computeFeatures(self.csvinput, "balAG")
+        self.assertTrue(FeatureStore.refreshFeatures(self.csvinput.iloc[:3000], "balAG", self.directory, "v1"))
+        self.assertTrue(FeatureStore.refreshFeatures(self.csvinput.iloc[3000:], "balAG", self.directory, "v2", incremental=True))
+        self.assertTrue(FeatureStore.loadFeatures(self.directory).equals(expected))
+        # the features of another source are added, the ones of the BalAG are kept
+        self.assertTrue(FeatureStore.refreshFeatures(self.csvEtab, "etab", self.directory, "v1"))
+        self.assertEqual(FeatureStore.getSourceVersions(self.directory),{"balAG":"v2","etab":"v1"})
+        features = FeatureStore.loadFeatures(self.directory, columns=['nbBills','capitalMax'], idRange=(700, 900))
+        self.assertEqual(list(features.columns),['entrep_id','nbBills','capitalMax'])
+        entrepIds = np.union1d(self.csvinput['entrep_id'], self.csvEtab['entrep_id'])
+        np.testing.assert_array_equal(features['entrep_id'].values,entrepIds[(entrepIds>=700)&(entrepIds<900)])
+        capitals = self.csvEtab.groupby('entrep_id')['capital'].max()
+        features = FeatureStore.loadFeatures(self.directory, entrepIds=[5, 600, 10**6])
+        self.assertEqual(list(features['entrep_id']),[5,600])
+        self.assertEqual(list(features['capitalMax']),[0,capitals[600]])
+        self.assertTrue(np.isnat(features['dcrenMin'].values[0]))
+
+class TestScoreLookup(unittest.TestCase):
+    '''
+    tests for the ScoreLookup module
+    '''
+    def testJoin(self):
+        ''' tests if the lookup of the scores gives the rows of pandas.merge '''
+        rng = np.random.RandomState(0)
+        csvinput = pd.DataFrame({'entrep_id':rng.randint(1, 3000, 20000).astype(np.uint32),
+                                 'year':rng.randint(2008, 2017, 20000),
+                                 'logMontant':rng.rand(20000)}, columns=['entrep_id','year','logMontant'])
+        csvScore = pd.DataFrame({'entrep_id':rng.randint(1, 4000, 10000).astype(np.uint32),
+                                 'year':rng.randint(2010, 2016, 10000)}, columns=['entrep_id','year'])
+        for column in ScoreLookup.scoreColumns:
+            csvScore[column] = (20*rng.rand(10000)).astype(np.float16)
+        # the rows with several scores for their (entrep_id, year) are repeated
+        lookup = ScoreLookup.fromDataFrame(csvScore)
+        self.assertEqual(len(lookup),len(csvScore))
+        self.assertEqual(lookup.getYears(),range(2010, 2016))
+        expected = pd.merge(csvinput, csvScore, on=['entrep_id','year'], how='left')
+        self.assertTrue(len(expected)>len(csvinput))
+        self.assertTrue(lookup.join(csvinput).equals(expected))
+        # the lookup gives the first score of each (entrep_id, year)
+        firstScores = csvScore.drop_duplicates(['entrep_id','year'])
+        scores = lookup.lookup(firstScores['entrep_id'].values, firstScores['year'].values)
+        np.testing.assert_array_equal(scores['scoreZ'], firstScores['scoreZ'].values)
+        # without duplicates the rows are not repeated
+        expected = pd.merge(csvinput, firstScores, on=['entrep_id','year'], how='left')
+        self.assertTrue(ScoreLookup.fromDataFrame(firstScores).join(csvinput).equals(expected))
+        scores = ScoreLookup.fromDataFrame(csvScore.iloc[:0]).lookup([1, 2], [2010, 2011])
+        self.assertTrue(np.isnan(scores['scoreZ']).all())
+
 class TestPaiementDataExtraction(unittest.TestCase):
     '''
     tests for the PaiementDataExtraction module
@@ -380,8 +1007,166 @@ class TestPaiementDataExtraction(unittest.TestCase):
         analyzingMontant(db)
         analyzingOthers(db)
 
+    def testSnapshot(self):
+        ''' tests if the snapshot of a cleaned dataframe is read back with its values and its types '''
+        csvinput = CameliaBalAGPreprocess.addPaidBillColumn(SyntheticData.generateBalAG(2000, errorRate=0))
+        csvinput['datePiece'] = pd.to_datetime(csvinput['datePiece'])
+        directory = tempfile.mkdtemp()
+        self.assertTrue(CameliaBalAGPreprocess.saveSnapshot(csvinput, os.path.join(directory,"snapshot")))
+        snapshot = CameliaBalAGPreprocess.loadSnapshot(os.path.join(directory,"snapshot"))
+        self.assertEqual(list(snapshot.columns),list(csvinput.columns))
+        self.assertEqual(str(snapshot['entrep_id'].dtype),"uint32")
+        self.assertEqual(str(snapshot['montantPieceEur'].dtype),"int32")
+        self.assertEqual(str(snapshot['dateEcheance'].dtype),"datetime64[ns]")
+        self.assertTrue((snapshot['datePiece']==csvinput['datePiece']).all())
+        self.assertTrue((snapshot['montantPieceEur']==csvinput['montantPieceEur']).all())
+        shutil.rmtree(directory)
+
+    def testLazyFrame(self):
+        ''' tests if a lazy dataframe only reads the columns that are accessed '''
+        csvinput = SyntheticData.generateBalAG(2000, errorRate=0)
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory,"cameliaBalAG.csv")
+        SyntheticData.writeCsv(csvinput, filename)
+        frame = CameliaBalAGPreprocess.addPaidBillColumn(LazyFrame.fromCsv(filename, dtype=Constants.dtype))
+        self.assertEqual(list(frame.columns),list(csvinput.columns)+['paidBill'])
+        self.assertEqual(frame.loadedColumns,[])
+        self.assertTrue((frame['montantPieceEur']==csvinput['montantPieceEur']).all())
+        self.assertEqual(frame.loadedColumns,['montantPieceEur'])
+        self.assertEqual(frame['paidBill'].sum(),(csvinput['dateDernierPaiement']!="0000-00-00").sum())
+        self.assertEqual(sorted(frame.loadedColumns),['dateDernierPaiement','montantPieceEur','paidBill'])
+        self.assertEqual(len(frame),2000)
+        shutil.rmtree(directory)
+
+    def testFusedCleaning(self):
+        ''' tests if the single pass cleaning rejects the rows rejected column by column,
+        and if the cleaning column by column removes them from the dataframe itself'''
+        valid = ('2012-01-01','2012-02-01','2012-03-01')
+        rows = [(5, valid, 2000.0),                                     # 0 : kept
+                (0, valid, 2000.0),                                     # 1 : non positive entrep_id
+                (5, (None,'2012-02-01','2012-03-01'), 2000.0),          # 2 : missing datePiece
+                (5, ('2012-01-01',None,'2012-03-01'), 2000.0),          # 3 : missing dateEcheance
+                (5, ('2012-01-01','2012-02-01',None), 2000.0),          # 4 : kept, dateDernierPaiement may be missing
+                (5, ('2012-01-01','2011-12-01','2012-03-01'), 2000.0),  # 5 : dateEcheance before datePiece
+                (5, ('2009-06-01','2009-07-01','2009-08-01'), 2000.0),  # 6 : datePiece before the minimal date
+                (5, valid, 0.0),                                        # 7 : zero montant
+                (5, valid, -5.0),                                       # 8 : negative montant
+                (5, valid, 500.0),                                      # 9 : montant below the minimal value
+                (5, valid, 600000.0),                                   # 10 : montant above the maximal value
+                (5, valid, np.nan),                                     # 11 : missing montant
+                (0, (None,'2012-02-01','2012-03-01'), 0.0)]             # 12 : rejected by the three groups
+        csvinput = pd.DataFrame({'entrep_id':[row[0] for row in rows],
+                                 'datePiece':pd.to_datetime([row[1][0] for row in rows]),
+                                 'dateEcheance':pd.to_datetime([row[1][1] for row in rows]),
+                                 'dateDernierPaiement':pd.to_datetime([row[1][2] for row in rows]),
+                                 'montantPieceEur':[row[2] for row in rows]})
+        cleaned = CameliaBalAGPreprocess.cleaningBalAG(csvinput)
+        self.assertEqual(list(cleaned.index),[0,4])
+        self.assertEqual(len(csvinput),len(rows))
+        self.assertEqual(cleaned['entrep_id'].dtype,csvinput['entrep_id'].dtype)
+        # each function removes the rows rejected by its column from the dataframe itself
+        self.assertTrue(cleaningDates(csvinput) is csvinput)
+        self.assertEqual(list(csvinput.index),[0,1,4,7,8,9,10,11])
+        self.assertTrue(cleaningMontant(csvinput) is csvinput)
+        self.assertEqual(list(csvinput.index),[0,1,4])
+        self.assertTrue(cleaningEntrepId(csvinput) is csvinput)
+        self.assertEqual(list(csvinput.index),[0,4])
+
+    def testCleaningRules(self):
+        ''' tests if several cleaning configurations can be applied to the same dataframe'''
+        csvinput = CameliaBalAGPreprocess.addPaidBillColumn(SyntheticData.generateBalAG(5000, errorRate=0.2))
+        for column in ['datePiece','dateEcheance','dateDernierPaiement']:
+            csvinput[column] = pd.to_datetime(csvinput[column], format='%Y-%m-%d', errors='coerce')
+        rules = CleaningRules.fromConstants()
+        cleaned = CameliaBalAGPreprocess.cleaningBalAG(csvinput, rules=rules)
+        self.assertEqual(len(csvinput),5000)
+        # the rules rejecting the most rows are evaluated first
+        rates = [rules.rejectionRates[rule.name] for rule in rules.getRules()]
+        self.assertEqual(rates,sorted(rates,reverse=True))
+        rules.setParameter('clnMontMinimalValue', 10)
+        self.assertTrue(len(CameliaBalAGPreprocess.cleaningBalAG(csvinput, rules=rules))>len(cleaned))
+        rules.enable('bclnDateMinimalDate', False)
+        cleanedWithOldDates = CameliaBalAGPreprocess.cleaningBalAG(csvinput, rules=rules)
+        self.assertTrue((cleanedWithOldDates['datePiece']<Constants.clnDateMinimalDate).any())
+        self.assertTrue(cleanedWithOldDates['montantPieceEur'].min()>=10)
+
+    def testPickledRules(self):
+        ''' tests if a registry sent to another process cleans the rows as the original one'''
+        csvinput = CameliaBalAGPreprocess.addPaidBillColumn(SyntheticData.generateBalAG(5000, errorRate=0.2))
+        csvinput = Schema.applySchema(csvinput, Schema.balAGSchema)
+        rules = CleaningRules.fromConstants()
+        rules.setParameter('clnMontMinimalValue', 10)
+        rules.enable('bclnDateMinimalDate', False)
+        rules.addRule(CleaningRules.Rule("bclnEuro", "montant", "other devise", ["devise"], _isNotEuro, False))
+        pickled = pickle.loads(pickle.dumps(rules, pickle.HIGHEST_PROTOCOL))
+        self.assertEqual(pickled.getSignature(),rules.getSignature())
+        self.assertFalse(pickled.isEnabled('bclnDateMinimalDate'))
+        (kept, _) = rules.select(csvinput)
+        (pickledKept, _) = pickled.select(csvinput)
+        self.assertTrue(0<len(kept)<len(csvinput))
+        self.assertEqual(list(pickledKept),list(kept))
+
+    def testIncrementalCleaning(self):
+        ''' tests if the incremental cleaning gives the same rows as the cleaning of the whole dataframe'''
+        csvinput = SyntheticData.generateBalAG(5000, errorRate=0.2)
+        watermark = sorted(csvinput['dateInsert'])[4000]
+        directory = tempfile.mkdtemp()
+        rules = CleaningRules.fromConstants()
+        rules.enable('bclnIdMinimalBillsNumber', True)
+        rules.setParameter('clnIdMinimalBillsNumber', 2)
+        CameliaBalAGPreprocess.updateAndCleanCsv(csvinput=csvinput[csvinput['dateInsert']<=watermark], directory=directory, rules=rules)
+        cleaned = CameliaBalAGPreprocess.updateAndCleanCsv(csvinput=csvinput, directory=directory, rules=rules)
+        expected = CameliaBalAGPreprocess.addPaidBillColumn(csvinput.copy())
+        for column in ['datePiece','dateEcheance','dateDernierPaiement']:
+            expected[column] = Utils.parseIsoDates(expected[column])
+        expected = CameliaBalAGPreprocess.cleaningBalAG(expected, rules=rules)
+        self.assertEqual(sorted(cleaned.index),sorted(expected.index))
+        # without new rows nothing is cleaned again
+        self.assertEqual(len(CameliaBalAGPreprocess.updateAndCleanCsv(csvinput=csvinput, directory=directory, rules=rules)),len(cleaned))
+        shutil.rmtree(directory)
+
+    def testEtabAggregation(self):
+        ''' tests if the establishments are merged into one row per entreprise of the BalAG file by both methods'''
+        csvinput = pd.DataFrame({'entrep_id':np.arange(1, 301, dtype=np.uint32)})
+        raw = SyntheticData.generateEtab(np.arange(1, 401))
+        raw = raw.take(np.random.RandomState(0).permutation(len(raw)))
+        expected = Schema.applySchema(raw.copy(), Schema.etabSchema).dropna()
+        expected = expected[expected['entrep_id']<=300]
+        firstRows = expected.drop_duplicates('entrep_id').index
+        expected = expected.groupby('entrep_id').agg({'DCREN':'min','capital':'max','EFF_ENT':'max'})
+        for sortBased in [False, True]:
+            csvEtab = CameliaBalAGPreprocess.getAndPreprocessCsvEtab(csvinput, raw.copy(), sortBased=sortBased)
+            self.assertFalse(csvEtab['entrep_id'].duplicated().any())
+            self.assertEqual(csvEtab['capital'].dtype,np.uint32)
+            # one row per entreprise, in the order of their first establishment
+            self.assertEqual(list(csvEtab.index),list(firstRows))
+            csvEtab = csvEtab.set_index('entrep_id').sort_index()
+            self.assertTrue(csvEtab[['DCREN','capital','EFF_ENT']].equals(expected[['DCREN','capital','EFF_ENT']]))
+
+    def testParallelCleaning(self):
+        ''' tests if the cleaning by several processes gives the same rows as the cleaning by one process'''
+        csvinput = SyntheticData.generateBalAG(5000, errorRate=0.2)
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "balAG.csv")
+        csvinput.to_csv(filename, sep="\t", index=False)
+        rules = CleaningRules.fromConstants()
+        rules.enable('bclnIdMinimalBillsNumber', True)
+        rules.setParameter('clnIdMinimalBillsNumber', 2)
+        expected = CameliaBalAGPreprocess.importAndCleanCsvFile(filename, rules=rules, nbProcesses=1)
+        cleanedFile = CameliaBalAGPreprocess.importAndCleanCsvFile(filename, rules=rules, nbProcesses=3)
+        cleanedFrame = CameliaBalAGPreprocess.cleaningBalAG(Schema.applySchema(CameliaBalAGPreprocess.addPaidBillColumn(csvinput), Schema.balAGSchema), rules=rules, nbProcesses=3)
+        self.assertTrue(0<len(expected)<len(csvinput))
+        self.assertEqual(list(cleanedFile.index),list(expected.index))
+        self.assertEqual(list(cleanedFrame.index),list(expected.index))
+        self.assertTrue((cleanedFile['datePiece'].values==expected['datePiece'].values).all())
+        shutil.rmtree(directory)
+
         
         
+def _isNotEuro(values, parameters):
+    ''' predicate of a cleaning rule defined in a module, see testPickledRules '''
+    return values['devise']!="EUR"
+
 if __name__ == "__main__":
     #import sys;sys.argv = ['', 'Test.testName']
     unittest.main()
\ No newline at end of file